@@ -0,0 +1,125 @@
+"""
+Микробенчмарк выбора обработчика текстового сообщения:
+TextRouter + одно состояние диалога против прежней цепочки
+проверок подстрок и нескольких словарей состояния.
+
+Запуск из корня проекта: python benchmarks/bench_dispatch.py [memory|sqlite]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_store import create_store  # noqa: E402
+from text_router import TextRouter  # noqa: E402
+
+MESSAGES = [
+    "🌿 Каталог", "🛒 Корзина", "🧩 Подбор масла", "❌ Выйти", "🔙 Назад",
+    "Сухая", "🌙 Плохо сплю",
+    "г. Владикавказ, ул. Каталога, д. 5, кв. 12",
+    "пр. Коста, 12, напротив магазина Корзинка",
+]
+# Пользователь в каждом из состояний
+USERS = {"idle": 1, "quiz": 2, "address": 3, "photo_ids": 4}
+
+
+def build_store(backend, path):
+    store = create_store(backend, path, max_entries=10000)
+    legacy = (
+        store.namespace("admin_photo"),
+        store.namespace("quiz"),
+        store.namespace("pending_address"),
+    )
+    admin_waiting_photo, user_quiz, pending_address = legacy
+    admin_waiting_photo[USERS["photo_ids"]] = ["file"]
+    user_quiz[USERS["quiz"]] = {"step": 2, "answers": {}}
+    pending_address[USERS["address"]] = True
+    dialog_state = store.namespace("dialog")
+    for state, user_id in USERS.items():
+        if state != "idle":
+            dialog_state[user_id] = state
+    return store, legacy, dialog_state
+
+
+def legacy_resolve(legacy, user_id, text):
+    """Прежний порядок проверок в handle_message (без побочных эффектов)"""
+    admin_waiting_photo, user_quiz, pending_address = legacy
+    text = (text or "").lower()
+    if "каталог" in text:
+        return "catalog"
+    if "корзин" in text:
+        return "cart"
+    if user_id in admin_waiting_photo:
+        return "photos"
+    if "подбор" in text:
+        return "quiz"
+    if text.startswith("❌") or "выйти" in text:
+        return "exit"
+    if text.startswith("🔙") or "назад" in text:
+        return "back"
+    if user_id in user_quiz:
+        return "answer"
+    if user_id in pending_address:
+        return "address"
+    return None
+
+
+def build_router():
+    router = TextRouter()
+    nav = ("idle", "quiz", "phone", "photo_ids")
+    for label, name in (("🌿 Каталог", "catalog"), ("🛒 Корзина", "cart"), ("🧩 Подбор масла", "quiz")):
+        router.button(label, states=nav)(name)
+        router.button(label, states=("address",), exact=True)(name)
+    router.button("подбор", states=nav)("quiz")
+    router.button("❌ Выйти", states=("idle", "quiz"))("exit")
+    router.button("🔙 Назад", states=("quiz",))("back")
+    router.fallback("quiz")("answer")
+    router.fallback("address")("address")
+    router.fallback("photo_ids")("photos")
+    return router
+
+
+def measure(name, func, calls):
+    rounds = max(1, 20000 // calls)
+    seconds = min(timeit.repeat(func, number=rounds, repeat=5))
+    print(f"{name:>28}: {seconds / (rounds * calls) * 1e6:8.2f} мкс на сообщение")
+
+
+def main(backend="sqlite"):
+    with tempfile.TemporaryDirectory() as tmp:
+        store, legacy, dialog_state = build_store(backend, os.path.join(tmp, "state.db"))
+        router = build_router()
+        cases = [(state, user_id, text) for state, user_id in USERS.items() for text in MESSAGES]
+
+        def run_router():
+            for _, user_id, text in cases:
+                router.resolve(dialog_state.get(user_id, "idle"), text)
+
+        def run_legacy():
+            for _, user_id, text in cases:
+                legacy_resolve(legacy, user_id, text)
+
+        def run_router_only():
+            for state, _, text in cases:
+                router.resolve(state, text)
+
+        print(f"Хранилище состояния: {backend}, сообщений в прогоне: {len(cases)}")
+        measure("TextRouter + состояние", run_router, len(cases))
+        measure("прежняя цепочка", run_legacy, len(cases))
+        measure("TextRouter без хранилища", run_router_only, len(cases))
+
+        mismatches = [
+            (state, text, legacy_resolve(legacy, user_id, text), router.resolve(state, text))
+            for state, user_id, text in cases
+            if legacy_resolve(legacy, user_id, text) != router.resolve(state, text)
+        ]
+        print(f"Расхождений с прежней цепочкой: {len(mismatches)}")
+        for state, text, old, new in mismatches:
+            print(f"  [{state}] {text!r}: было {old}, стало {new}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
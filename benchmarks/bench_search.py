@@ -0,0 +1,40 @@
+"""
+Микробенчмарк inline-поиска: сборка индекса на снимок каталога,
+поиск по префиксу, по опечатке и повторная страница из кэша.
+
+Запуск из корня проекта: python benchmarks/bench_search.py [число товаров]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog  # noqa: E402
+import search  # noqa: E402
+from google_sheets import load_products  # noqa: E402
+from fake_sheets import FakeSpreadsheet  # noqa: E402
+
+QUERIES = ["масло", "Льнян", "ЧЁРНОГО тмин", "конопляноe", "тыкв 200", "№12", "кокосвое", "описание 250"]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    snapshot = catalog.Catalog(load_products(FakeSpreadsheet(products=count)))
+    started = timeit.default_timer()
+    index = search.SearchIndex(snapshot)
+    print(f"Индекс: {len(index.docs)} карточек, {len(snapshot)} товаров, "
+          f"{(timeit.default_timer() - started) * 1000:.1f} мс")
+
+    number = 200
+    for query in QUERIES:
+        found = index.search(query)
+        cold = timeit.timeit(lambda: index.search(query), number=number) / number
+        index.page(query)
+        cached = timeit.timeit(lambda: index.page(query), number=number * 10) / (number * 10)
+        print(f"{query!r:>18}: найдено {len(found):>5}, поиск {cold * 1e6:8.1f} мкс, "
+              f"страница из кэша {cached * 1e6:5.2f} мкс")
+
+
+if __name__ == "__main__":
+    main()
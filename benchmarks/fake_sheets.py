@@ -0,0 +1,158 @@
+"""
+Локальная замена gspread для нагрузочных тестов: таблица в памяти
+с настраиваемой задержкой каждого запроса и размером листа Products.
+install() подменяет google_sheets.connect_to_sheet.
+"""
+import time
+import random
+import datetime
+
+import gspread
+
+import google_sheets
+
+PRODUCTS_HEADER = [
+    "id", "parent_id", "category", "name", "variant_label",
+    "price", "description", "our_price", "supplier", "stock", "file_id", "active"
+]
+
+# Названия совпадают с рекомендациями квиза, чтобы подбор находил товар
+OIL_NAMES = [
+    "Масло льняное", "Масло конопляное", "Масло тыквенное", "Масло черного тмина",
+    "Масло подсолнечное", "Масло грецкого ореха", "Масло кокосовое",
+]
+
+
+def a1_to_rowcol(label):
+    """"K12" -> (12, 11)"""
+    letters = "".join(c for c in label if c.isalpha()).upper()
+    col = 0
+    for c in letters:
+        col = col * 26 + ord(c) - ord("A") + 1
+    return int("".join(c for c in label if c.isdigit())), col
+
+
+def product_rows(count, variants=2, photos=False):
+    """
+    count корневых товаров, у каждого variants вариантов объёма.
+    photos — у корневых товаров есть file_id, у каждого пятого битый.
+    """
+    rows = [PRODUCTS_HEADER]
+    next_id = 1
+    for n in range(count):
+        name = OIL_NAMES[n] if n < len(OIL_NAMES) else f"Масло №{n + 1}"
+        root_id = next_id
+        next_id += 1
+        file_id = (f"broken-{n}" if n % 5 == 4 else f"photo-{n}") if photos else ""
+        rows.append([str(root_id), "", name, name, "", "", f"Описание: {name}", "", "", "", file_id, "TRUE"])
+        for v in range(variants):
+            price = 300 + 100 * v + n
+            rows.append([str(next_id), str(root_id), name, name, f"{100 * (v + 1)} мл", str(price),
+                         "", "", "", "10", "", "TRUE"])
+            next_id += 1
+    return rows
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [list(r) for r in rows]
+
+    def _request(self):
+        self.spreadsheet.request()
+
+    def get_all_values(self, *args, **kwargs):
+        self._request()
+        return [list(r) for r in self.rows]
+
+    def get(self, range_name=None, **kwargs):
+        self._request()
+        start = int("".join(c for c in range_name.split(":")[0] if c.isdigit()) or 1)
+        return [list(r) for r in self.rows[start - 1:]]
+
+    def acell(self, label):
+        self._request()
+        row, col = a1_to_rowcol(label)
+        cells = self.rows[row - 1] if row <= len(self.rows) else []
+        return gspread.Cell(row, col, cells[col - 1] if len(cells) >= col and cells[col - 1] != "" else None)
+
+    def col_values(self, col):
+        self._request()
+        return [r[col - 1] if len(r) >= col else "" for r in self.rows]
+
+    def batch_get(self, ranges, **kwargs):
+        """Только целые колонки ("A:A"), как в update_product_stock; пустые ячейки — пустые строки"""
+        self._request()
+        result = []
+        for range_name in ranges:
+            col = a1_to_rowcol(range_name.split(":")[0] + "1")[1]
+            result.append([[r[col - 1]] if len(r) >= col and r[col - 1] != "" else [] for r in self.rows])
+        return result
+
+    def append_row(self, row, **kwargs):
+        self.append_rows([row])
+
+    def append_rows(self, rows, **kwargs):
+        self._request()
+        self.rows.extend([str(v) for v in r] for r in rows)
+        self.spreadsheet.touch()
+
+    def batch_update(self, data, **kwargs):
+        self._request()
+        for update in data:
+            row, col = a1_to_rowcol(update["range"])
+            while len(self.rows) < row:
+                self.rows.append([])
+            cells = self.rows[row - 1]
+            cells.extend([""] * (col - len(cells)))
+            cells[col - 1] = str(update["values"][0][0])
+        self.spreadsheet.touch()
+
+    def update_title(self, title):
+        self.title = title
+
+
+class FakeSpreadsheet:
+    """latency — (мин, макс) задержка одного запроса к таблице, секунд"""
+
+    def __init__(self, products=50, latency=(0.0, 0.0), seed=None, photos=False):
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.updated = datetime.datetime(2026, 1, 1)
+        self.sheets = {
+            "Orders": FakeWorksheet(self, "Orders", [google_sheets.ORDERS_HEADER]),
+            "Products": FakeWorksheet(self, "Products", product_rows(products, photos=photos)),
+        }
+        self.sheet1 = self.sheets["Orders"]
+
+    def request(self):
+        self.requests += 1
+        low, high = self.latency
+        if high > 0:
+            time.sleep(self.random.uniform(low, high))
+
+    def touch(self):
+        self.updated += datetime.timedelta(seconds=1)
+
+    def worksheet(self, title):
+        self.request()
+        if title not in self.sheets:
+            raise gspread.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def add_worksheet(self, title, rows=100, cols=12):
+        self.request()
+        self.sheets[title] = FakeWorksheet(self, title, [])
+        return self.sheets[title]
+
+    def get_lastUpdateTime(self):
+        self.request()
+        return self.updated.isoformat() + "Z"
+
+
+def install(spreadsheet):
+    """Подменяет подключение к Google Sheets на таблицу в памяти"""
+    google_sheets.connect_to_sheet = lambda: spreadsheet
+    return spreadsheet
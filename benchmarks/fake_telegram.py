@@ -0,0 +1,128 @@
+"""
+Локальная замена Telegram Bot API для нагрузочных тестов.
+
+Принимает запросы вида /bot<token>/<method>, запоминает их, отвечает
+правдоподобными объектами и умеет добавлять задержку и ответы 429.
+Бот направляется сюда через TELEGRAM_API_URL. Ответ на колбэк относится
+к пользователю по id колбэка вида "<user_id>:<n>" (так их выдаёт load_test).
+file_id, начинающиеся с "broken", считаются битыми: getFile, sendPhoto
+и editMessageMedia отвечают на них 400.
+"""
+import json
+import time
+import random
+import asyncio
+import itertools
+from collections import Counter
+
+from aiohttp import web
+
+MESSAGE_METHODS = {
+    "sendMessage", "sendPhoto", "editMessageText", "editMessageMedia",
+    "editMessageCaption", "editMessageReplyMarkup",
+}
+
+
+class FakeTelegram:
+    """
+    latency — (мин, макс) задержка ответа в секундах;
+    error_rate — доля запросов, на которые отвечаем 429 с retry_after.
+    """
+
+    def __init__(self, latency=(0.0, 0.0), error_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self._message_ids = itertools.count(1000)
+        self._waiters = {}   # chat_id -> список Future, ждущих следующего сообщения
+        self._answer_waiters = {}   # user_id -> список Future, ждущих ответа на колбэк
+        self._runner = None
+        self.url = None
+
+    def wait_message(self, chat_id):
+        """Future, который завершится при следующем сообщении бота в чат chat_id"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(int(chat_id), []).append(future)
+        return future
+
+    def wait_answer(self, user_id):
+        """Future, который завершится при следующем answerCallbackQuery для user_id"""
+        future = asyncio.get_running_loop().create_future()
+        self._answer_waiters.setdefault(int(user_id), []).append(future)
+        return future
+
+    def _notify(self, chat_id, method, waiters=None):
+        waiters = self._waiters if waiters is None else waiters
+        for future in waiters.pop(chat_id, []):
+            if not future.done():
+                future.set_result((method, time.perf_counter()))
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        data = dict(await request.post()) if request.can_read_body else {}
+        low, high = self.latency
+        if high > 0:
+            await asyncio.sleep(self.random.uniform(low, high))
+        self.calls[method] += 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+        media = data.get("media")
+        file_id = data.get("file_id") or data.get("photo") or (json.loads(media).get("media") if media else None)
+        if str(file_id or "").startswith("broken"):
+            self.errors[method] += 1
+            return web.json_response({
+                "ok": False, "error_code": 400,
+                "description": "Bad Request: wrong file identifier/HTTP URL specified",
+            }, status=400)
+        try:
+            chat_id = int(data.get("chat_id", 0))
+        except ValueError:
+            chat_id = 0
+        if method in MESSAGE_METHODS:
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id >= 0 else "group"},
+                "text": data.get("text", ""),
+            }
+            if method in ("sendPhoto", "editMessageMedia"):
+                result["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}]
+        elif method == "getFile":
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_path": f"photos/{file_id}.jpg"}
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        else:
+            result = True
+        if chat_id and method in MESSAGE_METHODS:
+            self._notify(chat_id, method)
+        if method == "answerCallbackQuery":
+            user_id = str(data.get("callback_query_id", "")).partition(":")[0]
+            if user_id.isdigit():
+                self._notify(int(user_id), method, self._answer_waiters)
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
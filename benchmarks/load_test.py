@@ -0,0 +1,321 @@
+"""
+Нагрузочный тест бота целиком, без сети: локальный Telegram Bot API
+(fake_telegram), таблица в памяти (fake_sheets) и виртуальные пользователи,
+которые шлют апдейты на WEBHOOK_PATH и ждут ответа бота в свой чат.
+
+Запуск из корня проекта:
+    python benchmarks/load_test.py --users 200 --concurrency 50
+    python benchmarks/load_test.py --scenario checkout --tg-latency 0.02,0.1 --tg-429 0.01 \\
+        --sheets-latency 0.2,0.6 --products 200 --json report.json
+    python benchmarks/load_test.py --bulk 600   # рассылка в фоне: задержка ответов не должна расти
+
+Исходящие запросы бот ограничивает лимитом Telegram (~30 сообщений/с, --tg-rate),
+поэтому при большем потоке задержка ответа — это ожидание в очереди отправки.
+
+Задержка шага — от отправки апдейта до первого сообщения бота в чат пользователя,
+а для шагов из ANSWER_STEPS (нажатия, на которые бот отвечает только
+всплывающим уведомлением) — до ответа на колбэк.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+import tempfile
+from collections import defaultdict
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram  # noqa: E402
+import callback_codec  # noqa: E402
+import catalog_views  # noqa: E402
+
+SCENARIOS = ("browse", "cart", "checkout", "quiz")
+USER_ID_BASE = 100000
+BULK_CHAT_BASE = 900000
+ANSWER_STEPS = {"add_item", "cart_inc", "cart_dec"}
+
+
+def parse_range(value):
+    parts = [float(p) for p in value.split(",")]
+    return (parts[0], parts[-1])
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Traffic:
+    """Синтетические апдейты Telegram для одного прогона"""
+
+    def __init__(self, snapshot, questions, seed=None):
+        self.random = random.Random(seed)
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.questions = questions
+        self.roots = [p for p in snapshot.roots if snapshot.children(p.id)]
+        self.snapshot = snapshot
+
+    def _user(self, uid):
+        return {"id": uid, "is_bot": False, "first_name": "Bench", "username": f"bench{uid}"}
+
+    def message(self, uid, text=None, contact=None):
+        msg = {
+            "message_id": next(self.message_ids), "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"}, "from": self._user(uid),
+        }
+        if contact:
+            msg["contact"] = {"phone_number": contact, "first_name": "Bench", "user_id": uid}
+        else:
+            msg["text"] = text
+        return {"update_id": next(self.update_ids), "message": msg}
+
+    def callback(self, uid, data, message_id=None, photo=False):
+        """photo — кнопка нажата под сообщением с фото (карточкой товара)"""
+        message = {"message_id": message_id or next(self.message_ids), "date": int(time.time()),
+                   "chat": {"id": uid, "type": "private"}}
+        if photo:
+            message["photo"] = [{"file_id": "photo", "file_unique_id": "photo", "width": 1, "height": 1}]
+            message["caption"] = "…"
+        else:
+            message["text"] = "…"
+        return {"update_id": next(self.update_ids), "callback_query": {
+            "id": f"{uid}:{next(self.message_ids)}", "from": self._user(uid), "chat_instance": "bench",
+            "data": data, "message": message,
+        }}
+
+    def _browse(self, uid):
+        root = self.random.choice(self.roots)
+        return root, [
+            ("catalog", self.message(uid, "🌿 Каталог")),
+            ("category", self.callback(uid, f"cat|{root.id}")),
+        ]
+
+    def _add(self, uid, root):
+        view = catalog_views.for_catalog(self.snapshot).category(root.id)
+        var = self.random.choice(view.variants)
+        data = callback_codec.encode(callback_codec.ADD, var.id, view.version)
+        return var, ("add_item", self.callback(uid, data))
+
+    def steps(self, scenario, uid):
+        if scenario == "browse":
+            root, steps = self._browse(uid)
+            # Переход к другому товару прямо из карточки с фото, затем назад в каталог
+            other = self.random.choice(self.roots)
+            card = bool(root.file_id)
+            steps.append(("category", self.callback(uid, f"cat|{other.id}", photo=card)))
+            steps.append(("back_to_catalog", self.callback(uid, "back_to_catalog", photo=bool(other.file_id))))
+            return steps
+        if scenario == "cart":
+            root, steps = self._browse(uid)
+            var, add = self._add(uid, root)
+            steps += [add, ("view_cart", self.message(uid, "🛒 Корзина"))]
+            # Серия нажатий +/− в одном и том же сообщении корзины
+            cart_message = next(self.message_ids)
+            for _ in range(self.random.randint(1, 4)):
+                steps.append(("cart_inc", self.callback(uid, f"inc|{var.id}", cart_message)))
+            steps.append(("cart_dec", self.callback(uid, f"dec|{var.id}", cart_message)))
+            return steps
+        if scenario == "checkout":
+            root, steps = self._browse(uid)
+            steps.append(self._add(uid, root)[1])
+            steps += [
+                ("view_cart", self.message(uid, "🛒 Корзина")),
+                ("checkout", self.callback(uid, "checkout")),
+                ("delivery", self.callback(uid, "delivery")),
+                ("address", self.message(uid, f"ул. Нагрузочная, д. {uid % 100}")),
+                ("contact", self.message(uid, contact=f"+7900{uid:07d}")),
+            ]
+            return steps
+        if scenario == "quiz":
+            steps = [("start_quiz", self.message(uid, "🧩 Подбор масла"))]
+            for step in sorted(self.questions):
+                steps.append(("quiz_answer", self.message(uid, self.random.choice(self.questions[step][1]))))
+            return steps
+        raise ValueError(f"Неизвестный сценарий: {scenario}")
+
+
+async def run_user(session, url, tg, traffic, uid, scenarios, rounds, timeout, results):
+    for _ in range(rounds):
+        scenario = traffic.random.choice(scenarios)
+        for name, update in traffic.steps(scenario, uid):
+            reply = tg.wait_answer(uid) if name in ANSWER_STEPS else tg.wait_message(uid)
+            started = time.perf_counter()
+            async with session.post(url, json=update) as response:
+                await response.read()
+                results["accept"].append(time.perf_counter() - started)
+                if response.status != 200:
+                    results["http_errors"] += 1
+            try:
+                _, answered = await asyncio.wait_for(reply, timeout)
+            except asyncio.TimeoutError:
+                results["timeouts"][name] += 1
+                break
+            results["steps"][name].append(answered - started)
+            results["all"].append(answered - started)
+
+
+async def bulk_traffic(bot, count, results):
+    """Фоновая рассылка (как /remind) в чаты, не участвующие в сценариях"""
+    import outbound
+
+    async def send(chat_id):
+        try:
+            await bot.send_message(chat_id, "📬 Нагрузочная рассылка")
+            results["bulk_sent"] += 1
+        except Exception:
+            results["bulk_failed"] += 1
+
+    started = time.perf_counter()
+    with outbound.priority(outbound.BULK):
+        await asyncio.gather(*(send(BULK_CHAT_BASE + i) for i in range(count)))
+    results["bulk_seconds"] = time.perf_counter() - started
+
+
+async def bench(args):
+    tg = FakeTelegram(latency=args.tg_latency, error_rate=args.tg_429, seed=args.seed)
+    os.environ["TELEGRAM_API_URL"] = await tg.start()
+
+    import fake_sheets
+    spreadsheet = fake_sheets.install(fake_sheets.FakeSpreadsheet(
+        products=args.products, latency=args.sheets_latency, seed=args.seed, photos=args.photos
+    ))
+    import main
+    import quiz
+
+    app = main.create_app()
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}{main.WEBHOOK_PATH}"
+    # Дожидаемся подключения к таблице и загрузки каталога
+    await app["sheets_connector"]
+    print(f"🧪 Каталог: {len(main.catalog.current())} товаров, бот слушает {url}")
+
+    traffic = Traffic(main.catalog.current(), quiz.QUIZ_QUESTIONS, seed=args.seed)
+    scenarios = SCENARIOS if args.scenario == "mixed" else (args.scenario,)
+    results = {"steps": defaultdict(list), "all": [], "accept": [],
+               "timeouts": defaultdict(int), "http_errors": 0,
+               "bulk_sent": 0, "bulk_failed": 0, "bulk_seconds": None}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user(uid):
+        async with semaphore:
+            await run_user(session, url, tg, traffic, uid, scenarios, args.rounds, args.timeout, results)
+
+    bulk = asyncio.create_task(bulk_traffic(main.bot, args.bulk, results)) if args.bulk else None
+    started = time.perf_counter()
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(user(USER_ID_BASE + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+    if bulk:
+        await bulk
+
+    await runner.cleanup()   # on_shutdown: досылка заказов из очереди
+    await tg.stop()
+    orders_written = len(spreadsheet.sheets["Orders"].rows) - 1
+    return report(args, results, elapsed, tg, spreadsheet, orders_written)
+
+
+def summary(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+        "max_ms": round(max(values) * 1000, 2) if values else None,
+    }
+
+
+def report(args, results, elapsed, tg, spreadsheet, orders_written):
+    total = len(results["all"])
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "elapsed_s": round(elapsed, 3),
+        "updates": total,
+        "updates_per_s": round(total / elapsed, 1) if elapsed else None,
+        "latency": summary(results["all"]),
+        "webhook_accept": summary(results["accept"]),
+        "steps": {name: summary(values) for name, values in sorted(results["steps"].items())},
+        "timeouts": dict(results["timeouts"]),
+        "http_errors": results["http_errors"],
+        "telegram_calls": dict(tg.calls),
+        "telegram_429": dict(tg.errors),
+        "sheets_requests": spreadsheet.requests,
+        "orders_written": orders_written,
+        "bulk": {"sent": results["bulk_sent"], "failed": results["bulk_failed"],
+                 "seconds": round(results["bulk_seconds"], 2) if results["bulk_seconds"] else None},
+    }
+
+
+def print_report(data):
+    lat = data["latency"]
+    print(f"\n📊 {data['updates']} апдейтов за {data['elapsed_s']} с — {data['updates_per_s']} апдейтов/с")
+    print(f"   задержка ответа: p50 {lat['p50_ms']} мс, p95 {lat['p95_ms']} мс, p99 {lat['p99_ms']} мс")
+    acc = data["webhook_accept"]
+    print(f"   приём вебхука:   p50 {acc['p50_ms']} мс, p95 {acc['p95_ms']} мс, p99 {acc['p99_ms']} мс")
+    print(f"   {'шаг':<16}{'N':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, s in data["steps"].items():
+        print(f"   {name:<16}{s['count']:>7}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+    if data["timeouts"]:
+        print(f"   ⚠️ без ответа: {data['timeouts']}")
+    print(f"   Telegram: {sum(data['telegram_calls'].values())} запросов, 429: {sum(data['telegram_429'].values())}")
+    print(f"   Sheets: {data['sheets_requests']} запросов, записано заказов: {data['orders_written']}")
+    if data["bulk"]["sent"] or data["bulk"]["failed"]:
+        b = data["bulk"]
+        print(f"   Рассылка: отправлено {b['sent']}, ошибок {b['failed']} за {b['seconds']} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="виртуальных пользователей")
+    parser.add_argument("--concurrency", type=int, default=20, help="одновременно активных пользователей")
+    parser.add_argument("--rounds", type=int, default=1, help="сценариев на пользователя")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("mixed",), default="mixed")
+    parser.add_argument("--products", type=int, default=50, help="корневых товаров в листе Products")
+    parser.add_argument("--photos", action="store_true", help="фото у товаров (каждое пятое — битый file_id)")
+    parser.add_argument("--tg-latency", type=parse_range, default=(0.0, 0.0), help="мин,макс секунд")
+    parser.add_argument("--tg-429", type=float, default=0.0, help="доля ответов 429 от Telegram")
+    parser.add_argument("--sheets-latency", type=parse_range, default=(0.0, 0.0), help="мин,макс секунд")
+    parser.add_argument("--tg-rate", type=float, default=30, help="глобальный лимит отправки бота, сообщений/с")
+    parser.add_argument("--bulk", type=int, default=0, help="сообщений фоновой рассылки во время теста")
+    parser.add_argument("--state", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--timeout", type=float, default=10.0, help="ожидание ответа бота, секунд")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить отчёт в JSON (для сравнения прогонов)")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="bot-bench-")
+    os.environ.update({
+        "BOT_TOKEN": "123456:BENCHMARK",
+        "ADMIN_CHAT_ID": "1",
+        "BOT_URL": "http://127.0.0.1",
+        "DATA_DIR": data_dir,
+        "STATE_BACKEND": args.state,
+        "CATALOG_REFRESH_TTL": "0",
+        "TELEGRAM_GLOBAL_RATE": str(args.tg_rate),
+    })
+    data = asyncio.run(bench(args))
+    print_report(data)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
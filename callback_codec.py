@@ -0,0 +1,41 @@
+"""
+Компактные callback_data для кнопок каталога.
+
+Кнопка несёт только действие, id варианта и версию карточки, на которой
+она была нарисована: "#" + base64url(действие, версия, id). Название,
+объём и цена берутся из текущего каталога на сервере, а не из кнопки.
+"""
+import base64
+import struct
+
+PREFIX = "#"
+MAX_LENGTH = 64   # предел Telegram для callback_data, байт
+
+ADD = 1
+ACTIONS = {ADD}
+
+_HEADER = struct.Struct(">BI")   # действие, версия каталога (crc32)
+
+
+def encode(action, product_id, version):
+    raw = _HEADER.pack(action, version & 0xFFFFFFFF) + str(product_id).encode()
+    data = PREFIX + base64.urlsafe_b64encode(raw).decode().rstrip("=")
+    if len(data) > MAX_LENGTH:
+        raise ValueError(f"callback_data длиннее {MAX_LENGTH} байт: id {product_id!r}")
+    return data
+
+
+def decode(data):
+    """(действие, id товара, версия); ValueError для чужих или повреждённых данных"""
+    if not data or not data.startswith(PREFIX):
+        raise ValueError(f"Не кнопка каталога: {data!r}")
+    payload = data[len(PREFIX):]
+    try:
+        raw = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        action, version = _HEADER.unpack_from(raw)
+        product_id = raw[_HEADER.size:].decode()
+    except (ValueError, struct.error) as e:
+        raise ValueError(f"Повреждённые callback_data {data!r}: {e}") from None
+    if action not in ACTIONS or not product_id:
+        raise ValueError(f"Повреждённые callback_data {data!r}")
+    return action, product_id, version
@@ -0,0 +1,181 @@
+"""
+Корзина: позиции с количеством и редактирование сообщения корзины на месте.
+
+В хранилище корзина — словарь {id варианта товара: позиция}, где позиция —
+{"id", "name", "variant", "price", "qty"}; порядок — порядок добавления.
+"""
+import asyncio
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+EMPTY_TEXT = "🧺 Корзина пуста"
+
+
+def normalize(cart):
+    """
+    Приводит корзину к позициям с количеством. Корзины старого формата
+    (список одинаковых словарей на каждую штуку) сворачиваются по id и объёму.
+    """
+    if not cart:
+        return {}
+    if isinstance(cart, dict):
+        return cart
+    lines = {}
+    for item in cart:
+        key = str(item["id"])
+        line = lines.get(key)
+        if line is None:
+            lines[key] = {"id": key, "name": item["name"], "variant": item["variant"],
+                          "price": int(item["price"]), "qty": 1}
+        else:
+            line["qty"] += 1
+    return lines
+
+
+def add(cart, product_id, name, variant, price, qty=1):
+    cart = normalize(cart)
+    key = str(product_id)
+    line = cart.get(key)
+    if line is None:
+        cart[key] = {"id": key, "name": name, "variant": variant, "price": int(price), "qty": qty}
+    else:
+        line["qty"] += qty
+    return cart
+
+
+def change(cart, product_id, delta):
+    """Меняет количество позиции; при нуле позиция удаляется"""
+    cart = normalize(cart)
+    line = cart.get(str(product_id))
+    if line is not None:
+        line["qty"] += delta
+        if line["qty"] <= 0:
+            del cart[str(product_id)]
+    return cart
+
+
+def remove(cart, product_id):
+    cart = normalize(cart)
+    cart.pop(str(product_id), None)
+    return cart
+
+
+def limit(cart, allowed):
+    """Урезает количества до allowed {id: количество}; позиции с нулём удаляются"""
+    cart = normalize(cart)
+    for key, qty in allowed.items():
+        line = cart.get(str(key))
+        if line is not None and line["qty"] > qty:
+            if qty > 0:
+                line["qty"] = qty
+            else:
+                del cart[str(key)]
+    return cart
+
+
+def lines(cart):
+    return list(normalize(cart).values())
+
+
+def total(cart):
+    return sum(line["price"] * line["qty"] for line in lines(cart))
+
+
+def count(cart, product_id=None):
+    """Число штук в корзине (или одной позиции)"""
+    cart = normalize(cart)
+    if product_id is not None:
+        line = cart.get(str(product_id))
+        return line["qty"] if line else 0
+    return sum(line["qty"] for line in cart.values())
+
+
+def line_text(line):
+    qty = line["qty"]
+    if qty == 1:
+        return f"{line['name']} {line['variant']} — {line['price']}₽"
+    return f"{line['name']} {line['variant']} × {qty} — {line['price'] * qty}₽"
+
+
+def order_items(cart):
+    """Состав заказа одной строкой для листа Orders"""
+    return "; ".join(line_text(line) for line in lines(cart))
+
+
+def render(cart, empty_markup=None):
+    """Текст и клавиатура сообщения корзины"""
+    items = lines(cart)
+    if not items:
+        return EMPTY_TEXT, empty_markup
+    text = "\n".join(f"{i}. {line_text(line)}" for i, line in enumerate(items, 1))
+    text += f"\n\n💰 Итого: {total(cart)}₽"
+    buttons = [
+        [
+            InlineKeyboardButton(text=f"➖ {i}", callback_data=f"dec|{line['id']}"),
+            InlineKeyboardButton(text=f"❌ {i}", callback_data=f"del|{line['id']}"),
+            InlineKeyboardButton(text=f"➕ {i}", callback_data=f"inc|{line['id']}"),
+        ]
+        for i, line in enumerate(items, 1)
+    ]
+    buttons.append([InlineKeyboardButton(text="📦 Оформить заказ", callback_data="checkout")])
+    buttons.append([InlineKeyboardButton(text="🗑 Очистить корзину", callback_data="clear_cart")])
+    return text, InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+class CartEditor:
+    """
+    Отложенное редактирование сообщения корзины. Нажатия +/−, пришедшие
+    в пределах delay секунд, сливаются в одно edit_message_text
+    с актуальным состоянием корзины на момент отправки.
+    """
+
+    def __init__(self, bot, delay=0.4):
+        self.bot = bot
+        self.delay = delay
+        self._pending = {}   # (chat_id, message_id) -> задача отправки
+        self._shown = {}     # (chat_id, message_id) -> последний отправленный текст
+
+    def schedule(self, chat_id, message_id, render_cart):
+        """render_cart() -> (text, markup) вызывается в момент отправки"""
+        key = (chat_id, message_id)
+        if key in self._pending:
+            return
+        self._pending[key] = asyncio.create_task(self._edit(key, render_cart))
+
+    def forget(self, chat_id, message_id):
+        """Сообщение изменено в обход редактора (например, корзина очищена)"""
+        key = (chat_id, message_id)
+        task = self._pending.pop(key, None)
+        if task:
+            task.cancel()
+        self._shown.pop(key, None)
+
+    async def _edit(self, key, render_cart):
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            if self._pending.get(key) is asyncio.current_task():
+                del self._pending[key]
+        text, markup = render_cart()
+        shown = (text, markup.model_dump_json() if markup else None)
+        if self._shown.get(key) == shown:
+            return
+        chat_id, message_id = key
+        try:
+            await self.bot.edit_message_text(
+                text=text, chat_id=chat_id, message_id=message_id, reply_markup=markup
+            )
+            self._shown[key] = shown
+            if len(self._shown) > 10000:
+                self._shown.pop(next(iter(self._shown)))
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                print(f"⚠️ Не удалось обновить корзину: {e}")
+        except Exception as e:
+            print(f"⚠️ Не удалось обновить корзину: {e}")
+
+    async def drain(self):
+        """Досылает отложенные правки при остановке"""
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
@@ -0,0 +1,171 @@
+import os
+import json
+import zlib
+
+PRODUCT_FIELDS = (
+    "id", "parent_id", "category", "name", "variant_label",
+    "price", "description", "our_price", "supplier", "stock", "file_id"
+)
+# Поля, от которых зависят карточки и версия каталога. Остаток меняется
+# с каждой продажей и на карточках не показывается: его ведёт журнал остатков
+CARD_FIELDS = tuple(f for f in PRODUCT_FIELDS if f != "stock")
+
+
+class Product:
+    """Строка листа Products (только активные товары)"""
+    __slots__ = PRODUCT_FIELDS
+
+    def __init__(self, id, parent_id="", category="", name="", variant_label="",
+                 price="", description="", our_price="", supplier="", stock="", file_id=""):
+        self.id = id
+        self.parent_id = parent_id
+        self.category = category
+        self.name = name
+        self.variant_label = variant_label
+        self.price = price
+        self.description = description
+        self.our_price = our_price
+        self.supplier = supplier
+        self.stock = stock
+        self.file_id = file_id
+
+    def replace(self, **changes):
+        """Копия записи с изменёнными полями"""
+        values = {f: getattr(self, f) for f in PRODUCT_FIELDS}
+        values.update(changes)
+        return Product(**values)
+
+    def as_tuple(self):
+        return tuple(getattr(self, f) for f in PRODUCT_FIELDS)
+
+    def card_tuple(self):
+        return tuple(getattr(self, f) for f in CARD_FIELDS)
+
+    def __eq__(self, other):
+        return isinstance(other, Product) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return f"Product(id={self.id!r}, name={self.name!r}, variant_label={self.variant_label!r})"
+
+
+class Catalog:
+    """
+    Неизменяемый снимок каталога с индексами.
+    Строится один раз на каждое обновление и подменяется целиком.
+    """
+    __slots__ = ("products", "by_id", "by_parent", "by_category", "roots", "categories",
+                 "version", "_name_lookup")
+
+    def __init__(self, products):
+        self.products = tuple(products)
+        by_id = {}
+        by_parent = {}
+        by_category = {}
+        roots = []
+        categories = {}
+        for p in self.products:
+            by_id.setdefault(p.id, p)
+            if p.parent_id:
+                by_parent.setdefault(p.parent_id, []).append(p)
+            else:
+                roots.append(p)
+                categories.setdefault(p.category, p)
+            by_category.setdefault(p.category, []).append(p)
+        self.by_id = by_id
+        self.by_parent = {k: tuple(v) for k, v in by_parent.items()}
+        self.by_category = {k: tuple(v) for k, v in by_category.items()}
+        self.roots = tuple(roots)
+        # Корневые товары категорий в порядке таблицы
+        self.categories = tuple(categories.values())
+        self.version = zlib.crc32(repr([p.card_tuple() for p in self.products]).encode())
+        self._name_lookup = {}
+
+    def __len__(self):
+        return len(self.products)
+
+    def get(self, product_id):
+        return self.by_id.get(str(product_id))
+
+    def children(self, parent_id):
+        return self.by_parent.get(str(parent_id), ())
+
+    def find_root_by_name(self, name_part):
+        """Первый корневой товар, в названии которого есть name_part (результат кэшируется)"""
+        key = name_part.lower()
+        if key not in self._name_lookup:
+            self._name_lookup[key] = next(
+                (p for p in self.roots if key in p.name.lower()), None
+            )
+        return self._name_lookup[key]
+
+
+_current = Catalog(())
+
+
+def current():
+    """Текущий снимок каталога"""
+    return _current
+
+
+def publish(products):
+    """Строит новый снимок и атомарно подменяет текущий (если содержимое изменилось)"""
+    global _current
+    snapshot = Catalog(products)
+    if snapshot.version == _current.version and snapshot.products == _current.products:
+        return _current
+    _current = snapshot
+    return snapshot
+
+
+def patch(changes):
+    """
+    Публикует снимок с изменёнными полями отдельных товаров без перечитывания таблицы.
+    changes — словарь {id товара: {поле: значение}}.
+    """
+    products = [
+        p.replace(**changes[p.id]) if p.id in changes else p
+        for p in _current.products
+    ]
+    return publish(products)
+
+
+def from_oils(oils):
+    """
+    Резервный каталог из встроенного справочника oils_data.OILS —
+    на случай, когда нет ни снимка на диске, ни связи с таблицей.
+    """
+    products = []
+    for n, (name, info) in enumerate(oils.items(), 1):
+        root_id = f"oil{n}"
+        description = info.get("desc", "")
+        products.append(Product(id=root_id, category=name, name=name, description=description))
+        for m, (label, price) in enumerate(info.get("prices", {}).items(), 1):
+            products.append(Product(
+                id=f"{root_id}-{m}", parent_id=root_id, category=name, name=name,
+                variant_label=label, price=str(price), description=description
+            ))
+    return products
+
+
+def save(snapshot, path):
+    """Записывает снимок в JSON-файл (атомарно, через временный файл)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": snapshot.version,
+            "fields": PRODUCT_FIELDS,
+            "products": [p.as_tuple() for p in snapshot.products],
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load(path):
+    """Читает список Product из файла снимка"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    fields = data.get("fields", PRODUCT_FIELDS)
+    return [Product(**dict(zip(fields, values))) for values in data["products"]]
@@ -0,0 +1,96 @@
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+import callback_codec
+
+CATALOG_PROMPT = "🌿 Выберите категорию:"
+
+
+class CategoryView:
+    """
+    Готовые подпись и клавиатура вариантов для карточки товара.
+    version — версия каталога, при которой карточка нарисована; её несут кнопки.
+    """
+    __slots__ = ("product", "variants", "version", "text", "markup")
+
+    def __init__(self, product, variants, version):
+        self.product = product
+        self.variants = variants
+        self.version = version
+        self.text = f"*{product.name}*\n\n{product.description}"
+        buttons = []
+        for var in variants:
+            if var.variant_label and var.price:
+                try:
+                    data = callback_codec.encode(callback_codec.ADD, var.id, version)
+                except ValueError as e:
+                    # Слишком длинный id в таблице не должен ломать весь каталог: без кнопки только этот вариант
+                    print(f"⚠️ Кнопка варианта пропущена: {e}")
+                    continue
+                buttons.append([InlineKeyboardButton(text=f"{var.variant_label} — {var.price}₽", callback_data=data)])
+        buttons.append([InlineKeyboardButton(text="⬅️ Назад в каталог", callback_data="back_to_catalog")])
+        self.markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    def shows(self, product, variants):
+        """Карточка нарисована по тем же данным (остатки не в счёт)"""
+        return (self.product.card_tuple() == product.card_tuple()
+                and [v.card_tuple() for v in self.variants] == [v.card_tuple() for v in variants])
+
+
+class CatalogViews:
+    """
+    Кэш отрисованных клавиатур и подписей для одного снимка каталога.
+    Собирается при обновлении каталога, в обработчиках остаётся только поиск по словарю.
+    Карточки, не изменившиеся с прошлого снимка (previous), переиспользуются.
+    """
+
+    def __init__(self, snapshot, previous=None):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        self.menu = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=f"🌿 {cat.name}", callback_data=f"cat|{cat.id}")]
+            for cat in snapshot.categories
+        ])
+        old = previous._categories if previous is not None else {}
+        self._categories = {}
+        for p in snapshot.roots:
+            variants = snapshot.children(p.id)
+            view = old.get(p.id)
+            if view is None or not view.shows(p, variants):
+                view = CategoryView(p, variants, self.version)
+            self._categories[p.id] = view
+
+    def category(self, product_id):
+        """Карточка товара; для не-корневых товаров собирается при первом обращении"""
+        product_id = str(product_id)
+        view = self._categories.get(product_id)
+        if view is None:
+            product = self.snapshot.get(product_id)
+            if not product:
+                return None
+            view = CategoryView(product, self.snapshot.children(product_id), self.version)
+            self._categories[product_id] = view
+        return view
+
+    def variant(self, product_id, version):
+        """
+        Вариант товара по кнопке «добавить»: (товар или None, карточка).
+        Кнопка устарела, если карточка с тех пор перерисована (view.version != version):
+        у неизменившихся товаров карточки и версии переживают обновления каталога.
+        """
+        product = self.snapshot.get(product_id)
+        if product is None or not product.parent_id or not product.price:
+            return None, None
+        return product, self.category(product.parent_id)
+
+
+_views = None
+
+
+def for_catalog(snapshot):
+    """Возвращает кэш для снимка, пересобирая его при смене версии каталога"""
+    global _views
+    views = _views
+    if views is None or views.version != snapshot.version:
+        views = CatalogViews(snapshot, previous=views)
+        _views = views
+    return views
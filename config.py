@@ -7,3 +7,91 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_CHAT_ID = int(os.getenv("ADMIN_CHAT_ID"))
 GROUP_CHAT_ID = int(os.getenv("GROUP_CHAT_ID", "0"))  # можно не указывать
 GOOGLE_SHEET_NAME = os.getenv("GOOGLE_SHEET_NAME", "HION Orders")
+
+PORT = int(os.getenv("PORT", "8080"))
+# Сколько апдейтов обрабатывается одновременно
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "100"))
+
+# Локальные данные бота (очереди, индексы)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+ORDER_QUEUE_PATH = os.getenv("ORDER_QUEUE_PATH", os.path.join(DATA_DIR, "orders_queue.sqlite3"))
+# Интервал пакетной отправки заказов в Google Sheets, секунд
+ORDER_FLUSH_INTERVAL = float(os.getenv("ORDER_FLUSH_INTERVAL", "5"))
+# Остатки и резервы товаров в корзинах; интервал пакетного списания в колонку stock, секунд
+STOCK_LEDGER_PATH = os.getenv("STOCK_LEDGER_PATH", os.path.join(DATA_DIR, "stock.sqlite3"))
+STOCK_SYNC_INTERVAL = float(os.getenv("STOCK_SYNC_INTERVAL", "30"))
+
+# Пул потоков и HTTP-соединений для запросов к Google Sheets
+SHEETS_POOL_SIZE = int(os.getenv("SHEETS_POOL_SIZE", "8"))
+SHEETS_TIMEOUT = float(os.getenv("SHEETS_TIMEOUT", "30"))
+# Автомат защиты Google Sheets: доля ошибок (и слишком медленных запросов, секунд)
+# среди последних SHEETS_BREAKER_WINDOW вызовов, после которой запросы не отправляются
+# SHEETS_BREAKER_OPEN_SECONDS секунд, а потом таблица проверяется пробным запросом
+SHEETS_BREAKER_FAILURE_RATE = float(os.getenv("SHEETS_BREAKER_FAILURE_RATE", "0.5"))
+SHEETS_BREAKER_WINDOW = int(os.getenv("SHEETS_BREAKER_WINDOW", "20"))
+SHEETS_BREAKER_MIN_CALLS = int(os.getenv("SHEETS_BREAKER_MIN_CALLS", "5"))
+SHEETS_SLOW_CALL = float(os.getenv("SHEETS_SLOW_CALL", "10"))
+SHEETS_BREAKER_OPEN_SECONDS = float(os.getenv("SHEETS_BREAKER_OPEN_SECONDS", "30"))
+
+# Период автообновления каталога, секунд (0 — только вручную через /refresh)
+CATALOG_REFRESH_TTL = float(os.getenv("CATALOG_REFRESH_TTL", "300"))
+
+# Ячейка листа Products с версией каталога (например "N1"). Её обновляет скрипт таблицы
+# при ручной правке листа (триггер onEdit на записи через API не срабатывает), поэтому
+# заказы и списания остатков бота не заставляют перечитывать лист. Пусто — сверяется
+# время изменения всей таблицы, а его меняет и сам бот
+PRODUCTS_REVISION_CELL = os.getenv("PRODUCTS_REVISION_CELL", "")
+
+# Хранилище состояния пользователей: sqlite (переживает перезапуски) или memory
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_PATH = os.getenv("STATE_PATH", os.path.join(DATA_DIR, "state.sqlite3"))
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", "100000"))
+STATE_PURGE_INTERVAL = float(os.getenv("STATE_PURGE_INTERVAL", "600"))
+# Сроки жизни состояния, секунд
+CART_TTL = float(os.getenv("CART_TTL", str(7 * 24 * 3600)))
+QUIZ_TTL = float(os.getenv("QUIZ_TTL", str(24 * 3600)))
+CHECKOUT_TTL = float(os.getenv("CHECKOUT_TTL", str(24 * 3600)))
+PROFILE_TTL = float(os.getenv("PROFILE_TTL", str(365 * 24 * 3600)))
+# Сколько помнить проверенный и битый file_id фото товара, секунд
+MEDIA_VALID_TTL = float(os.getenv("MEDIA_VALID_TTL", str(24 * 3600)))
+MEDIA_BROKEN_TTL = float(os.getenv("MEDIA_BROKEN_TTL", str(6 * 3600)))
+# Нажатия +/− в корзине за это время сливаются в одно редактирование сообщения, секунд
+CART_EDIT_DELAY = float(os.getenv("CART_EDIT_DELAY", "0.4"))
+# Сколько Telegram кэширует ответ на inline-поиск (@бот запрос), секунд
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "60"))
+
+# Многопроцессный режим (запуск через python workers.py): число процессов-обработчиков
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+# Общие снимки каталога и весов квиза на диске и период их проверки другими процессами, секунд
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", os.path.join(DATA_DIR, "catalog.json"))
+QUIZ_WEIGHTS_PATH = os.getenv("QUIZ_WEIGHTS_PATH", os.path.join(DATA_DIR, "quiz_weights.json"))
+SNAPSHOT_POLL_INTERVAL = float(os.getenv("SNAPSHOT_POLL_INTERVAL", "2"))
+# Сколько помнить обработанные update_id, секунд
+UPDATE_DEDUP_TTL = float(os.getenv("UPDATE_DEDUP_TTL", "3600"))
+
+# Адрес Bot API (пусто — официальный api.telegram.org; например, локальный Bot API server)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Лимиты Telegram Bot API
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_GROUP_RATE_PER_MIN = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MIN", "20"))
+# Повторы запроса после RetryAfter в очереди исходящих и запас токенов для ответов пользователям
+TELEGRAM_OUTBOUND_RETRIES = int(os.getenv("TELEGRAM_OUTBOUND_RETRIES", "3"))
+TELEGRAM_INTERACTIVE_RESERVE = int(os.getenv("TELEGRAM_INTERACTIVE_RESERVE", "5"))
+# Напоминания о повторной покупке
+REMINDER_DAYS = int(os.getenv("REMINDER_DAYS", "30"))
+REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "20"))
+REMINDERS_LEDGER_PATH = os.getenv("REMINDERS_LEDGER_PATH", os.path.join(DATA_DIR, "reminders.sqlite3"))
+ORDER_INDEX_PATH = os.getenv("ORDER_INDEX_PATH", os.path.join(DATA_DIR, "orders_index.sqlite3"))
+# Позиции заказов и сводки продаж для /stats
+SALES_PATH = os.getenv("SALES_PATH", os.path.join(DATA_DIR, "sales.sqlite3"))
+
+# Чаты для уведомлений о новых заказах (через запятую); по умолчанию админ и группа
+NOTIFY_CHAT_IDS = [
+    int(chat_id) for chat_id in
+    os.getenv("NOTIFY_CHAT_IDS", f"{ADMIN_CHAT_ID},{GROUP_CHAT_ID}").split(",")
+    if chat_id.strip() and int(chat_id) != 0
+]
+# Сколько раз повторить уведомление, если Telegram просит подождать дольше повторов очереди отправки
+NOTIFY_RETRIES = int(os.getenv("NOTIFY_RETRIES", "3"))
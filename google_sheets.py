@@ -1,12 +1,154 @@
 import os
 import json
-import gspread
+import time
+import uuid
+import threading
+from collections import deque
 from datetime import datetime
-from oauth2client.service_account import ServiceAccountCredentials
-from config import GOOGLE_SHEET_NAME
+from config import (
+    GOOGLE_SHEET_NAME, SHEETS_POOL_SIZE, SHEETS_TIMEOUT,
+    SHEETS_BREAKER_FAILURE_RATE, SHEETS_BREAKER_WINDOW, SHEETS_BREAKER_MIN_CALLS,
+    SHEETS_SLOW_CALL, SHEETS_BREAKER_OPEN_SECONDS, PRODUCTS_REVISION_CELL
+)
+from catalog import Product
+from stock import parse_stock
+
+# gspread, oauth2client и requests импортируются внутри функций:
+# это сотни миллисекунд, а бот должен начать отвечать сразу после старта.
+
+ORDERS_HEADER = ["Время", "Клиент", "Заказ", "Адрес", "Сумма", "Оплата", "ID заказа", "ID клиента"]
+
+# Кэш листов: повторный spreadsheet.worksheet(...) — это лишний HTTP-запрос
+_worksheets = {}
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: Google Sheets недавно не отвечали"""
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты для запросов к таблице. Считает ошибки и слишком медленные
+    ответы среди последних window вызовов; когда их доля достигает failure_rate,
+    размыкается — вызовы сразу падают с CircuitOpenError, не дожидаясь таймаутов.
+    Через open_seconds пропускает один пробный запрос: успех замыкает цепь.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_rate=0.5, window=20, min_calls=5, slow_call=10, open_seconds=30):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.last_error = None
+        self._results = deque(maxlen=window)    # True — ошибка или медленный ответ
+        self._latencies = deque(maxlen=window)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = self.HALF_OPEN
+                print("🟡 Google Sheets: пробный запрос")
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            raise CircuitOpenError(f"Google Sheets временно недоступны: {self.last_error}")
+
+    def _after_call(self, probe, failed, elapsed, error=None):
+        with self._lock:
+            if error is not None:
+                self.last_error = error
+            elif failed:
+                self.last_error = f"медленный ответ: {elapsed:.1f} с"
+            self._latencies.append(elapsed)
+            if probe:
+                self._probe_in_flight = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self._results.clear()
+                    print("🟢 Google Sheets снова доступны")
+                return
+            self._results.append(failed)
+            if (self.state == self.CLOSED and len(self._results) >= self.min_calls
+                    and sum(self._results) / len(self._results) >= self.failure_rate):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        print(f"🔴 Google Sheets недоступны, запросы приостановлены на {self.open_seconds:.0f} с: {self.last_error}")
+
+    def call(self, func, *args, **kwargs):
+        probe = self._before_call()
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._after_call(probe, True, time.monotonic() - started, str(e) or type(e).__name__)
+            raise
+        elapsed = time.monotonic() - started
+        self._after_call(probe, elapsed > self.slow_call, elapsed)
+        return result
+
+    @property
+    def available(self):
+        return self.state == self.CLOSED
+
+    def health(self):
+        """Состояние для мониторинга"""
+        with self._lock:
+            results = list(self._results)
+            latencies = sorted(self._latencies)
+            return {
+                "state": self.state,
+                "failure_rate": round(sum(results) / len(results), 3) if results else 0,
+                "calls": len(results),
+                "latency_p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                "latency_max": round(latencies[-1], 3) if latencies else None,
+                "open_for": round(time.monotonic() - self.opened_at, 1) if self.state != self.CLOSED else None,
+                "last_error": self.last_error,
+            }
+
+
+# Через этот автомат идут все запросы к таблице (см. sheets_async.run)
+breaker = CircuitBreaker(
+    failure_rate=SHEETS_BREAKER_FAILURE_RATE,
+    window=SHEETS_BREAKER_WINDOW,
+    min_calls=SHEETS_BREAKER_MIN_CALLS,
+    slow_call=SHEETS_SLOW_CALL,
+    open_seconds=SHEETS_BREAKER_OPEN_SECONDS,
+)
+
+
+def probe(spreadsheet):
+    """Самый дешёвый запрос к таблице — проверка, что она отвечает"""
+    return spreadsheet.get_lastUpdateTime()
+
+def configure_client(client):
+    """Одна авторизованная сессия на процесс с пулом соединений под пул потоков и таймаутом запросов"""
+    from requests.adapters import HTTPAdapter
+
+    adapter = HTTPAdapter(pool_connections=SHEETS_POOL_SIZE, pool_maxsize=SHEETS_POOL_SIZE)
+    client.http_client.session.mount("https://", adapter)
+    client.http_client.set_timeout(SHEETS_TIMEOUT)
+    return client
 
 def connect_to_sheet():
     """Подключение к Google Sheets через JSON из переменных окружения."""
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
     json_data = os.getenv("GOOGLE_CREDENTIALS_JSON")
     if not json_data:
@@ -14,7 +156,7 @@ def connect_to_sheet():
     
     creds_dict = json.loads(json_data)
     creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    client = gspread.authorize(creds)
+    client = configure_client(gspread.authorize(creds))
     
     try:
         spreadsheet = client.open(GOOGLE_SHEET_NAME)
@@ -23,7 +165,7 @@ def connect_to_sheet():
         # Создаём лист Orders
         orders_sheet = spreadsheet.sheet1
         orders_sheet.update_title("Orders")
-        orders_sheet.append_row(["Время", "Клиент", "Заказ", "Адрес", "Сумма", "Оплата"])
+        orders_sheet.append_row(ORDERS_HEADER)
         
         # Создаём лист Products
         products_sheet = spreadsheet.add_worksheet(title="Products", rows=100, cols=12)
@@ -34,18 +176,34 @@ def connect_to_sheet():
     
     return spreadsheet
 
+def _cached_worksheet(spreadsheet, title, fallback):
+    """
+    Лист по названию. Если листа нет — fallback() (не кэшируется: лист могут создать позже).
+    Прочие ошибки (сеть, квоты) пробрасываются, а не принимаются за отсутствие листа.
+    """
+    from gspread.exceptions import WorksheetNotFound
+
+    key = (id(spreadsheet), title)
+    sheet = _worksheets.get(key)
+    if sheet is None:
+        try:
+            sheet = spreadsheet.worksheet(title)
+        except WorksheetNotFound:
+            return fallback()
+        _worksheets[key] = sheet
+    return sheet
+
+def reset_worksheet_cache():
+    """Сбросить кэш листов (например, после переименования листа в таблице)"""
+    _worksheets.clear()
+
 def get_orders_sheet(spreadsheet):
     """Получить лист заказов"""
-    try:
-        return spreadsheet.worksheet("Orders")
-    except:
-        return spreadsheet.sheet1
+    return _cached_worksheet(spreadsheet, "Orders", lambda: spreadsheet.sheet1)
 
 def get_products_sheet(spreadsheet):
     """Получить лист товаров"""
-    try:
-        return spreadsheet.worksheet("Products")
-    except:
+    def create_products_sheet():
         # Создать если не существует
         products_sheet = spreadsheet.add_worksheet(title="Products", rows=100, cols=12)
         products_sheet.append_row([
@@ -53,91 +211,272 @@ def get_products_sheet(spreadsheet):
             "price", "description", "our_price", "supplier", "stock", "file_id", "active"
         ])
         return products_sheet
+    return _cached_worksheet(spreadsheet, "Products", create_products_sheet)
 
-def add_order(spreadsheet, username, items, address, total, phone):
-    """
-    Добавляет новую строку в таблицу заказов.
-    """
-    orders_sheet = get_orders_sheet(spreadsheet)
-    row = [
+def new_order_id():
+    return uuid.uuid4().hex[:12]
+
+
+def build_order_row(username, items, address, total, phone, order_id="", customer_id=""):
+    """Строка для листа Orders"""
+    return [
         datetime.now().strftime("%Y-%m-%d %H:%M"),
         username,
         items,
         address,
         total,
-        phone
+        phone,
+        order_id,
+        customer_id
     ]
-    orders_sheet.append_row(row)
-    print(f"✅ Добавлен заказ в таблицу: {username} — {total}₽")
 
-def get_orders(spreadsheet):
+
+def append_orders(spreadsheet, rows):
     """
-    Возвращает все заказы в виде списка словарей
+    Добавляет пачку заказов в таблицу одним запросом.
     """
-    try:
-        orders_sheet = get_orders_sheet(spreadsheet)
-        data = orders_sheet.get_all_records()
-        print(f"📄 Загружено {len(data)} заказов из Google Sheets")
-        return data
-    except Exception as e:
-        print(f"❌ Ошибка чтения заказов: {e}")
-        return []
+    orders_sheet = get_orders_sheet(spreadsheet)
+    orders_sheet.append_rows(rows)
 
-def load_products(spreadsheet):
+def get_order_rows(spreadsheet, start_row):
     """
-    Загружает все товары из листа Products
-    Возвращает список словарей с полной информацией о товарах
+    Сырые строки листа Orders начиная с номера start_row (только новые строки, без заголовка)
     """
-    try:
-        products_sheet = get_products_sheet(spreadsheet)
-        records = products_sheet.get_all_records()
-        
-        # Фильтруем только активные товары
+    orders_sheet = get_orders_sheet(spreadsheet)
+    last_col = chr(ord("A") + len(ORDERS_HEADER) - 1)
+    rows = orders_sheet.get(f"A{start_row}:{last_col}")
+    print(f"📄 Загружено {len(rows)} новых строк заказов из Google Sheets")
+    return [list(row) for row in rows]
+
+def _product_from_row(columns, row):
+    """Разбирает сырую строку листа Products; None — если товар неактивен"""
+    from gspread.utils import numericise
+
+    def cell(name):
+        i = columns.get(name)
+        if i is None or i >= len(row):
+            return ""
+        return str(numericise(row[i])).strip()
+
+    # Проверяем active (может быть TRUE/True/true/1)
+    if cell("active").upper() not in ["TRUE", "1", "YES"]:
+        return None
+    return Product(
+        id=cell("id"),
+        parent_id=cell("parent_id"),
+        category=cell("category"),
+        name=cell("name"),
+        variant_label=cell("variant_label"),
+        price=cell("price"),
+        description=cell("description"),
+        our_price=cell("our_price"),
+        supplier=cell("supplier"),
+        stock=cell("stock"),
+        file_id=cell("file_id"),
+    )
+
+class ProductSheetReader:
+    """
+    Условная и инкрементальная загрузка листа Products.
+    Сначала сверяет ревизию и не скачивает лист, если она не менялась.
+    При изменениях заново разбирает только изменившиеся строки.
+
+    Ревизия — ячейка revision_cell листа Products (одна ячейка вместо всего листа),
+    а без неё — modifiedTime всей таблицы (Drive API). Его меняют и добавленные
+    заказы, и списания остатков, так что под нагрузкой лист скачивается почти
+    при каждом обновлении; долю пропусков видно в метрике
+    catalog_refresh_seconds{result="unchanged"}.
+    """
+
+    def __init__(self, spreadsheet, revision_cell=PRODUCTS_REVISION_CELL):
+        self.spreadsheet = spreadsheet
+        self.revision_cell = revision_cell
+        self.revision = None
+        self._rows = {}  # сырая строка -> Product (None для неактивных)
+        self._columns = None
+        self._lock = threading.Lock()
+
+    def get_revision(self):
+        """Ревизия листа; None — неизвестна, и лист скачивается"""
+        try:
+            if self.revision_cell:
+                return get_products_sheet(self.spreadsheet).acell(self.revision_cell).value or None
+            return self.spreadsheet.get_lastUpdateTime()
+        except Exception as e:
+            print(f"⚠️ Не удалось получить ревизию листа Products: {e}")
+            return None
+
+    def load(self, force=False):
+        """
+        Возвращает список Product или None, если лист не менялся с прошлой загрузки.
+        """
+        with self._lock:
+            return self._load(force)
+
+    def _load(self, force):
+        revision = self.get_revision()
+        if not force and revision is not None and revision == self.revision:
+            return None
+
+        products_sheet = get_products_sheet(self.spreadsheet)
+        values = products_sheet.get_all_values()
+        header = [str(h).strip() for h in values[0]] if values else []
+        columns = {}
+        for i, name in enumerate(header):
+            columns.setdefault(name, i)
+        if columns != self._columns:
+            self._rows = {}
+            self._columns = columns
+
+        rows = {}
+        parsed = 0
         products = []
-        for rec in records:
-            # Проверяем active (может быть TRUE/True/true/1)
-            active = str(rec.get("active", "")).strip().upper()
-            if active in ["TRUE", "1", "YES"]:
-                products.append({
-                    "id": str(rec.get("id", "")).strip(),
-                    "parent_id": str(rec.get("parent_id", "")).strip(),
-                    "category": str(rec.get("category", "")).strip(),
-                    "name": str(rec.get("name", "")).strip(),
-                    "variant_label": str(rec.get("variant_label", "")).strip(),
-                    "price": str(rec.get("price", "")).strip(),
-                    "description": str(rec.get("description", "")).strip(),
-                    "our_price": str(rec.get("our_price", "")).strip(),
-                    "supplier": str(rec.get("supplier", "")).strip(),
-                    "stock": str(rec.get("stock", "")).strip(),
-                    "file_id": str(rec.get("file_id", "")).strip(),
-                })
-        
-        print(f"📦 Загружено {len(products)} активных товаров из Products")
+        for raw in values[1:]:
+            key = tuple(raw)
+            if key in rows:
+                product = rows[key]
+            elif key in self._rows:
+                product = self._rows[key]
+            else:
+                product = _product_from_row(columns, raw)
+                parsed += 1
+            rows[key] = product
+            if product is not None:
+                products.append(product)
+        removed = len(self._rows.keys() - rows.keys())
+        self._rows = rows
+        self.revision = revision
+
+        print(f"📦 Загружено {len(products)} активных товаров из Products "
+              f"(новых или изменённых строк: {parsed}, устаревших: {removed})")
         return products
-    except Exception as e:
-        print(f"❌ Ошибка загрузки товаров: {e}")
-        return []
 
-def update_product_photo(spreadsheet, product_id, file_id):
+    def column(self, name, default):
+        """Номер колонки (1-based) по заголовку"""
+        columns = self._columns or {}
+        return columns[name] + 1 if name in columns else default
+
+def load_products(spreadsheet):
     """
-    Обновляет file_id для товара с указанным id
+    Загружает все товары из листа Products
+    Возвращает список записей Product с полной информацией о товарах.
+    Ошибки не глотаются: пустой список стёр бы рабочий каталог.
+    """
+    return ProductSheetReader(spreadsheet).load(force=True)
+
+def load_quiz_weights(spreadsheet, title="QuizWeights"):
     """
+    Веса ответов квиза из листа title: {подпись ответа: {масло: вес}}.
+    Первая колонка — подпись ответа, остальные — ключи масел в заголовке.
+    None — если такого листа нет (используются веса по умолчанию).
+    Ошибки чтения (сеть, квоты) пробрасываются: их нельзя принимать
+    за отсутствие листа, иначе подобранные веса сбросятся на умолчания.
+    """
+    from gspread.utils import numericise
+
+    sheet = _cached_worksheet(spreadsheet, title, lambda: None)
+    if sheet is None:
+        return None
+    values = sheet.get_all_values()
+    if not values:
+        return {}
+    header = [str(h).strip() for h in values[0]]
+    weights = {}
+    for row in values[1:]:
+        if not row or not str(row[0]).strip():
+            continue
+        row_weights = {}
+        for name, value in zip(header[1:], row[1:]):
+            value = numericise(str(value).strip().replace(",", "."), empty2zero=True)
+            if name and isinstance(value, (int, float)):
+                row_weights[name] = value
+        weights[str(row[0]).strip()] = row_weights
+    return weights
+
+def _rows_by_id(id_values):
+    """id товара -> номер строки (1-based) по свежим значениям колонки id, включая заголовок"""
+    row_index = {}
+    for i, value in enumerate(id_values[1:], start=2):
+        row_index.setdefault(str(value).strip(), i)
+    return row_index
+
+def update_product_photos(spreadsheet, photos, reader=None):
+    """
+    Записывает file_id для нескольких товаров одним пакетным запросом.
+    photos — словарь {id товара: file_id}. Строки ищутся по свежей колонке id
+    (одно чтение): индекс с прошлой загрузки каталога мог устареть, если
+    в лист вставили строки. reader даёт только номера колонок.
+    Возвращает список обновлённых id; при ошибке запроса — исключение.
+    """
+    from gspread.utils import rowcol_to_a1
+
     try:
         products_sheet = get_products_sheet(spreadsheet)
-        all_values = products_sheet.get_all_values()
-        
-        # Найти строку с нужным id (первая колонка)
-        for i, row in enumerate(all_values):
-            if i == 0:  # Пропускаем заголовок
+        photos = {str(pid).strip(): fid for pid, fid in photos.items()}
+        id_col = reader.column("id", 1) if reader else 1
+        # Обновляем колонку file_id (по умолчанию K)
+        file_col = reader.column("file_id", 11) if reader else 11
+        row_index = _rows_by_id(products_sheet.col_values(id_col))
+
+        updates = []
+        updated = []
+        for pid, file_id in photos.items():
+            row = row_index.get(pid)
+            if row is None:
+                print(f"⚠️ Товар с ID={pid} не найден")
                 continue
-            if str(row[0]).strip() == str(product_id).strip():
-                # Обновляем колонку file_id (индекс 10, т.е. K)
-                products_sheet.update_cell(i + 1, 11, file_id)
-                print(f"✅ Обновлено фото для товара ID={product_id}")
-                return True
-        
-        print(f"⚠️ Товар с ID={product_id} не найден")
-        return False
+            updates.append({"range": rowcol_to_a1(row, file_col), "values": [[file_id]]})
+            updated.append(pid)
+        if updates:
+            products_sheet.batch_update(updates)
+            print(f"✅ Обновлено фото для товаров: {', '.join(updated)}")
+        return updated
     except Exception as e:
         print(f"❌ Ошибка обновления фото: {e}")
-        return False
+        raise
+
+def _column_letter(col):
+    from gspread.utils import rowcol_to_a1
+
+    return rowcol_to_a1(1, col).rstrip("0123456789")
+
+def update_product_stock(spreadsheet, decrements, reader=None):
+    """
+    Списывает проданное из колонки stock: одно чтение колонок id и stock
+    вместе (batch_get) и один пакетный запрос записи. decrements — словарь
+    {id товара: количество}. Строки ищутся по свежим id, а вычитание идёт
+    из текущего значения ячейки, так что вставленные строки и ручные правки
+    остатка в таблице не мешают. reader даёт только номера колонок.
+    Возвращает {id: новый остаток}; None — остаток товара не ведётся.
+    Товаров, которых нет в листе, в ответе нет: их списание остаётся в журнале.
+    """
+    from gspread.utils import rowcol_to_a1
+
+    products_sheet = get_products_sheet(spreadsheet)
+    id_col = reader.column("id", 1) if reader else 1
+    stock_col = reader.column("stock", 10) if reader else 10
+    decrements = {str(pid).strip(): qty for pid, qty in decrements.items()}
+    id_letter, stock_letter = _column_letter(id_col), _column_letter(stock_col)
+    ids, stock = products_sheet.batch_get([f"{id_letter}:{id_letter}", f"{stock_letter}:{stock_letter}"])
+    row_index = _rows_by_id([r[0] if r else "" for r in ids])
+
+    updates = []
+    result = {}
+    for pid, qty in decrements.items():
+        row = row_index.get(pid)
+        if row is None:
+            print(f"⚠️ Товар ID={pid} не найден в таблице, списание {qty} шт. отложено")
+            continue
+        cell = stock[row - 1] if row <= len(stock) else []
+        current = parse_stock(cell[0]) if cell else None
+        if current is None:
+            print(f"⚠️ Остаток товара ID={pid} в таблице не ведётся, списание {qty} шт. пропущено")
+            result[pid] = None
+            continue
+        if qty > current:
+            print(f"⚠️ Товар ID={pid}: продано {qty} шт. при остатке {current} в таблице")
+        result[pid] = max(current - qty, 0)
+        updates.append({"range": rowcol_to_a1(row, stock_col), "values": [[result[pid]]]})
+    if updates:
+        products_sheet.batch_update(updates)
+    return result
@@ -1,127 +1,499 @@
 import os
+import math
+import time
 import asyncio
-import datetime
-from flask import Flask, request
-from aiogram import Bot, Dispatcher, Router, types, F
+from aiohttp import web
+from aiogram import Bot, Dispatcher, Router, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
 from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton,
-    ReplyKeyboardMarkup, KeyboardButton, Message, CallbackQuery
+    ReplyKeyboardMarkup, KeyboardButton, Message, CallbackQuery, InlineQuery
 )
 
-from google_sheets import (
-    connect_to_sheet, add_order, get_orders,
-    load_products, update_product_photo
+from google_sheets import build_order_row, new_order_id, ProductSheetReader, breaker as sheets_breaker
+from config import (
+    BOT_TOKEN, ADMIN_CHAT_ID, WEBHOOK_MAX_IN_FLIGHT, PORT, SHEETS_BREAKER_OPEN_SECONDS,
+    ORDER_QUEUE_PATH, ORDER_FLUSH_INTERVAL, CATALOG_REFRESH_TTL, STOCK_LEDGER_PATH, STOCK_SYNC_INTERVAL,
+    STATE_BACKEND, STATE_PATH, STATE_MAX_ENTRIES, STATE_PURGE_INTERVAL,
+    CATALOG_SNAPSHOT_PATH, QUIZ_WEIGHTS_PATH, SNAPSHOT_POLL_INTERVAL, UPDATE_DEDUP_TTL,
+    TELEGRAM_API_URL, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE_PER_MIN,
+    TELEGRAM_OUTBOUND_RETRIES, TELEGRAM_INTERACTIVE_RESERVE,
+    REMINDER_DAYS, REMINDER_CONCURRENCY, REMINDERS_LEDGER_PATH, ORDER_INDEX_PATH, SALES_PATH,
+    NOTIFY_CHAT_IDS, NOTIFY_RETRIES, CART_TTL, CART_EDIT_DELAY, INLINE_CACHE_TIME, MEDIA_VALID_TTL, MEDIA_BROKEN_TTL, QUIZ_TTL, CHECKOUT_TTL, PROFILE_TTL
 )
-from config import BOT_TOKEN, ADMIN_CHAT_ID, GROUP_CHAT_ID
+from webhook_server import UpdateFeeder
+from order_queue import OrderQueue
+from stock import StockLedger
+import sheets_async
+from state_store import create_store
+import callback_codec
+import cart
+import catalog
+import catalog_views
+import quiz
+from quiz import QUIZ_QUESTIONS, OIL_EMOJI
+from rate_limit import ChatRateLimiter
+from reminders import ReminderJob, ReminderLedger
+from order_index import OrderIndex
+from sales import SalesLedger
+from notifications import NotificationDispatcher
+from text_router import TextRouter
+from oils_data import OILS
+import media
+import metrics
+import outbound
+import search
 
 # --- Инициализация ---
-bot = Bot(token=BOT_TOKEN)
+bot = Bot(
+    token=BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+)
 router = Router()
 dp = Dispatcher()
 dp.include_router(router)
-app = Flask(__name__)
+router.message.middleware(metrics.HandlerMetricsMiddleware())
+router.callback_query.middleware(metrics.HandlerMetricsMiddleware())
+router.inline_query.middleware(metrics.HandlerMetricsMiddleware())
+
+
+def telegram_limiter(processes=1):
+    """
+    Лимиты Telegram общие на бота. Если отправляют несколько процессов
+    (python workers.py), каждый получает свою долю скорости и запаса.
+    """
+    return ChatRateLimiter(
+        global_rate=TELEGRAM_GLOBAL_RATE / processes,
+        chat_rate=TELEGRAM_CHAT_RATE / processes,
+        group_rate_per_min=TELEGRAM_GROUP_RATE_PER_MIN / processes,
+        chat_burst=max(3 // processes, 1)
+    )
+
+
+def share_telegram_limits(processes):
+    """Доля лимитов Telegram для этого процесса, когда отправляют processes процессов"""
+    outbound_queue.set_limiter(telegram_limiter(processes), math.ceil(TELEGRAM_INTERACTIVE_RESERVE / processes))
+
+
+# Все исходящие запросы — через очередь с приоритетами под лимитами Telegram
+outbound_queue = outbound.OutboundQueue(
+    telegram_limiter(),
+    retries=TELEGRAM_OUTBOUND_RETRIES,
+    reserve=TELEGRAM_INTERACTIVE_RESERVE
+)
+bot.session.middleware(outbound_queue)
+bot.session.middleware(metrics.TelegramMetricsMiddleware())
+feeder = UpdateFeeder(dp, bot, max_in_flight=WEBHOOK_MAX_IN_FLIGHT)
+routes = web.RouteTableDef()
+text_router = TextRouter()
+order_notifier = NotificationDispatcher(bot, NOTIFY_CHAT_IDS, retries=NOTIFY_RETRIES)
+cart_editor = cart.CartEditor(bot, delay=CART_EDIT_DELAY)
 
 BOT_URL = os.getenv("BOT_URL", "https://universal-bot-eb3x.onrender.com")
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
 WEBHOOK_URL = f"{BOT_URL}{WEBHOOK_PATH}"
 
 # Главное меню
+MAIN_MENU = ReplyKeyboardMarkup(resize_keyboard=True, keyboard=[
+    [KeyboardButton(text="🌿 Каталог")],
+    [KeyboardButton(text="🧩 Подбор масла"), KeyboardButton(text="🛒 Корзина")]
+])
+EMPTY_CART_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🌿 Вернуться в каталог", callback_data="back_to_catalog")]
+])
+
+
 def get_main_menu():
-    kb = ReplyKeyboardMarkup(resize_keyboard=True, keyboard=[
-        [KeyboardButton(text="🌿 Каталог")],
-        [KeyboardButton(text="🧩 Подбор масла"), KeyboardButton(text="🛒 Корзина")]
-    ])
-    return kb
+    return MAIN_MENU
+
+# Данные (состояние пользователей с ограниченным сроком жизни)
+state = create_store(STATE_BACKEND, STATE_PATH, STATE_MAX_ENTRIES)
+user_carts = state.namespace("carts", ttl=CART_TTL)
+pending_phone = state.namespace("pending_phone", ttl=CHECKOUT_TTL)
+user_profiles = state.namespace("profiles", ttl=PROFILE_TTL)
+user_quiz = state.namespace("quiz", ttl=QUIZ_TTL)
+admin_waiting_photo = state.namespace("admin_photo", ttl=CHECKOUT_TTL)
+# Состояние диалога: чего бот ждёт от пользователя в обычном текстовом сообщении
+dialog_state = state.namespace("dialog", ttl=CHECKOUT_TTL)
+IDLE = "idle"
+QUIZ = "quiz"
+AWAITING_ADDRESS = "address"
+AWAITING_PHONE = "phone"
+AWAITING_PHOTO_IDS = "photo_ids"
+# Состояния, где навигация по главному меню доступна и по короткой форме ("каталог")
+NAV_STATES = (IDLE, QUIZ, AWAITING_PHONE, AWAITING_PHOTO_IDS)
+# Уже принятые update_id: Telegram повторяет вебхук, если не дождался ответа
+seen_updates = state.namespace("update_ids", ttl=UPDATE_DEDUP_TTL)
+# Проверенные и битые file_id фото товаров
+media_state = state.namespace("media")
+media_cache = media.MediaCache(bot, media_state, valid_ttl=MEDIA_VALID_TTL, broken_ttl=MEDIA_BROKEN_TTL)
+for _ns in (user_carts, pending_phone, user_profiles, user_quiz, admin_waiting_photo, dialog_state, seen_updates,
+            media_state):
+    metrics.STATE_ENTRIES.set_function(_ns.__len__, namespace=_ns.name)
+
+# Google Sheets: подключение в фоне после старта (connect_sheets) или при первом обращении
+spreadsheet = None
+products_reader = None
+sheets_lock = asyncio.Lock()
+order_queue = OrderQueue(ORDER_QUEUE_PATH, flush_interval=ORDER_FLUSH_INTERVAL)
+order_index = OrderIndex(ORDER_INDEX_PATH)
+sales_ledger = SalesLedger(SALES_PATH)
+stock_ledger = StockLedger(STOCK_LEDGER_PATH, ttl=CART_TTL, sync_interval=STOCK_SYNC_INTERVAL)
+metrics.ORDERS_PENDING.set_function(order_queue.pending_count)
+metrics.STOCK_PENDING.set_function(lambda: len(stock_ledger.pending()))
+metrics.SHEETS_CIRCUIT.set_function(
+    lambda: {sheets_breaker.CLOSED: 0, sheets_breaker.HALF_OPEN: 1}.get(sheets_breaker.state, 2)
+)
+metrics.CATALOG_PRODUCTS.set_function(lambda: len(catalog.current()))
+
+
+async def get_spreadsheet():
+    """Таблица Google Sheets; при первом вызове подключается к ней"""
+    global spreadsheet, products_reader
+    if spreadsheet is None:
+        async with sheets_lock:
+            if spreadsheet is None:
+                connected = await sheets_async.connect_to_sheet()
+                products_reader = ProductSheetReader(connected)
+                spreadsheet = connected
+                print("✅ Google Sheets подключены")
+    return spreadsheet
+
+
+async def write_orders(rows):
+    await sheets_async.append_orders(await get_spreadsheet(), rows)
+
+
+async def write_stock(decrements):
+    """Списывает продажи в колонке stock и сразу переносит новые остатки в каталог"""
+    written = await sheets_async.update_product_stock(await get_spreadsheet(), decrements, products_reader)
+    changes = {pid: {"stock": str(value)} for pid, value in written.items() if value is not None}
+    if changes:
+        patch_products(changes)
+    return written
+
+
+def publish_products(products, save=True):
+    previous = catalog.current()
+    snapshot = catalog.publish(products)
+    catalog_views.for_catalog(snapshot)
+    search.for_catalog(snapshot)
+    if save and snapshot is not previous:
+        save_catalog_snapshot(snapshot)
+    print(f"🔄 Кэш обновлён: {len(snapshot)} товаров")
+    return snapshot
+
+
+def patch_products(changes):
+    previous = catalog.current()
+    snapshot = catalog.patch(changes)
+    catalog_views.for_catalog(snapshot)
+    search.for_catalog(snapshot)
+    # Новые остатки после списания уже в журнале; снимок на диске нужен, только если изменились карточки
+    if snapshot.version != previous.version:
+        save_catalog_snapshot(snapshot)
+    return snapshot
+
+
+def publish_quiz_weights(weights, save=True):
+    scorer = quiz.current()
+    if quiz.publish(weights) is not scorer and save:
+        try:
+            quiz.save(weights, QUIZ_WEIGHTS_PATH)
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить веса квиза: {e}")
 
-# Данные
-user_carts = {}
-pending_address = {}
-pending_phone = {}
-user_profiles = {}
-user_quiz = {}
-admin_waiting_photo = {}
 
-# Google Sheets
-spreadsheet = connect_to_sheet()
-products_cache = []
+_snapshot_mtime = 0
+_weights_mtime = 0
 
 
-def refresh_products():
-    global products_cache
-    products_cache = load_products(spreadsheet)
-    print(f"🔄 Кэш обновлён: {len(products_cache)} товаров")
+def save_catalog_snapshot(snapshot):
+    """Общий снимок каталога на диске для остальных процессов бота"""
+    global _snapshot_mtime
+    try:
+        catalog.save(snapshot, CATALOG_SNAPSHOT_PATH)
+        _snapshot_mtime = os.stat(CATALOG_SNAPSHOT_PATH).st_mtime
+    except Exception as e:
+        print(f"⚠️ Не удалось сохранить снимок каталога: {e}")
 
 
-refresh_products()
+async def watch_catalog_snapshot():
+    """Подхватывает снимок каталога и веса квиза, записанные другим процессом"""
+    global _snapshot_mtime, _weights_mtime
+    while True:
+        await asyncio.sleep(SNAPSHOT_POLL_INTERVAL)
+        try:
+            mtime = os.stat(CATALOG_SNAPSHOT_PATH).st_mtime
+            if mtime != _snapshot_mtime:
+                _snapshot_mtime = mtime
+                publish_products(catalog.load(CATALOG_SNAPSHOT_PATH), save=False)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Ошибка чтения снимка каталога: {e}")
+        try:
+            mtime = os.stat(QUIZ_WEIGHTS_PATH).st_mtime
+            if mtime != _weights_mtime:
+                _weights_mtime = mtime
+                publish_quiz_weights(quiz.load(QUIZ_WEIGHTS_PATH), save=False)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Ошибка чтения весов квиза: {e}")
 
-# --- Структура каталога ---
-def get_categories():
-    categories = {}
-    for p in products_cache:
-        if not p["parent_id"]:
-            cat = p["category"]
-            if cat not in categories:
-                categories[cat] = {
-                    "id": p["id"],
-                    "name": p["name"],
-                    "description": p["description"],
-                    "file_id": p["file_id"]
-                }
-    return categories
+
+def load_local_catalog():
+    """
+    Каталог для мгновенного старта без Google Sheets: снимок на диске,
+    а если его нет — встроенный справочник oils_data.
+    """
+    global _snapshot_mtime, _weights_mtime
+    try:
+        products = catalog.load(CATALOG_SNAPSHOT_PATH)
+        _snapshot_mtime = os.stat(CATALOG_SNAPSHOT_PATH).st_mtime
+        print("💾 Каталог загружен из снимка на диске")
+    except Exception as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"⚠️ Ошибка чтения снимка каталога: {e}")
+        products = catalog.from_oils(OILS)
+        print("💾 Снимка каталога нет, используется встроенный справочник масел")
+    try:
+        publish_quiz_weights(quiz.load(QUIZ_WEIGHTS_PATH), save=False)
+        _weights_mtime = os.stat(QUIZ_WEIGHTS_PATH).st_mtime
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Ошибка чтения весов квиза: {e}")
+    return publish_products(products, save=False)
 
 
-def get_products_by_parent(parent_id):
-    return [p for p in products_cache if p["parent_id"] == str(parent_id)]
+# Последняя ошибка обновления каталога (None — обновился успешно)
+catalog_refresh_error = None
+
+
+async def refresh_products_async(force=False):
+    """
+    Перечитывает каталог, только если лист Products изменился (или force=True).
+    Если таблица недоступна, остаётся последний удачный снимок каталога.
+    """
+    global catalog_refresh_error
+    started = time.perf_counter()
+    # Списание остатков ждёт: иначе остаток, прочитанный до него, вернул бы проданное в базу
+    async with stock_ledger.sync_lock:
+        try:
+            await get_spreadsheet()
+            products = await sheets_async.load_products_if_changed(products_reader, force)
+        except Exception as e:
+            catalog_refresh_error = str(e)
+            metrics.CATALOG_REFRESH_SECONDS.observe(time.perf_counter() - started, result="error")
+            print(f"❌ Ошибка загрузки товаров, остаётся сохранённый каталог: {e}")
+            return catalog.current()
+        catalog_refresh_error = None
+        if products is None:
+            metrics.CATALOG_REFRESH_SECONDS.observe(time.perf_counter() - started, result="unchanged")
+            return catalog.current()
+        # Веса квиза лежат в той же таблице: перечитываем их вместе с каталогом.
+        # При ошибке чтения остаются текущие веса (и их файл для других процессов)
+        try:
+            weights = await sheets_async.load_quiz_weights(spreadsheet)
+        except Exception as e:
+            print(f"⚠️ Ошибка загрузки весов квиза, оставляю текущие: {e}")
+        else:
+            publish_quiz_weights(weights)
+        try:
+            snapshot = publish_products(products)
+            stock_ledger.set_base(snapshot.products)
+            media_cache.validate_catalog(snapshot)
+        except Exception as e:
+            # Лист уже прочитан: сбрасываем его ревизию, чтобы следующее обновление скачало его заново
+            products_reader.revision = None
+            catalog_refresh_error = str(e)
+            metrics.CATALOG_REFRESH_SECONDS.observe(time.perf_counter() - started, result="error")
+            print(f"❌ Ошибка публикации каталога, остаётся текущий: {e}")
+            return catalog.current()
+        metrics.CATALOG_REFRESH_SECONDS.observe(time.perf_counter() - started, result="updated")
+        return snapshot
+
+
+async def refresh_products_safe(force=False):
+    """Обновление каталога для фоновых циклов: ошибка не должна останавливать цикл"""
+    try:
+        await refresh_products_async(force)
+    except Exception as e:
+        print(f"⚠️ Не удалось обновить каталог: {e}")
+
+
+async def purge_expired_state():
+    while True:
+        await asyncio.sleep(STATE_PURGE_INTERVAL)
+        try:
+            removed = state.purge_expired() + stock_ledger.purge_expired()
+        except Exception as e:
+            print(f"⚠️ Ошибка очистки устаревшего состояния, повтор через {STATE_PURGE_INTERVAL} c: {e}")
+            continue
+        if removed:
+            print(f"🧹 Удалено устаревших записей состояния: {removed}")
+
+
+async def auto_refresh_catalog():
+    while True:
+        await asyncio.sleep(CATALOG_REFRESH_TTL)
+        await refresh_products_safe()
+
+
+async def connect_sheets(max_backoff=60):
+    """
+    Фоновое подключение к Google Sheets после старта: пока его нет,
+    бот работает с локальным каталогом, а заказы ждут в очереди.
+    """
+    backoff = 1
+    while True:
+        try:
+            await get_spreadsheet()
+            break
+        except Exception as e:
+            print(f"⚠️ Нет подключения к Google Sheets: {e}. Повтор через {backoff} с")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+    await refresh_products_safe(force=True)
+    await sync_order_index_safe()
+
+
+async def probe_sheets():
+    """Пока автомат защиты разомкнут, периодически проверяет, ожила ли таблица"""
+    while True:
+        await asyncio.sleep(SHEETS_BREAKER_OPEN_SECONDS)
+        if spreadsheet is None or sheets_breaker.available:
+            continue
+        try:
+            await sheets_async.probe(spreadsheet)
+        except Exception:
+            continue
+        await refresh_products_safe()
+
+
+load_local_catalog()
+
+# --- Структура каталога ---
+def get_catalog_views():
+    return catalog_views.for_catalog(catalog.current())
 
 
 def get_product_by_id(product_id):
-    for p in products_cache:
-        if p["id"] == str(product_id):
-            return p
-    return None
+    return catalog.current().get(product_id)
+
+# --- HTTP routes ---
 
-# --- Flask routes ---
 
+@routes.get("/")
+async def home(request):
+    return web.Response(text="✅ HION Bot is running with Google Sheets catalog.")
 
-@app.route("/")
-def home():
-    return "✅ HION Bot is running with Google Sheets catalog."
 
+@routes.get("/metrics")
+async def metrics_page(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
 
-@app.route(WEBHOOK_PATH, methods=["POST"])
-def webhook():
+
+@routes.post(WEBHOOK_PATH)
+async def webhook(request):
     try:
-        update_data = request.get_json(force=True)
-        update = types.Update(**update_data)
-        asyncio.run(dp.feed_update(bot, update))
+        update_data = await request.json()
+        update_id = update_data.get("update_id")
+        if update_id is None or seen_updates.add(update_id):
+            request.app["feeder"].submit(update_data)
     except Exception as e:
         print(f"❌ Webhook error: {e}")
-    return "OK", 200
+    return web.Response(text="OK")
+
+
+reminder_ledger = ReminderLedger(REMINDERS_LEDGER_PATH)
+reminder_job = None
+
 
+async def sync_order_index():
+    """Догружает в локальный индекс строки Orders, добавленные после прошлой синхронизации"""
+    start_row = order_index.synced_rows + 1
+    rows = await sheets_async.get_order_rows(await get_spreadsheet(), start_row)
+    order_index.ingest(rows, start_row)
 
-@app.route("/remind")
-def remind_users():
+
+async def sync_order_index_safe():
     try:
-        orders = get_orders(spreadsheet)
-        today = datetime.datetime.now().date()
-        for order in orders:
-            if "@" not in order["Клиент"]:
-                continue
-            date_str = order["Время"].split(" ")[0]
-            order_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-            if (today - order_date).days == 30:
-                asyncio.run(bot.send_message(order["Клиент"], "🌿 Как вам масло? Пора обновить курс 💛"))
-        return "Reminders sent", 200
+        await sync_order_index()
     except Exception as e:
-        print(f"❌ Reminder error: {e}")
-        return str(e), 500
+        print(f"⚠️ Не удалось синхронизировать индекс заказов: {e}")
+
+
+async def load_reminder_recipients(day):
+    await sync_order_index_safe()
+    return order_index.reminder_targets(day)
 
 
-@app.route("/refresh")
-def refresh_catalog():
-    refresh_products()
-    return f"✅ Каталог обновлён: {len(products_cache)} товаров", 200
+async def report_reminders(job):
+    p = job.progress()
+    try:
+        with outbound.priority(outbound.ADMIN):
+            await bot.send_message(
+                ADMIN_CHAT_ID,
+                f"📬 Напоминания за {p['order_day']}: отправлено {p['sent']}, "
+                f"уже были отправлены {p['skipped']}, ошибок {p['failed']}"
+            )
+    except Exception as e:
+        print(f"⚠️ Не удалось отправить отчёт о напоминаниях: {e}")
+
+
+@routes.get("/remind")
+async def remind_users(request):
+    """Запускает рассылку в фоне (если она ещё не идёт) и возвращает её прогресс"""
+    global reminder_job
+    if reminder_job is None or reminder_job.finished:
+        # Скорость рассылки ограничивает очередь отправки: напоминания идут в ней последними
+        reminder_job = ReminderJob(
+            bot, reminder_ledger,
+            days=REMINDER_DAYS, concurrency=REMINDER_CONCURRENCY
+        )
+        with outbound.priority(outbound.BULK):
+            reminder_job.start(load_reminder_recipients, on_done=report_reminders)
+    status = 200 if reminder_job.finished else 202
+    return web.json_response(reminder_job.progress(), status=status)
+
+
+@routes.get("/refresh")
+async def refresh_catalog(request):
+    snapshot = await refresh_products_async(force=True)
+    if catalog_refresh_error:
+        return web.Response(
+            text=f"⚠️ Таблица недоступна, работает сохранённый каталог ({len(snapshot)} товаров): "
+                 f"{catalog_refresh_error}",
+            status=503
+        )
+    return web.Response(text=f"✅ Каталог обновлён: {len(snapshot)} товаров")
+
+
+@routes.get("/health")
+async def health(request):
+    """
+    Состояние бота для мониторинга. Недоступность Google Sheets — это
+    деградация (status=degraded), а не отказ: каталог и оформление заказов работают.
+    """
+    sheets = sheets_breaker.health()
+    sheets["connected"] = spreadsheet is not None
+    degraded = not sheets["connected"] or not sheets_breaker.available or catalog_refresh_error is not None
+    return web.json_response({
+        "status": "degraded" if degraded else "ok",
+        "sheets": sheets,
+        "catalog": {
+            "products": len(catalog.current()),
+            "version": catalog.current().version,
+            "refresh_error": catalog_refresh_error,
+        },
+        "orders_pending": order_queue.pending_count(),
+        "updates_pending": request.app["feeder"].pending,
+    })
 
 # --- Aiogram Handlers (router) ---
 
@@ -136,127 +508,129 @@ async def start(message: Message):
     )
 
 
-@router.message(F.text.lower().contains("каталог"))
+@text_router.button("🌿 Каталог", states=NAV_STATES)
+@text_router.button("🌿 Каталог", states=(AWAITING_ADDRESS,), exact=True)
 async def open_catalog(message: Message):
-    categories = get_categories()
-    if not categories:
+    views = get_catalog_views()
+    if not views.snapshot.categories:
         await message.answer("⚠️ Каталог пуст. Обновите товары в Google Sheets.")
         return
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"🌿 {cat_data['name']}", callback_data=f"cat|{cat_data['id']}")]
-        for _, cat_data in categories.items()
-    ])
-    await message.answer("🌿 Выберите категорию:", reply_markup=markup)
+    await message.answer(catalog_views.CATALOG_PROMPT, reply_markup=views.menu)
 
 
 @router.callback_query(F.data.startswith("cat|"))
 async def show_category(callback: CallbackQuery):
     cat_id = callback.data.split("|")[1]
-    product = get_product_by_id(cat_id)
-    if not product:
+    view = get_catalog_views().category(cat_id)
+    if not view:
         await callback.answer("❌ Категория не найдена")
         return
-    variants = get_products_by_parent(cat_id)
-    text = f"*{product['name']}*\n\n{product['description']}"
-    buttons = []
-    for var in variants:
-        if var["variant_label"] and var["price"]:
-            buttons.append([InlineKeyboardButton(
-                text=f"{var['variant_label']} — {var['price']}₽",
-                callback_data=f"add|{var['id']}|{var['variant_label']}|{var['price']}"
-            )])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад в каталог", callback_data="back_to_catalog")])
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-    if product["file_id"]:
-        try:
-            await callback.message.delete()
-            await bot.send_photo(
-                callback.from_user.id,
-                photo=product["file_id"],
-                caption=text,
-                parse_mode="Markdown",
-                reply_markup=markup
-            )
-        except Exception as e:
-            print(f"⚠️ Ошибка отправки фото: {e}")
-            await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=markup)
-    else:
-        await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=markup)
+    await media_cache.show(callback.message, view.product.file_id, view.text, view.markup)
 
 
 @router.callback_query(F.data == "back_to_catalog")
 async def back_to_catalog(callback: CallbackQuery):
-    categories = get_categories()
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"🌿 {cat_data['name']}", callback_data=f"cat|{cat_data['id']}")]
-        for _, cat_data in categories.items()
-    ])
-    try:
-        await callback.message.delete()
-        await bot.send_message(callback.from_user.id, "🌿 Выберите категорию:", reply_markup=markup)
-    except Exception:
-        await callback.message.edit_text("🌿 Выберите категорию:", reply_markup=markup)
+    await media_cache.show(callback.message, None, catalog_views.CATALOG_PROMPT, get_catalog_views().menu,
+                           parse_mode=None)
 
 
-@router.callback_query(F.data.startswith("add|"))
+@router.callback_query(F.data.startswith(callback_codec.PREFIX) | F.data.startswith("add|"))
 async def add_item(callback: CallbackQuery):
-    _, product_id, variant, price = callback.data.split("|")
+    if callback.data.startswith("add|"):
+        # Кнопки, отправленные до компактных callback_data: цене из них не доверяем
+        product_id, version = callback.data.split("|")[1], None
+    else:
+        try:
+            _, product_id, version = callback_codec.decode(callback.data)
+        except ValueError as e:
+            print(f"⚠️ {e}")
+            await callback.answer("❌ Кнопка устарела, откройте каталог заново")
+            return
     user_id = callback.from_user.id
-    product = get_product_by_id(product_id)
+    product, view = get_catalog_views().variant(product_id, version)
     if not product:
-        await callback.answer("❌ Товар не найден")
+        await callback.answer("❌ Этого товара больше нет в каталоге", show_alert=True)
         return
-    user_carts.setdefault(user_id, []).append({
-        "id": product_id,
-        "name": product["name"],
-        "variant": variant,
-        "price": int(price)
-    })
-    await callback.answer("✅ Товар добавлен в корзину")
-    await callback.message.answer(
-        "🛒 Товар добавлен в корзину!\nОткройте её для оформления 💛",
-        reply_markup=get_main_menu()
+    if not stock_ledger.reserve(user_id, product.id):
+        await callback.answer(f"😔 {product.variant_label} — закончился", show_alert=True)
+        return
+    items = cart.add(user_carts.get(user_id), product.id, product.name, product.variant_label, product.price)
+    user_carts[user_id] = items
+    await callback.answer(
+        f"✅ В корзине: {product.variant_label} — {product.price}₽ ({cart.count(items, product.id)} шт.)"
+    )
+    if view is not None and view.version != version and callback.message is not None:
+        # Карточка перерисована после обновления каталога — показываем актуальные цены
+        # (карточки из inline-поиска не трогаем: у них своя клавиатура)
+        try:
+            await callback.message.edit_reply_markup(reply_markup=view.markup)
+        except Exception as e:
+            print(f"⚠️ Не удалось обновить карточку товара: {e}")
+
+
+@router.inline_query()
+async def inline_search(query: InlineQuery):
+    """@бот запрос — поиск по каталогу из любого чата; индекс собирается при обновлении каталога"""
+    snapshot = catalog.current()
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    products, next_offset = search.for_catalog(snapshot).page(query.query, offset)
+    results = search.results_for(snapshot)
+    await query.answer(
+        [results.result(p, media_cache.usable(p.file_id)) for p in products],
+        cache_time=INLINE_CACHE_TIME, next_offset=next_offset
     )
 
 
-async def send_cart(user_id, message_obj):
-    cart = user_carts.get(user_id, [])
-    if not cart:
-        markup = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🌿 Вернуться в каталог", callback_data="back_to_catalog")]
-        ])
-        await message_obj.answer("🧺 Корзина пуста", reply_markup=markup)
-        return
-    total = sum(item["price"] for item in cart)
-    text = "\n".join(
-        [f"{i+1}. {item['name']} {item['variant']} — {item['price']}₽" for i, item in enumerate(cart)]
-    )
-    text += f"\n\n💰 Итого: {total}₽"
-    buttons = [[InlineKeyboardButton(text=f"❌ Удалить {i+1}", callback_data=f"remove|{i}")] for i in range(len(cart))]
-    buttons.append([InlineKeyboardButton(text="📦 Оформить заказ", callback_data="checkout")])
-    buttons.append([InlineKeyboardButton(text="🗑 Очистить корзину", callback_data="clear_cart")])
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-    await message_obj.answer(text, reply_markup=markup)
+def render_cart(user_id):
+    return cart.render(user_carts.get(user_id), EMPTY_CART_MARKUP)
 
 
-@router.message(F.text.lower().contains("корзин"))
+@text_router.button("🛒 Корзина", states=NAV_STATES)
+@text_router.button("🛒 Корзина", states=(AWAITING_ADDRESS,), exact=True)
 async def view_cart(message: Message):
-    await send_cart(message.from_user.id, message)
+    text, markup = render_cart(message.from_user.id)
+    await message.answer(text, reply_markup=markup)
 
 
-@router.callback_query(F.data.startswith("remove|"))
-async def remove_item(callback: CallbackQuery):
+@router.callback_query(F.data.regexp(r"^(inc|dec|del|remove)\|"))
+async def change_cart(callback: CallbackQuery):
+    """
+    +/−/❌ в сообщении корзины. Корзина меняется сразу, а сообщение
+    правится на месте одним отложенным edit_message_text на серию нажатий.
+    """
     user_id = callback.from_user.id
-    index = int(callback.data.split("|")[1])
-    if user_id in user_carts and 0 <= index < len(user_carts[user_id]):
-        user_carts[user_id].pop(index)
-    await callback.message.delete()
-    await send_cart(user_id, callback.message)
+    action, key = callback.data.split("|", 1)
+    items = cart.normalize(user_carts.get(user_id))
+    if action == "remove":
+        # Кнопки сообщений корзины, отправленных до перехода на позиции с количеством
+        lines = list(items)
+        key = lines[int(key)] if key.isdigit() and int(key) < len(lines) else None
+        action = "del"
+    if action == "inc":
+        if key in items and not stock_ledger.reserve(user_id, key):
+            await callback.answer("😔 Больше нет в наличии")
+            return
+        items = cart.change(items, key, 1)
+    elif action == "dec":
+        stock_ledger.release(user_id, key, 1)
+        items = cart.change(items, key, -1)
+    else:
+        stock_ledger.release(user_id, key)
+        items = cart.remove(items, key)
+    if items:
+        user_carts[user_id] = items
+    else:
+        user_carts.pop(user_id)
+    await callback.answer()
+    message = callback.message
+    cart_editor.schedule(message.chat.id, message.message_id, lambda: render_cart(user_id))
 
 
 @router.callback_query(F.data == "clear_cart")
 async def clear_cart(callback: CallbackQuery):
-    user_carts[callback.from_user.id] = []
+    user_carts.pop(callback.from_user.id)
+    stock_ledger.release_all(callback.from_user.id)
+    cart_editor.forget(callback.message.chat.id, callback.message.message_id)
     markup = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="⬅️ Назад в каталог", callback_data="back_to_catalog")]
     ])
@@ -266,12 +640,23 @@ async def clear_cart(callback: CallbackQuery):
 @router.callback_query(F.data == "checkout")
 async def checkout(callback: CallbackQuery):
     user_id = callback.from_user.id
-    cart = user_carts.get(user_id, [])
-    if not cart:
-        markup = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🌿 Вернуться в каталог", callback_data="back_to_catalog")]
-        ])
-        await callback.message.edit_text("🧺 Корзина пуста.", reply_markup=markup)
+    cart_editor.forget(callback.message.chat.id, callback.message.message_id)
+    items = user_carts.get(user_id)
+    if not items:
+        await callback.message.edit_text("🧺 Корзина пуста.", reply_markup=EMPTY_CART_MARKUP)
+        return
+    # Резервы приводятся к корзине: старые корзины и истёкшие резервы резервируются заново
+    wanted = {line["id"]: line["qty"] for line in cart.lines(items)}
+    granted = stock_ledger.reconcile(user_id, wanted, release_others=True)
+    if any(granted[pid] < qty for pid, qty in wanted.items()):
+        items = cart.limit(items, granted)
+        if items:
+            user_carts[user_id] = items
+        else:
+            user_carts.pop(user_id)
+        text, markup = render_cart(user_id)
+        await callback.answer("😔 Часть товаров закончилась, корзина обновлена", show_alert=True)
+        await callback.message.edit_text(text, reply_markup=markup)
         return
     text = (
         "🚚 Как удобнее получить заказ?\n\n"
@@ -290,15 +675,20 @@ async def checkout(callback: CallbackQuery):
 async def choose_delivery(callback: CallbackQuery):
     user_id = callback.from_user.id
     if callback.data == "pickup":
-        await ask_phone(callback.message, "Самовывоз — ул. Гостиева, 8")
+        await ask_phone(callback.message, "Самовывоз — ул. Гостиева, 8", user_id)
     else:
-        pending_address[user_id] = True
+        dialog_state[user_id] = AWAITING_ADDRESS
         await callback.message.edit_text("📍 Напишите адрес доставки (улица, дом, квартира) 💌:")
 
 
-async def ask_phone(message, address):
-    user_id = message.from_user.id
+@text_router.fallback(AWAITING_ADDRESS)
+async def receive_address(message: Message):
+    await ask_phone(message, message.text.strip(), message.from_user.id)
+
+
+async def ask_phone(message, address, user_id):
     pending_phone[user_id] = address
+    dialog_state[user_id] = AWAITING_PHONE
     kb = ReplyKeyboardMarkup(
         resize_keyboard=True,
         one_time_keyboard=True,
@@ -312,72 +702,68 @@ async def handle_contact(message: Message):
     user_id = message.from_user.id
     phone = message.contact.phone_number
     address = pending_phone.pop(user_id, "—")
+    dialog_state.pop(user_id)
     await finalize_order(message, address, phone)
 
 
 async def finalize_order(message, address, phone):
     user_id = message.from_user.id
-    cart = user_carts.get(user_id, [])
-    total = sum(item["price"] for item in cart)
-    items = "; ".join(
-        [f"{item['name']} {item['variant']} — {item['price']}₽" for item in cart]
-    )
+    items_in_cart = user_carts.get(user_id)
+    if not items_in_cart:
+        await message.answer("🧺 Корзина пуста — заказ не оформлен.", reply_markup=get_main_menu())
+        return
+    total = cart.total(items_in_cart)
+    items = cart.order_items(items_in_cart)
     username = f"@{message.from_user.username}" if message.from_user.username else message.from_user.full_name
-    add_order(spreadsheet, username, items, address, total, phone)
+    order_id = new_order_id()
+    row = build_order_row(username, items, address, total, phone, order_id, user_id)
+    order_queue.enqueue(row)
+    order_index.add(row)
+    sales_ledger.record(order_id, cart.lines(items_in_cart), customer_id=user_id)
+    stock_ledger.commit(user_id)
     user_profiles[user_id] = {"address": address, "phone": phone}
-    order_text = f"🛍 Новый заказ:\n{items}\n\n💰 {total}₽\n📍 {address}\n📞 {phone}\n👤 {username}"
-    await bot.send_message(ADMIN_CHAT_ID, order_text)
-    if GROUP_CHAT_ID:
-        await bot.send_message(GROUP_CHAT_ID, order_text)
-    user_carts[user_id] = []
+    user_carts.pop(user_id)
     await message.answer(
         "Спасибо! Ваш заказ зарегистрирован 💛\n"
         "Менеджер свяжется с вами в течение дня для уточнения деталей ✨",
         reply_markup=get_main_menu()
     )
+    order_text = f"🛍 Новый заказ:\n{items}\n\n💰 {total}₽\n📍 {address}\n📞 {phone}\n👤 {username}"
+    with outbound.priority(outbound.ADMIN):
+        order_notifier.notify(order_text)
 
 # --- Подбор масла ---
 
 
-QUIZ_QUESTIONS = {
-    1: ("Если бы вы могли улучшить одно состояние прямо сейчас — что бы это было?",
-        ["💪 Энергия и бодрость", "🧘 Спокойствие и устойчивость", "🫀 Сердце и сосуды",
-         "💆 Кожа и волосы", "🧠 Концентрация и память", "🌸 Гормональный баланс"]),
-    2: ("Как вы чувствуете себя в последние недели?",
-        ["😊 Всё стабильно", "😴 Часто устаю", "🥴 Есть тревожность или стресс",
-         "🤧 Бывают простуды", "🤕 Есть проблемы с пищеварением"]),
-    3: ("Какой у вас ритм жизни?",
-        ["🏃 Очень активный", "💻 Сидячая работа", "😌 Спокойный ритм", "🔥 Много стресса"]),
-    4: ("Какие продукты чаще всего на вашем столе?",
-        ["🍗 Мясо, рыба, яйца", "🥦 Овощи, крупы, бобовые", "🍕 Фастфуд или сладкое",
-         "🌿 В основном растительное питание"]),
-    5: ("Какое масло вы бы хотели — по ощущениям?",
-        ["🌰 С насыщенным ореховым вкусом", "💧 Нейтральное, лёгкое",
-         "🌶 Пряное и характерное", "✨ Универсальное — и внутрь, и наружно"]),
-    6: ("Используете ли вы масла для ухода за кожей или волосами?",
-        ["💆 Да, часто", "💅 Иногда", "🚫 Нет, только внутрь"]),
-    7: ("Какую цель хотите достичь быстрее всего?",
-        ["🌿 Улучшить самочувствие", "💆 Улучшить внешний вид",
-         "🔥 Повысить энергию", "🧘 Снизить стресс"])
-}
-
-
-OIL_RECOMMENDATIONS = {
-    "flax": "Масло льняное",
-    "hemp": "Масло конопляное",
-    "pumpkin": "Масло тыквенное",
-    "blackseed": "Масло черного тмина",
-    "sunflower": "Масло подсолнечное",
-    "walnut": "Масло грецкого ореха",
-    "coconut": "Масло кокосовое"
-}
-
-
+@text_router.button("🧩 Подбор масла", "подбор", states=NAV_STATES)
+@text_router.button("🧩 Подбор масла", states=(AWAITING_ADDRESS,), exact=True)
 async def start_quiz(message: Message):
     user_quiz[message.from_user.id] = {"step": 1, "answers": {}}
+    dialog_state[message.from_user.id] = QUIZ
     await send_quiz_question(message, 1)
 
 
+@text_router.button("❌ Выйти", states=(IDLE, QUIZ))
+async def exit_quiz(message: Message):
+    user_quiz.pop(message.from_user.id)
+    dialog_state.pop(message.from_user.id)
+    await message.answer("Вы вышли из подбора масел 🌿", reply_markup=get_main_menu())
+
+
+@text_router.button("🔙 Назад", states=(QUIZ,))
+async def quiz_back(message: Message):
+    user_id = message.from_user.id
+    data = user_quiz.get(user_id)
+    if not data:
+        return
+    if data["step"] > 1:
+        data["step"] -= 1
+        user_quiz[user_id] = data
+        await send_quiz_question(message, data["step"])
+    else:
+        await message.answer("Это первый вопрос 🌿", reply_markup=get_main_menu())
+
+
 async def send_quiz_question(message, step):
     q_text, q_options = QUIZ_QUESTIONS[step]
     buttons = [[KeyboardButton(text=opt)] for opt in q_options]
@@ -390,6 +776,7 @@ async def send_quiz_question(message, step):
     await message.answer(q_text, reply_markup=kb)
 
 
+@text_router.fallback(QUIZ)
 async def handle_quiz_answer(message: Message):
     uid = message.from_user.id
     data = user_quiz.get(uid, {"step": 1, "answers": {}})
@@ -397,40 +784,18 @@ async def handle_quiz_answer(message: Message):
     data["answers"][f"q{step}"] = message.text
     next_step = step + 1
     if next_step in QUIZ_QUESTIONS:
-        user_quiz[uid]["step"] = next_step
+        data["step"] = next_step
+        user_quiz[uid] = data
         await send_quiz_question(message, next_step)
     else:
         await recommend_oil(message, data["answers"])
         user_quiz.pop(uid, None)
+        dialog_state.pop(uid)
 
 
 async def recommend_oil(message: Message, answers):
-    joined = " ".join(answers.values()).lower()
-    score = {k: 0 for k in OIL_RECOMMENDATIONS}
-    if "устал" in joined or "энерг" in joined:
-        score["coconut"] += 3
-    if "стресс" in joined or "тревож" in joined:
-        score["hemp"] += 3
-    if "кожа" in joined or "волос" in joined:
-        score["sunflower"] += 3
-    if "память" in joined or "мозг" in joined:
-        score["walnut"] += 3
-    if "сердце" in joined or "сосуд" in joined:
-        score["flax"] += 3
-    if "иммун" in joined or "простуд" in joined:
-        score["blackseed"] += 3
-    if "печен" in joined or "жкт" in joined:
-        score["pumpkin"] += 3
-    if "гормон" in joined:
-        score["hemp"] += 2
-        score["pumpkin"] += 2
-    best = max(score, key=score.get)
-    recommended_name = OIL_RECOMMENDATIONS[best]
-    recommended_product = None
-    for p in products_cache:
-        if recommended_name.lower() in p["name"].lower() and not p["parent_id"]:
-            recommended_product = p
-            break
+    best = quiz.current().best(answers)
+    recommended_product = quiz.recommended_product(catalog.current(), best)
     if not recommended_product:
         await message.answer(
             "✨ К сожалению, рекомендованное масло сейчас недоступно.\n"
@@ -438,39 +803,29 @@ async def recommend_oil(message: Message, answers):
             reply_markup=get_main_menu()
         )
         return
-    oil_emoji = {
-        "flax": "💧",
-        "hemp": "🌿",
-        "pumpkin": "🎃",
-        "blackseed": "🌑",
-        "sunflower": "🌻",
-        "walnut": "🌰",
-        "coconut": "🥥"
-    }.get(best, "🌿")
+    oil_emoji = OIL_EMOJI.get(best, "🌿")
     text = (
         f"✨ Мы нашли масло, которое подходит именно вам.\n\n"
-        f"{oil_emoji} *{recommended_product['name']}*\n\n"
-        f"{recommended_product['description']}\n\n"
+        f"{oil_emoji} *{recommended_product.name}*\n\n"
+        f"{recommended_product.description}\n\n"
         "🌿 Рекомендуем начать с 1 ч.л. утром курсом 1–2 месяца.\n"
         "💛 Вы можете добавить его в корзину или открыть каталог."
     )
     markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🛒 Посмотреть варианты", callback_data=f"cat|{recommended_product['id']}")],
+        [InlineKeyboardButton(text="🛒 Посмотреть варианты", callback_data=f"cat|{recommended_product.id}")],
         [InlineKeyboardButton(text="🌿 Весь каталог", callback_data="back_to_catalog")]
     ])
-    if recommended_product["file_id"]:
-        try:
-            await bot.send_photo(
-                message.from_user.id,
-                photo=recommended_product["file_id"],
-                caption=text,
-                parse_mode="Markdown",
-                reply_markup=markup
-            )
-        except Exception:
-            await message.answer(text, parse_mode="Markdown", reply_markup=markup)
-    else:
-        await message.answer(text, parse_mode="Markdown", reply_markup=markup)
+    await media_cache.send(message.chat.id, recommended_product.file_id, text, markup)
+
+
+@router.message(Command("stats"))
+async def admin_stats(message: Message):
+    """Сводка продаж: /stats или /stats 90 (лидеры за 90 дней)"""
+    if message.from_user.id != ADMIN_CHAT_ID:
+        return
+    parts = message.text.split()
+    days = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 30
+    await message.answer(sales_ledger.report(days=days))
 
 
 @router.message(Command("updatephoto"))
@@ -485,7 +840,17 @@ async def handle_photo(message: Message):
     if message.from_user.id != ADMIN_CHAT_ID:
         return
     file_id = message.photo[-1].file_id
-    admin_waiting_photo[message.from_user.id] = file_id
+    waiting = admin_waiting_photo.get(message.from_user.id, [])
+    waiting.append(file_id)
+    admin_waiting_photo[message.from_user.id] = waiting
+    dialog_state[message.from_user.id] = AWAITING_PHOTO_IDS
+    if len(waiting) > 1:
+        await message.answer(
+            f"✅ Фото №{len(waiting)} получено!\n\n"
+            f"Отправьте ID товаров через пробел в том же порядке (например, `1 4 7`):",
+            parse_mode="Markdown"
+        )
+        return
     await message.answer(
         f"✅ Фото получено!\nFile ID: `{file_id}`\n\n"
         f"Теперь отправьте ID товара из Google Sheets (например, `1` или `4`):",
@@ -493,82 +858,132 @@ async def handle_photo(message: Message):
     )
 
 
-@router.message()
-async def handle_message(message: Message):
+@text_router.fallback(AWAITING_PHOTO_IDS)
+async def assign_photos(message: Message):
     user_id = message.from_user.id
-    text = (message.text or "").lower()
-
-    if user_id in admin_waiting_photo:
-        product_id = message.text.strip()
-        file_id = admin_waiting_photo.pop(user_id, None)
-        if not file_id:
-            await message.answer("❌ Фото не найдено. Попробуйте заново: /updatephoto")
-            return
-        success = update_product_photo(spreadsheet, product_id, file_id)
-        if success:
-            refresh_products()
-            await message.answer(
-                f"✅ Фото для товара ID={product_id} успешно обновлено!\n"
-                f"Кэш обновлён автоматически.",
-                reply_markup=get_main_menu()
-            )
-        else:
-            await message.answer(
-                f"⚠️ Не удалось обновить фото для ID={product_id}.\n"
-                f"Проверьте, что такой ID существует в таблице.",
-                reply_markup=get_main_menu()
-            )
-        return
-
-    if "подбор" in text:
-        await start_quiz(message)
+    product_ids = message.text.replace(",", " ").split()
+    file_ids = admin_waiting_photo.pop(user_id, None)
+    if not file_ids:
+        dialog_state.pop(user_id)
+        await message.answer("❌ Фото не найдено. Попробуйте заново: /updatephoto")
         return
-
-    if text.startswith("❌") or "выйти" in text:
-        user_quiz.pop(user_id, None)
-        await message.answer("Вы вышли из подбора масел 🌿", reply_markup=get_main_menu())
+    if len(product_ids) != len(file_ids):
+        admin_waiting_photo[user_id] = file_ids
+        await message.answer(
+            f"⚠️ Получено фото: {len(file_ids)}, ID товаров: {len(product_ids)}.\n"
+            f"Отправьте столько же ID через пробел."
+        )
         return
-
-    if text.startswith("🔙") or "назад" in text:
-        if user_id in user_quiz:
-            step = user_quiz[user_id]["step"]
-            if step > 1:
-                user_quiz[user_id]["step"] -= 1
-                await send_quiz_question(message, user_quiz[user_id]["step"])
-            else:
-                await message.answer("Это первый вопрос 🌿", reply_markup=get_main_menu())
+    photos = dict(zip(product_ids, file_ids))
+    try:
+        await get_spreadsheet()
+        updated = await sheets_async.update_product_photos(spreadsheet, photos, products_reader)
+    except Exception as e:
+        admin_waiting_photo[user_id] = file_ids
+        await message.answer(f"⚠️ Google Sheets сейчас недоступны, отправьте ID ещё раз позже: {e}")
         return
+    dialog_state.pop(user_id)
+    if updated:
+        # file_id только что пришли от Telegram в сообщении админа — проверять их не нужно
+        for pid in updated:
+            media_cache.mark_valid(photos[pid])
+        patch_products({pid: {"file_id": photos[pid]} for pid in updated})
+    failed = [pid for pid in photos if pid not in updated]
+    if updated:
+        await message.answer(
+            f"✅ Фото для товара ID={', '.join(updated)} успешно обновлено!\n"
+            f"Кэш обновлён автоматически.",
+            reply_markup=get_main_menu()
+        )
+    if failed:
+        await message.answer(
+            f"⚠️ Не удалось обновить фото для ID={', '.join(failed)}.\n"
+            f"Проверьте, что такой ID существует в таблице.",
+            reply_markup=get_main_menu()
+        )
 
-    if user_id in user_quiz:
-        await handle_quiz_answer(message)
-        return
 
-    if user_id in pending_address:
-        address = message.text.strip()
-        pending_address.pop(user_id, None)
-        await ask_phone(message, address)
-        return
+@router.message(F.text)
+async def handle_message(message: Message):
+    handler = text_router.resolve(dialog_state.get(message.from_user.id, IDLE), message.text)
+    if handler is not None:
+        metrics.name_handler(handler.__name__)
+        await handler(message)
 
 
-async def on_startup():
-    await bot.delete_webhook(drop_pending_updates=True)
-    await bot.set_webhook(WEBHOOK_URL)
-    print(f"✅ Webhook установлен: {WEBHOOK_URL}")
+async def setup_webhook():
+    """
+    Ставит вебхук, только если он указывает не туда. Апдейты, накопившиеся
+    у Telegram, пока сервис просыпался, не сбрасываются.
+    """
+    try:
+        info = await bot.get_webhook_info()
+        if info.url != WEBHOOK_URL:
+            await bot.set_webhook(WEBHOOK_URL)
+        print(f"✅ Webhook установлен: {WEBHOOK_URL}")
+    except Exception as e:
+        print(f"❌ Не удалось установить webhook: {e}")
+
+
+async def on_startup(app):
+    # Порт открывается сразу после on_startup: всё сетевое — в фоновых задачах
+    print("🚀 Bot is running with Google Sheets catalog")
+    print(f"📦 Loaded {len(catalog.current())} products")
+    app["webhook_setup"] = asyncio.create_task(setup_webhook())
+    app["order_flusher"] = asyncio.create_task(order_queue.run(write_orders))
+    app["stock_syncer"] = asyncio.create_task(stock_ledger.run(write_stock))
+    app["state_purger"] = asyncio.create_task(purge_expired_state())
+    app["sheets_connector"] = asyncio.create_task(connect_sheets())
+    app["sheets_prober"] = asyncio.create_task(probe_sheets())
+    media_cache.validate_catalog(catalog.current())
+    if CATALOG_REFRESH_TTL > 0:
+        app["catalog_refresher"] = asyncio.create_task(auto_refresh_catalog())
+
+
+async def on_shutdown(app):
+    await app["feeder"].drain()
+    await order_notifier.drain()
+    await cart_editor.drain()
+    for name in ("order_flusher", "stock_syncer", "catalog_refresher", "state_purger", "sheets_connector",
+                 "sheets_prober", "webhook_setup"):
+        task = app.get(name)
+        if task:
+            task.cancel()
+    try:
+        await order_queue.flush(write_orders)
+    except Exception as e:
+        print(f"⚠️ Заказы останутся в очереди до следующего запуска: {e}")
+    try:
+        await stock_ledger.flush(write_stock)
+    except Exception as e:
+        print(f"⚠️ Остатки будут списаны при следующем запуске: {e}")
+    if reminder_job is not None and reminder_job.task and not reminder_job.finished:
+        reminder_job.task.cancel()
+    await outbound_queue.drain()
+    await bot.session.close()
+    sheets_async.shutdown()
+    close_stores()
+
+
+def close_stores():
+    """Закрывает соединения всех локальных хранилищ SQLite"""
+    for store in (state, order_queue, order_index, stock_ledger, reminder_ledger, sales_ledger):
+        store.close()
+
+
+def create_app(update_feeder=None):
+    """
+    Веб-приложение бота. update_feeder — куда передавать апдейты:
+    по умолчанию они обрабатываются в этом же процессе (feeder).
+    """
+    app = web.Application()
+    app["feeder"] = update_feeder or feeder
+    metrics.WEBHOOK_PENDING.set_function(lambda: app["feeder"].pending)
+    app.add_routes(routes)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
 
 
 if __name__ == "__main__":
-    import threading
-
-    async def run_bot():
-        await on_startup()
-        print("🚀 Bot is running with Google Sheets catalog")
-        print(f"📦 Loaded {len(products_cache)} products")
-
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
-    def run_async_loop():
-        loop.run_until_complete(run_bot())
-
-    threading.Thread(target=run_async_loop, daemon=True).start()
-    app.run(host="0.0.0.0", port=8080)
+    web.run_app(create_app(), host="0.0.0.0", port=PORT)
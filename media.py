@@ -0,0 +1,132 @@
+"""
+Фото товаров: проверка file_id и показ карточек с правкой сообщения на месте.
+
+Результаты проверки хранятся в общем хранилище состояния (namespace "media"):
+рабочий file_id — на valid_ttl, битый — на broken_ttl (отрицательный кэш).
+Битые file_id не отправляются вовсе: карточка сразу показывается текстом.
+"""
+import asyncio
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaPhoto
+
+VALID = "ok"
+BROKEN = "broken"
+
+
+def is_file_error(error):
+    """Ошибка Telegram из-за самого файла (битый или чужой file_id), а не из-за текста или разметки"""
+    text = str(error).lower()
+    return isinstance(error, TelegramBadRequest) and any(
+        s in text for s in ("file", "http url", "photo")
+    ) and "not modified" not in text
+
+
+def _not_modified(error):
+    return isinstance(error, TelegramBadRequest) and "not modified" in str(error)
+
+
+class MediaCache:
+    """Кэш проверок file_id и отправка карточек товаров с фото"""
+
+    def __init__(self, bot, namespace, valid_ttl=24 * 3600, broken_ttl=6 * 3600, concurrency=4):
+        self.bot = bot
+        self.namespace = namespace
+        self.valid_ttl = valid_ttl
+        self.broken_ttl = broken_ttl
+        self.concurrency = concurrency
+        self._task = None
+
+    def usable(self, file_id):
+        """file_id можно отправлять: он есть и не помечен битым"""
+        return bool(file_id) and self.namespace.get(file_id) != BROKEN
+
+    def mark_valid(self, file_id):
+        self.namespace.set(file_id, VALID, ttl=self.valid_ttl)
+
+    def mark_broken(self, file_id, error=None):
+        if self.namespace.get(file_id) != BROKEN:
+            print(f"🖼 file_id помечен битым на {self.broken_ttl / 3600:g} ч: {file_id[:24]}… ({error})")
+        self.namespace.set(file_id, BROKEN, ttl=self.broken_ttl)
+
+    async def check(self, file_id):
+        """Проверяет file_id через getFile; None — проверить не удалось (сеть, лимиты)"""
+        try:
+            await self.bot.get_file(file_id)
+        except TelegramBadRequest as e:
+            self.mark_broken(file_id, e)
+            return False
+        except Exception as e:
+            print(f"⚠️ Не удалось проверить file_id: {e}")
+            return None
+        self.mark_valid(file_id)
+        return True
+
+    async def validate(self, file_ids):
+        """Проверяет file_id, которых ещё нет в кэше; возвращает число битых"""
+        unknown = [f for f in dict.fromkeys(file_ids) if f and self.namespace.get(f) is None]
+        if not unknown:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(file_id):
+            async with semaphore:
+                return await self.check(file_id)
+
+        results = await asyncio.gather(*(check(f) for f in unknown))
+        broken = results.count(False)
+        print(f"🖼 Проверено фото товаров: {len(unknown)}, битых: {broken}")
+        return broken
+
+    def validate_catalog(self, snapshot):
+        """Фоновая проверка фото нового снимка каталога (предыдущая проверка отменяется)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = asyncio.create_task(self.validate(p.file_id for p in snapshot.products))
+        return self._task
+
+    async def show(self, message, file_id, text, reply_markup=None, parse_mode="Markdown"):
+        """
+        Показывает карточку в сообщении message. Фото в фото-сообщении и текст
+        в текстовом правятся на месте одним запросом; при смене типа сообщение
+        заменяется новым. Фото с битым file_id показывается текстом.
+        """
+        photo = file_id if self.usable(file_id) else None
+        has_photo = bool(getattr(message, "photo", None))
+        try:
+            if photo and has_photo:
+                await message.edit_media(
+                    InputMediaPhoto(media=photo, caption=text, parse_mode=parse_mode),
+                    reply_markup=reply_markup
+                )
+                return
+            if not photo and not has_photo:
+                await message.edit_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+                return
+        except TelegramBadRequest as e:
+            if _not_modified(e):
+                return
+            if photo and is_file_error(e):
+                self.mark_broken(photo, e)
+                photo = None
+            else:
+                print(f"⚠️ Не удалось изменить сообщение, отправляю новое: {e}")
+        try:
+            await message.delete()
+        except Exception:
+            pass
+        await self.send(message.chat.id, photo, text, reply_markup, parse_mode, checked=True)
+
+    async def send(self, chat_id, file_id, text, reply_markup=None, parse_mode="Markdown", checked=False):
+        """Новое сообщение с фото, а если фото нет или оно битое — текстом"""
+        photo = file_id if checked or self.usable(file_id) else None
+        if photo:
+            try:
+                return await self.bot.send_photo(
+                    chat_id, photo=photo, caption=text, parse_mode=parse_mode, reply_markup=reply_markup
+                )
+            except TelegramBadRequest as e:
+                if not is_file_error(e):
+                    raise
+                self.mark_broken(photo, e)
+        return await self.bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=reply_markup)
@@ -0,0 +1,223 @@
+"""
+Метрики в текстовом формате Prometheus (GET /metrics).
+
+Счётчики, гистограммы и датчики живут в памяти процесса; в многопроцессном
+режиме (workers.py) /metrics показывает метрики главного процесса.
+"""
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    def _samples(self):
+        with _lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels_text(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    """Датчик: значение задаётся set() или вычисляется при каждом запросе /metrics"""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, func, **labels):
+        self._functions[self._key(labels)] = func
+
+    def _samples(self):
+        for key, func in list(self._functions.items()):
+            try:
+                self.set(func(), **dict(zip(self.labelnames, key)))
+            except Exception as e:
+                print(f"⚠️ Не удалось снять метрику {self.name}: {e}")
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with _lock:
+            items = [(key, (list(e[0]), e[1], e[2])) for key, e in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _labels_text(self.labelnames, key, ("le", _number(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    return "\n".join(metric.render() for metric in list(_registry)) + "\n"
+
+
+# --- Метрики бота ---
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время работы обработчика апдейта", ("handler",)
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках апдейтов", ("handler",)
+)
+TELEGRAM_SECONDS = Histogram(
+    "telegram_api_seconds", "Время запроса к Telegram Bot API", ("method",)
+)
+TELEGRAM_ERRORS = Counter(
+    "telegram_api_errors_total", "Ошибки запросов к Telegram Bot API", ("method", "error")
+)
+TELEGRAM_QUEUE_SECONDS = Histogram(
+    "telegram_queue_seconds", "Ожидание в очереди исходящих запросов к Telegram", ("priority",)
+)
+TELEGRAM_QUEUE_PENDING = Gauge(
+    "telegram_queue_pending", "Запросы в очереди исходящих к Telegram", ("priority",)
+)
+TELEGRAM_COALESCED = Counter(
+    "telegram_coalesced_edits_total", "Правки сообщений, заменённые более новой правкой в очереди", ("method",)
+)
+SHEETS_SECONDS = Histogram(
+    "sheets_call_seconds", "Время вызова Google Sheets", ("func",)
+)
+SHEETS_CALLS = Counter(
+    "sheets_calls_total", "Вызовы Google Sheets по результату", ("func", "result")
+)
+SHEETS_CIRCUIT = Gauge(
+    "sheets_circuit_state", "Автомат защиты Google Sheets: 0 — замкнут, 1 — пробный запрос, 2 — разомкнут"
+)
+CATALOG_REFRESH_SECONDS = Histogram(
+    "catalog_refresh_seconds", "Длительность обновления каталога из таблицы", ("result",)
+)
+CATALOG_PRODUCTS = Gauge("catalog_products", "Товаров в текущем снимке каталога")
+STATE_ENTRIES = Gauge("state_entries", "Записей в хранилище состояния", ("namespace",))
+WEBHOOK_PENDING = Gauge("webhook_pending_updates", "Принятые, но ещё не обработанные апдейты")
+ORDERS_PENDING = Gauge("orders_pending", "Заказы в локальной очереди на запись в таблицу")
+STOCK_PENDING = Gauge("stock_pending_products", "Товары с продажами, ещё не списанными в таблице")
+
+_handler_name = contextvars.ContextVar("handler_name", default=None)
+
+
+def name_handler(name):
+    """Уточняет имя обработчика для метрик (например, маршрут внутри handle_message)"""
+    _handler_name.set(name)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Middleware роутера aiogram: время и ошибки каждого обработчика"""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        token = _handler_name.set(getattr(callback, "__name__", "unknown"))
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=_handler_name.get())
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=_handler_name.get())
+            _handler_name.reset(token)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время и ошибки каждого запроса к Bot API (send_message и т.д.)"""
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, method=name)
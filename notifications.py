@@ -0,0 +1,48 @@
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+
+
+class NotificationDispatcher:
+    """
+    Фоновая рассылка служебных уведомлений (новые заказы) по списку чатов.
+    Каждый чат доставляется отдельной задачей, так что медленный или
+    заблокированный чат не задерживает остальных. Лимиты и паузы Telegram
+    соблюдает очередь отправки (outbound); здесь повторяется только
+    RetryAfter, пережившая повторы очереди: такое сообщение точно не ушло.
+    Таймаутов и повторов после прочих ошибок нет — запрос из очереди мог
+    уже уйти, и повтор задублировал бы заказ в чате.
+    """
+
+    def __init__(self, bot, targets, retries=3):
+        self.bot = bot
+        self.targets = [t for t in targets if t]
+        self.retries = retries
+        self._tasks = set()
+
+    def notify(self, text):
+        """Ставит уведомление в отправку и сразу возвращается"""
+        for chat_id in self.targets:
+            task = asyncio.create_task(self._deliver(chat_id, text))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, chat_id, text):
+        for attempt in range(self.retries + 1):
+            try:
+                await self.bot.send_message(chat_id, text)
+                return True
+            except TelegramRetryAfter as e:
+                if attempt >= self.retries:
+                    print(f"❌ Уведомление в чат {chat_id} не доставлено: Telegram просит подождать {e.retry_after} с")
+                    return False
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                print(f"❌ Уведомление в чат {chat_id} не доставлено: {e}")
+                return False
+        return False
+
+    async def drain(self, timeout=10):
+        """Дожидается отправки уведомлений при остановке"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
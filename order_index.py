@@ -0,0 +1,114 @@
+import os
+import sqlite3
+
+# Колонки листа Orders по порядку
+ORDER_COLUMNS = ("created", "client", "items", "address", "total", "phone", "order_id", "customer_id")
+
+
+class OrderIndex:
+    """
+    Локальный индекс заказов (SQLite) по дате и клиенту.
+    Пополняется при оформлении заказа (add) и догрузкой из таблицы
+    только тех строк, что появились после прошлой синхронизации (ingest).
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            "order_id TEXT PRIMARY KEY, "
+            "row_number INTEGER, "
+            "day TEXT NOT NULL, "
+            "created TEXT NOT NULL, "
+            "client TEXT NOT NULL, "
+            "customer_id INTEGER, "
+            "items TEXT, "
+            "address TEXT, "
+            "total TEXT, "
+            "phone TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS orders_day ON orders (day)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS orders_customer ON orders (customer_id, day)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS orders_client ON orders (client, day)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+
+    def _insert(self, order, row_number=None):
+        created = str(order.get("created", ""))
+        customer_id = order.get("customer_id")
+        try:
+            customer_id = int(customer_id) if customer_id not in (None, "") else None
+        except (TypeError, ValueError):
+            customer_id = None
+        order_id = str(order.get("order_id") or "") or f"row:{row_number}"
+        self._db.execute(
+            "INSERT OR IGNORE INTO orders "
+            "(order_id, row_number, day, created, client, customer_id, items, address, total, phone) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (order_id, row_number, created[:10], created, str(order.get("client", "")), customer_id,
+             str(order.get("items", "")), str(order.get("address", "")),
+             str(order.get("total", "")), str(order.get("phone", "")))
+        )
+
+    def add(self, row):
+        """Добавляет заказ, только что записанный ботом (строка в формате листа Orders)"""
+        self._insert(dict(zip(ORDER_COLUMNS, row)))
+        self._db.commit()
+
+    @property
+    def synced_rows(self):
+        """Сколько строк листа Orders (включая заголовок) уже учтено"""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'synced_rows'").fetchone()
+        return int(row[0]) if row else 1
+
+    def ingest(self, rows, start_row):
+        """
+        Учитывает строки листа, начиная с номера start_row.
+        Заказы, уже добавленные через add(), повторно не записываются.
+        """
+        for offset, raw in enumerate(rows):
+            if not any(str(v).strip() for v in raw):
+                continue
+            self._insert(dict(zip(ORDER_COLUMNS, raw)), row_number=start_row + offset)
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_rows', ?)",
+            (str(start_row + len(rows) - 1),)
+        )
+        self._db.commit()
+        return len(rows)
+
+    def reminder_targets(self, day):
+        """
+        Кому напомнить о заказе, сделанном в день day:
+        id клиента в Telegram, а для старых заказов — @username.
+        """
+        rows = self._db.execute(
+            "SELECT customer_id, client FROM orders WHERE day = ?", (day.isoformat(),)
+        ).fetchall()
+        targets = []
+        seen = set()
+        for customer_id, client in rows:
+            target = customer_id if customer_id is not None else (client if "@" in client else None)
+            if target is not None and target not in seen:
+                seen.add(target)
+                targets.append(target)
+        return targets
+
+    def history(self, customer_id, limit=50):
+        """Последние заказы клиента"""
+        cur = self._db.execute(
+            "SELECT order_id, created, items, address, total FROM orders "
+            "WHERE customer_id = ? ORDER BY created DESC LIMIT ?",
+            (customer_id, limit)
+        )
+        columns = [c[0] for c in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def count(self):
+        return self._db.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+
+
+class OrderQueue:
+    """
+    Локальный журнал заказов (SQLite) с отложенной записью в Google Sheets.
+    enqueue() только пишет строку в журнал, а фоновый run() пачками
+    отправляет накопленные заказы одним append_rows и помечает их отправленными.
+    Неотправленные заказы переживают перезапуск процесса.
+    """
+
+    def __init__(self, path, flush_interval=5, batch_size=200, max_backoff=300):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "row TEXT NOT NULL, "
+            "created REAL NOT NULL, "
+            "sent INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS orders_pending ON orders (sent, id)")
+        self._db.commit()
+        self._flush_lock = asyncio.Lock()
+
+    def enqueue(self, row):
+        """Сохраняет строку заказа в журнал и сразу возвращает её номер"""
+        cur = self._db.execute(
+            "INSERT INTO orders (row, created) VALUES (?, ?)",
+            (json.dumps(row, ensure_ascii=False), time.time())
+        )
+        self._db.commit()
+        return cur.lastrowid
+
+    def pending_count(self):
+        return self._db.execute("SELECT COUNT(*) FROM orders WHERE sent = 0").fetchone()[0]
+
+    def _pending(self):
+        return self._db.execute(
+            "SELECT id, row FROM orders WHERE sent = 0 ORDER BY id LIMIT ?", (self.batch_size,)
+        ).fetchall()
+
+    def _mark_sent(self, ids):
+        self._db.executemany("UPDATE orders SET sent = 1 WHERE id = ?", [(i,) for i in ids])
+        self._db.commit()
+
+    async def flush(self, write_rows):
+        """
+        Отправляет все накопленные заказы. write_rows — корутина,
+        принимающая список строк.
+        Возвращает количество отправленных заказов.
+        """
+        sent = 0
+        async with self._flush_lock:
+            while True:
+                batch = self._pending()
+                if not batch:
+                    return sent
+                ids = [row_id for row_id, _ in batch]
+                rows = [json.loads(row) for _, row in batch]
+                await write_rows(rows)
+                self._mark_sent(ids)
+                sent += len(ids)
+                print(f"✅ Отправлено в таблицу заказов: {len(ids)}")
+
+    async def run(self, write_rows):
+        """Фоновый цикл отправки с экспоненциальной задержкой при ошибках (в т.ч. квоты API)"""
+        delay = self.flush_interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.flush(write_rows)
+                delay = self.flush_interval
+            except Exception as e:
+                delay = min(max(delay, 1) * 2, self.max_backoff)
+                print(f"⚠️ Ошибка отправки заказов ({self.pending_count()} в очереди), повтор через {delay} c: {e}")
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,271 @@
+"""
+Очередь исходящих запросов к Telegram Bot API.
+
+Middleware сессии бота: все отправки и правки сообщений (bot.send_message,
+message.answer, edit_text и т.д.) проходят через одну очередь с приоритетами
+и общими ведрами токенов из rate_limit — на бота и на каждый чат.
+Ответы на действия пользователей обгоняют уведомления админам, а те — рассылки.
+"""
+import time
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+from rate_limit import ChatRateLimiter, is_group_chat
+
+# Классы приоритета: меньше — важнее
+INTERACTIVE = 0
+ADMIN = 1
+BULK = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", ADMIN: "admin", BULK: "bulk"}
+
+# Правки сообщений: уходят по порядку, из подряд идущих правок одним методом достаточно последней
+EDIT_METHODS = {"editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup"}
+# Остальные запросы (ответы на колбэки, служебные методы) под лимиты сообщений не попадают
+QUEUED_METHODS = EDIT_METHODS | {
+    "sendMessage", "sendPhoto", "sendMediaGroup", "sendDocument", "sendContact",
+    "sendLocation", "forwardMessage", "copyMessage", "deleteMessage",
+}
+
+_priority = contextvars.ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level):
+    """Приоритет отправок внутри блока: with outbound.priority(outbound.BULK): ..."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _chat_key(chat_id):
+    try:
+        return int(chat_id)
+    except (TypeError, ValueError):
+        return chat_id
+
+
+class _Request:
+    __slots__ = ("priority", "chat_id", "make_request", "bot", "method", "futures", "queued_at", "attempts",
+                 "edit_key", "sending")
+
+    def __init__(self, priority, chat_id, make_request, bot, method, edit_key=None):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.futures = [asyncio.get_running_loop().create_future()]
+        self.queued_at = time.perf_counter()
+        self.attempts = 0
+        self.edit_key = edit_key   # (чат, сообщение) для правок
+        self.sending = False
+
+
+class OutboundQueue(BaseRequestMiddleware):
+    """
+    Приоритетная очередь отправки под лимитами Telegram.
+
+    - Глобальное ведро (~30/с) общее для всех классов; рассылкам и уведомлениям
+      оставляется запас reserve токенов, чтобы ответы пользователям не ждали.
+    - Ведро чата: группы (~20/мин) — для всех классов, личные чаты (~1/с) —
+      только для уведомлений и рассылок: ответы в личку и так идут в темпе действий пользователя.
+    - TelegramRetryAfter: пауза чата (и бота — если это не группа) и повтор из очереди.
+    - Правки одного сообщения уходят строго по порядку и по одной: все стоят в одной
+      очереди — самого важного из их классов (правка из ответа пользователю поднимает
+      ждущие правки рассылки, а не ждёт за ними). Новая правка тем же методом, что и
+      последняя ещё не отправленная, заменяет её.
+    """
+
+    def __init__(self, limiter=None, retries=3, reserve=5):
+        self.retries = retries
+        self.set_limiter(limiter or ChatRateLimiter(), reserve)
+        self._queues = {level: deque() for level in PRIORITY_NAMES}
+        self._edits = {}    # (чат, сообщение) -> неотправленные правки по порядку
+        self._wakeup = None
+        self._worker = None
+        self._inflight = set()
+        for level, name in PRIORITY_NAMES.items():
+            metrics.TELEGRAM_QUEUE_PENDING.set_function(self._queues[level].__len__, priority=name)
+
+    def set_limiter(self, limiter, reserve):
+        """Заменяет лимиты (например, на долю процесса в многопроцессном режиме)"""
+        self.limiter = limiter
+        self.reserve = min(reserve, max(limiter.global_bucket.capacity - 1, 0))
+
+    @property
+    def pending(self):
+        return sum(len(q) for q in self._queues.values())
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", "")
+        chat_id = getattr(method, "chat_id", None)
+        if name not in QUEUED_METHODS or chat_id is None:
+            return await self._direct(make_request, bot, method)
+        chat_id = _chat_key(chat_id)
+        level = _priority.get()
+        if name in EDIT_METHODS and getattr(method, "message_id", None) is not None:
+            key = (chat_id, method.message_id)
+            edits = self._edits.setdefault(key, [])
+            if edits:
+                self._promote(edits, level)
+                last = edits[-1]
+                if not last.sending and getattr(last.method, "__api_method__", "") == name:
+                    # Прошлая правка тем же методом ещё не ушла: отправим только новую, ответ получат обе
+                    last.method, last.make_request, last.bot = method, make_request, bot
+                    future = asyncio.get_running_loop().create_future()
+                    last.futures.append(future)
+                    metrics.TELEGRAM_COALESCED.inc(method=name)
+                    return await future
+                level = edits[0].priority
+            request = _Request(level, chat_id, make_request, bot, method, key)
+            edits.append(request)
+        else:
+            request = _Request(level, chat_id, make_request, bot, method)
+        self._put(request)
+        return await request.futures[0]
+
+    def _promote(self, edits, level):
+        """Переносит ждущие правки сообщения в очередь класса level, если он важнее, сохраняя их порядок"""
+        if level >= edits[0].priority:
+            return
+        for request in edits:
+            if not request.sending:
+                self._queues[request.priority].remove(request)
+            request.priority = level
+        self._queues[level].extend(r for r in edits if not r.sending)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _direct(self, make_request, bot, method):
+        """Запросы мимо очереди (ответы на колбэки и т.п.) тоже повторяются после RetryAfter"""
+        for attempt in range(self.retries + 1):
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.retries:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    def _put(self, request, front=False):
+        queue = self._queues[request.priority]
+        if front:
+            queue.appendleft(request)
+        else:
+            queue.append(request)
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def _chat_limited(self, request):
+        return request.priority != INTERACTIVE or is_group_chat(request.chat_id)
+
+    def _next(self):
+        """Первый запрос, который можно отправить сейчас, или время до ближайшего (секунд)"""
+        global_bucket = self.limiter.global_bucket
+        wait = global_bucket.delay()
+        if wait > 0:
+            return None, wait
+        soonest = None
+        for level in sorted(self._queues):
+            queue = self._queues[level]
+            if not queue:
+                continue
+            if level != INTERACTIVE and global_bucket.tokens < 1 + self.reserve:
+                delay = (1 + self.reserve - global_bucket.tokens) / global_bucket.rate
+                soonest = delay if soonest is None else min(soonest, delay)
+                continue
+            blocked = set()
+            for request in queue:
+                if request.chat_id in blocked:
+                    continue
+                if request.edit_key is not None and self._edits[request.edit_key][0] is not request:
+                    # Предыдущая правка этого сообщения ещё не отправлена
+                    continue
+                if self._chat_limited(request):
+                    bucket = self.limiter.chat_bucket(request.chat_id)
+                    delay = bucket.delay()
+                    if delay > 0:
+                        # Порядок внутри чата сохраняется: следующие запросы чата тоже ждут
+                        blocked.add(request.chat_id)
+                        soonest = delay if soonest is None else min(soonest, delay)
+                        continue
+                    bucket.tokens -= 1
+                queue.remove(request)
+                global_bucket.tokens -= 1
+                request.sending = True
+                return request, 0
+        return None, soonest
+
+    async def _run(self):
+        while self.pending:
+            request, wait = self._next()
+            if request is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._send(request))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            # Отдаём цикл обработчикам: новые ответы пользователям встают в очередь раньше рассылки
+            await asyncio.sleep(0)
+
+    async def _send(self, request):
+        name = getattr(request.method, "__api_method__", "")
+        request.attempts += 1
+        metrics.TELEGRAM_QUEUE_SECONDS.observe(
+            time.perf_counter() - request.queued_at, priority=PRIORITY_NAMES[request.priority]
+        )
+        try:
+            result = await request.make_request(request.bot, request.method)
+        except TelegramRetryAfter as e:
+            # Флуд в группе тормозит только эту группу; 429 в личке — признак общего перебора
+            self.limiter.chat_bucket(request.chat_id).pause(e.retry_after)
+            if not is_group_chat(request.chat_id):
+                self.limiter.global_bucket.pause(e.retry_after)
+            if request.attempts <= self.retries:
+                print(f"⏳ Telegram просит подождать {e.retry_after} с ({name}, чат {request.chat_id})")
+                request.queued_at = time.perf_counter()
+                request.sending = False
+                self._put(request, front=True)
+                return
+            self._finish(request, error=e)
+            return
+        except Exception as e:
+            self._finish(request, error=e)
+            return
+        self._finish(request, result=result)
+
+    def _finish(self, request, result=None, error=None):
+        if request.edit_key is not None:
+            edits = self._edits[request.edit_key]
+            edits.remove(request)
+            if not edits:
+                del self._edits[request.edit_key]
+            elif self._wakeup is not None:
+                # Следующая правка сообщения ждала эту
+                self._wakeup.set()
+        for future in request.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def drain(self, timeout=10):
+        """Дожидается отправки очереди при остановке"""
+        deadline = time.monotonic() + timeout
+        while (self.pending or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
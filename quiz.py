@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import itertools
+from collections import Counter
+
+from text_router import normalize, bare
+
+QUIZ_QUESTIONS = {
+    1: ("Если бы вы могли улучшить одно состояние прямо сейчас — что бы это было?",
+        ["💪 Энергия и бодрость", "🧘 Спокойствие и устойчивость", "🫀 Сердце и сосуды",
+         "💆 Кожа и волосы", "🧠 Концентрация и память", "🌸 Гормональный баланс"]),
+    2: ("Как вы чувствуете себя в последние недели?",
+        ["😊 Всё стабильно", "😴 Часто устаю", "🥴 Есть тревожность или стресс",
+         "🤧 Бывают простуды", "🤕 Есть проблемы с пищеварением"]),
+    3: ("Какой у вас ритм жизни?",
+        ["🏃 Очень активный", "💻 Сидячая работа", "😌 Спокойный ритм", "🔥 Много стресса"]),
+    4: ("Какие продукты чаще всего на вашем столе?",
+        ["🍗 Мясо, рыба, яйца", "🥦 Овощи, крупы, бобовые", "🍕 Фастфуд или сладкое",
+         "🌿 В основном растительное питание"]),
+    5: ("Какое масло вы бы хотели — по ощущениям?",
+        ["🌰 С насыщенным ореховым вкусом", "💧 Нейтральное, лёгкое",
+         "🌶 Пряное и характерное", "✨ Универсальное — и внутрь, и наружно"]),
+    6: ("Используете ли вы масла для ухода за кожей или волосами?",
+        ["💆 Да, часто", "💅 Иногда", "🚫 Нет, только внутрь"]),
+    7: ("Какую цель хотите достичь быстрее всего?",
+        ["🌿 Улучшить самочувствие", "💆 Улучшить внешний вид",
+         "🔥 Повысить энергию", "🧘 Снизить стресс"])
+}
+
+
+OIL_RECOMMENDATIONS = {
+    "flax": "Масло льняное",
+    "hemp": "Масло конопляное",
+    "pumpkin": "Масло тыквенное",
+    "blackseed": "Масло черного тмина",
+    "sunflower": "Масло подсолнечное",
+    "walnut": "Масло грецкого ореха",
+    "coconut": "Масло кокосовое"
+}
+
+OIL_EMOJI = {
+    "flax": "💧",
+    "hemp": "🌿",
+    "pumpkin": "🎃",
+    "blackseed": "🌑",
+    "sunflower": "🌻",
+    "walnut": "🌰",
+    "coconut": "🥥"
+}
+
+# Порядок столбцов матрицы; при равенстве баллов побеждает масло левее
+OILS = tuple(OIL_RECOMMENDATIONS)
+
+# Веса по умолчанию построены по прежним правилам с ключевыми словами, но результат
+# с ними не совпадает: баллы складываются по каждому ответу (тема, выбранная в нескольких
+# вопросах, весит больше), а «Часто устаю» и «проблемы с пищеварением» теперь
+# засчитываются. Из 23040 наборов ответов другое масло получают 4512: тыквенное —
+# 2016 наборов вместо 0, подсолнечное и грецкого ореха — по 720 вместо 1296,
+# кокосовое — 3552 вместо 2160, льняное — 3408 вместо 4704 (python quiz.py).
+# Ответы, которых здесь нет, баллов не добавляют. Строки листа QuizWeights
+# (колонка "Ответ" и по колонке на масло: flax, hemp, ...) заменяют их без деплоя.
+DEFAULT_WEIGHTS = {
+    "💪 Энергия и бодрость": {"coconut": 3},
+    "😴 Часто устаю": {"coconut": 3},
+    "🔥 Повысить энергию": {"coconut": 3},
+    "🥴 Есть тревожность или стресс": {"hemp": 3},
+    "🔥 Много стресса": {"hemp": 3},
+    "🧘 Снизить стресс": {"hemp": 3},
+    "💆 Кожа и волосы": {"sunflower": 3},
+    "🧠 Концентрация и память": {"walnut": 3},
+    "🫀 Сердце и сосуды": {"flax": 3},
+    "🤧 Бывают простуды": {"blackseed": 3},
+    "🤕 Есть проблемы с пищеварением": {"pumpkin": 3},
+    "🌸 Гормональный баланс": {"hemp": 2, "pumpkin": 2},
+}
+
+
+def _weights_table(*sources):
+    """Объединяет словари весов; ключ — подпись ответа без эмодзи и регистра"""
+    table = {}
+    for source in sources:
+        for label, weights in (source or {}).items():
+            table[bare(normalize(label))] = weights
+    return table
+
+
+class QuizScorer:
+    """
+    Подбор масла по ответам квиза. Каждый вариант ответа — строка матрицы
+    весов (по столбцу на масло), оценка набора ответов — сумма строк.
+    Результат запоминается по набору ответов: вариантов всего несколько тысяч.
+    """
+
+    def __init__(self, weights=None, questions=QUIZ_QUESTIONS, oils=OILS):
+        self.oils = oils
+        self.steps = sorted(questions)
+        table = _weights_table(DEFAULT_WEIGHTS, weights)
+        zero = (0.0,) * len(oils)
+        self._rows = [zero]   # строка 0 — ответ не из списка
+        self._options = []    # по шагу: {нормализованный ответ: номер строки}
+        for step in self.steps:
+            options = {}
+            for label in questions[step][1]:
+                key = normalize(label)
+                row = table.get(bare(key), {})
+                options[key] = options[bare(key)] = len(self._rows)
+                self._rows.append(tuple(float(row.get(oil, 0)) for oil in oils))
+            self._options.append(options)
+        self._memo = {}
+        unknown = set(_weights_table(weights)) - {bare(k) for options in self._options for k in options}
+        if unknown:
+            print(f"⚠️ В весах квиза есть ответы, которых нет в вопросах: {', '.join(sorted(unknown))}")
+
+    def encode(self, answers):
+        """
+        Номера строк матрицы для ответов. answers — словарь {"q1": текст, ...}
+        (как в состоянии квиза) или последовательность ответов по порядку шагов.
+        """
+        if isinstance(answers, dict):
+            answers = [answers.get(f"q{step}") for step in self.steps]
+        encoded = []
+        for options, text in zip(self._options, answers):
+            key = normalize(text)
+            encoded.append(options.get(key) or options.get(bare(key), 0))
+        return tuple(encoded)
+
+    def _result(self, encoded):
+        result = self._memo.get(encoded)
+        if result is None:
+            scores = tuple(sum(column) for column in zip(*(self._rows[i] for i in encoded)))
+            best = max(range(len(self.oils)), key=scores.__getitem__)
+            result = self._memo[encoded] = (self.oils[best], scores)
+        return result
+
+    def score(self, answers):
+        """Баллы по маслам в порядке self.oils"""
+        return dict(zip(self.oils, self._result(self.encode(answers))[1]))
+
+    def best(self, answers):
+        """Ключ рекомендованного масла (flax, hemp, ...)"""
+        return self._result(self.encode(answers))[0]
+
+    def best_many(self, answer_sets):
+        """Пакетный режим для офлайн-настройки весов: рекомендация для каждого набора"""
+        return [self._result(self.encode(answers))[0] for answers in answer_sets]
+
+    def all_answer_sets(self):
+        """Все возможные наборы ответов на квиз"""
+        labels = [QUIZ_QUESTIONS[step][1] for step in self.steps]
+        return itertools.product(*labels)
+
+    def distribution(self, answer_sets=None):
+        """Сколько наборов ответов приводит к каждому маслу"""
+        if answer_sets is None:
+            answer_sets = self.all_answer_sets()
+        counts = Counter(self.best_many(answer_sets))
+        return {oil: counts.get(oil, 0) for oil in self.oils}
+
+
+_scorer = QuizScorer()
+_weights = {}
+
+
+def current():
+    """Текущий подборщик с последними опубликованными весами"""
+    return _scorer
+
+
+def publish(weights):
+    """Заменяет веса; если они не изменились, остаётся прежний подборщик с его кэшем"""
+    global _scorer, _weights
+    weights = weights or {}
+    if weights != _weights:
+        _scorer = QuizScorer(weights)
+        _weights = weights
+    return _scorer
+
+
+def save(weights, path):
+    """Записывает веса из таблицы в JSON-файл для остальных процессов бота"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(weights or {}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+_products = (None, {})
+
+
+def recommended_product(snapshot, oil):
+    """Корневой товар каталога для масла; таблица строится один раз на версию каталога"""
+    global _products
+    version, by_oil = _products
+    if version != snapshot.version:
+        by_oil = {key: snapshot.find_root_by_name(name) for key, name in OIL_RECOMMENDATIONS.items()}
+        _products = (snapshot.version, by_oil)
+    return by_oil.get(oil)
+
+
+if __name__ == "__main__":
+    # python quiz.py [weights.json] — распределение рекомендаций по всем наборам ответов
+    scorer = QuizScorer(load(sys.argv[1]) if len(sys.argv) > 1 else None)
+    total = 0
+    for oil, count in scorer.distribution().items():
+        total += count
+        print(f"{OIL_EMOJI[oil]} {OIL_RECOMMENDATIONS[oil]}: {count}")
+    print(f"Всего наборов ответов: {total}")
@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, запас не больше capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Через сколько секунд будет доступен токен (0 — уже доступен)"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def pause(self, seconds):
+        """Не выдавать токены ближайшие seconds секунд (например, после RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def is_group_chat(chat_id):
+    return isinstance(chat_id, int) and chat_id < 0
+
+
+class ChatRateLimiter:
+    """
+    Лимиты Telegram Bot API: общий на бота (~30 сообщений/с)
+    и на каждый чат (~1/с в личке, ~20/мин в группе).
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, group_rate_per_min=20, max_chats=10000, chat_burst=3):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_min / 60
+        self.max_chats = max_chats
+        self.chat_burst = chat_burst
+        self._chats = OrderedDict()
+
+    def chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if is_group_chat(chat_id):
+                bucket = TokenBucket(self.group_rate, capacity=self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+            self._chats[chat_id] = bucket
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
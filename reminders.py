@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import sqlite3
+import datetime
+
+from aiogram.exceptions import TelegramRetryAfter
+
+REMINDER_TEXT = "🌿 Как вам масло? Пора обновить курс 💛"
+
+
+class ReminderLedger:
+    """Журнал отправленных напоминаний: повторный запуск в тот же день не шлёт дубли"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reminders ("
+            "day TEXT NOT NULL, "
+            "chat TEXT NOT NULL, "
+            "sent_at REAL NOT NULL, "
+            "PRIMARY KEY (day, chat))"
+        )
+        self._db.commit()
+
+    def was_sent(self, day, chat):
+        return self._db.execute(
+            "SELECT 1 FROM reminders WHERE day = ? AND chat = ?", (day, str(chat))
+        ).fetchone() is not None
+
+    def mark_sent(self, day, chat):
+        self._db.execute(
+            "INSERT OR IGNORE INTO reminders (day, chat, sent_at) VALUES (?, ?, ?)",
+            (day, str(chat), time.time())
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class ReminderJob:
+    """
+    Фоновая рассылка напоминаний: параллельная отправка, обработка
+    RetryAfter и отчёт о прогрессе. Скорость ограничивает очередь отправки бота (outbound).
+    """
+
+    def __init__(self, bot, ledger, days=30, concurrency=20, max_retries=3, today=None):
+        self.bot = bot
+        self.ledger = ledger
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.today = today or datetime.date.today()
+        self.order_day = self.today - datetime.timedelta(days=days)
+        self.day_key = self.today.isoformat()
+        self.status = "pending"
+        self.started_at = None
+        self.finished_at = None
+        self.found = 0
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+        self.task = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def progress(self):
+        return {
+            "status": self.status,
+            "day": self.day_key,
+            "order_day": self.order_day.isoformat(),
+            "found": self.found,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "errors": self.errors[-10:],
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def start(self, load_recipients, on_done=None):
+        """
+        Запускает рассылку в фоне. load_recipients(day) — корутина,
+        возвращающая чаты клиентов, сделавших заказ в день day.
+        """
+        self.task = asyncio.create_task(self.run(load_recipients, on_done))
+        return self.task
+
+    async def run(self, load_recipients, on_done=None):
+        self.status = "running"
+        self.started_at = time.time()
+        try:
+            recipients = await load_recipients(self.order_day)
+            semaphore = asyncio.Semaphore(self.concurrency)
+            tasks = []
+            for chat in recipients:
+                self.found += 1
+                if self.ledger.was_sent(self.day_key, chat):
+                    self.skipped += 1
+                    continue
+                await semaphore.acquire()
+                task = asyncio.create_task(self._send(chat))
+                task.add_done_callback(lambda _: semaphore.release())
+                tasks.append(task)
+            await asyncio.gather(*tasks)
+            self.status = "done"
+        except Exception as e:
+            self.status = "failed"
+            self.errors.append(str(e))
+            print(f"❌ Reminder error: {e}")
+        finally:
+            self.finished_at = time.time()
+        print(f"📬 Напоминания: найдено {self.found}, отправлено {self.sent}, "
+              f"пропущено {self.skipped}, ошибок {self.failed}")
+        if on_done:
+            await on_done(self)
+
+    async def _send(self, chat):
+        for _ in range(self.max_retries + 1):
+            try:
+                await self.bot.send_message(chat, REMINDER_TEXT)
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except Exception as e:
+                self.failed += 1
+                self.errors.append(f"{chat}: {e}")
+                return
+            self.ledger.mark_sent(self.day_key, chat)
+            self.sent += 1
+            return
+        self.failed += 1
+        self.errors.append(f"{chat}: превышено число повторов после RetryAfter")
@@ -0,0 +1,168 @@
+import os
+import sqlite3
+from datetime import date, timedelta
+
+# Самый длинный период /stats, дней (дальше date уходит за пределы календаря)
+MAX_REPORT_DAYS = 3650
+
+
+class SalesLedger:
+    """
+    Позиции заказов и сводки продаж (SQLite, общий для процессов бота).
+
+    order_items — строки заказов: id заказа, товар, объём, количество, цена.
+    daily — выручка и штуки по товару за день, days — заказы и выручка за день,
+    products — итоги по товару за всё время. Сводки пополняются в той же
+    транзакции, что и позиции заказа, поэтому /stats читает только их
+    и не перебирает историю заказов.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS order_items ("
+            "order_id TEXT NOT NULL, "
+            "product_id TEXT NOT NULL, "
+            "day TEXT NOT NULL, "
+            "customer_id INTEGER, "
+            "name TEXT NOT NULL, "
+            "variant TEXT NOT NULL, "
+            "qty INTEGER NOT NULL, "
+            "price INTEGER NOT NULL, "
+            "PRIMARY KEY (order_id, product_id))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS daily ("
+            "day TEXT NOT NULL, "
+            "product_id TEXT NOT NULL, "
+            "units INTEGER NOT NULL, "
+            "revenue INTEGER NOT NULL, "
+            "PRIMARY KEY (day, product_id))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS days ("
+            "day TEXT PRIMARY KEY, "
+            "orders INTEGER NOT NULL, "
+            "units INTEGER NOT NULL, "
+            "revenue INTEGER NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            "product_id TEXT PRIMARY KEY, "
+            "name TEXT NOT NULL, "
+            "variant TEXT NOT NULL, "
+            "units INTEGER NOT NULL, "
+            "revenue INTEGER NOT NULL)"
+        )
+
+    def record(self, order_id, lines, customer_id=None, day=None):
+        """
+        Записывает позиции заказа (строки корзины) и пополняет сводки.
+        day — дата заказа (по умолчанию сегодня).
+        Повторная запись того же заказа ничего не меняет; возвращает False.
+        """
+        day = str(day or date.today())[:10]
+        lines = [line for line in lines if line["qty"] > 0]
+        units = sum(line["qty"] for line in lines)
+        revenue = sum(line["price"] * line["qty"] for line in lines)
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            if self._db.execute(
+                "SELECT 1 FROM order_items WHERE order_id = ? LIMIT 1", (order_id,)
+            ).fetchone():
+                self._db.execute("ROLLBACK")
+                return False
+            self._db.executemany(
+                "INSERT INTO order_items (order_id, product_id, day, customer_id, name, variant, qty, price) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(order_id, line["id"], day, customer_id, line["name"], line["variant"], line["qty"], line["price"])
+                 for line in lines]
+            )
+            self._db.executemany(
+                "INSERT INTO daily (day, product_id, units, revenue) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (day, product_id) DO UPDATE SET "
+                "units = units + excluded.units, revenue = revenue + excluded.revenue",
+                [(day, line["id"], line["qty"], line["price"] * line["qty"]) for line in lines]
+            )
+            self._db.executemany(
+                "INSERT INTO products (product_id, name, variant, units, revenue) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (product_id) DO UPDATE SET name = excluded.name, variant = excluded.variant, "
+                "units = units + excluded.units, revenue = revenue + excluded.revenue",
+                [(line["id"], line["name"], line["variant"], line["qty"], line["price"] * line["qty"])
+                 for line in lines]
+            )
+            self._db.execute(
+                "INSERT INTO days (day, orders, units, revenue) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT (day) DO UPDATE SET orders = orders + 1, "
+                "units = units + excluded.units, revenue = revenue + excluded.revenue",
+                (day, units, revenue)
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return True
+
+    def summary(self, since=None):
+        """Заказы, штуки, выручка и средний чек с дня since (None — за всё время)"""
+        orders, units, revenue = self._db.execute(
+            "SELECT COALESCE(SUM(orders), 0), COALESCE(SUM(units), 0), COALESCE(SUM(revenue), 0) "
+            "FROM days WHERE day >= ?",
+            (str(since or ""),)
+        ).fetchone()
+        return {
+            "orders": orders,
+            "units": units,
+            "revenue": revenue,
+            "average": round(revenue / orders) if orders else 0,
+        }
+
+    def top(self, since=None, limit=5):
+        """Самые продаваемые позиции по выручке: [(название, объём, штуки, выручка)]"""
+        if since is None:
+            return self._db.execute(
+                "SELECT name, variant, units, revenue FROM products "
+                "ORDER BY revenue DESC, units DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return self._db.execute(
+            "SELECT p.name, p.variant, SUM(d.units), SUM(d.revenue) FROM daily d "
+            "JOIN products p ON p.product_id = d.product_id "
+            "WHERE d.day >= ? GROUP BY d.product_id "
+            "ORDER BY SUM(d.revenue) DESC, SUM(d.units) DESC LIMIT ?",
+            (str(since), limit)
+        ).fetchall()
+
+    def first_day(self):
+        row = self._db.execute("SELECT MIN(day) FROM days").fetchone()
+        return row[0] if row else None
+
+    def report(self, days=30, top=5, today=None):
+        """
+        Текст для /stats: сегодня, 7 дней, days дней и всё время; лидеры продаж за days дней.
+        days ограничен MAX_REPORT_DAYS.
+        """
+        today = today or date.today()
+        days = min(max(int(days), 1), MAX_REPORT_DAYS)
+        periods = [("Сегодня", today), ("7 дней", today - timedelta(days=6))]
+        if days not in (1, 7):
+            periods.append((f"{days} дн.", today - timedelta(days=days - 1)))
+        periods.append(("Всё время", None))
+        first = self.first_day()
+        lines = [f"📊 Продажи (учёт с {first})" if first else "📊 Продаж пока нет"]
+        for title, since in periods:
+            s = self.summary(since.isoformat() if since else None)
+            lines.append(
+                f"{title}: {s['orders']} заказ., {s['units']} шт., {s['revenue']}₽, средний чек {s['average']}₽"
+            )
+        best = self.top((today - timedelta(days=days - 1)).isoformat(), limit=top)
+        if best:
+            lines.append(f"\n🏆 Лидеры за {days} дн.:")
+            lines += [f"{i}. {name} {variant} — {units} шт., {revenue}₽"
+                      for i, (name, variant, units, revenue) in enumerate(best, 1)]
+        return "\n".join(lines)
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,185 @@
+"""
+Поиск по каталогу для inline-режима (@бот запрос).
+
+Индекс строится один раз на снимок каталога: по префиксам слов
+(name, category, variant_label, description) и по триграммам — для опечаток
+и совпадений в середине слова. Ищем карточки товаров (корневые товары
+с вариантами), страницы ответов кэшируются до следующего снимка.
+"""
+import re
+from collections import OrderedDict
+
+from aiogram.types import (
+    InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultArticle,
+    InlineQueryResultCachedPhoto, InputTextMessageContent
+)
+
+import catalog_views
+
+PAGE_SIZE = 20
+MAX_PREFIX = 12
+FIELD_WEIGHTS = (("name", 8), ("category", 4), ("variant_label", 2), ("description", 1))
+# Доля триграмм слова запроса, которая должна найтись в товаре
+TRIGRAM_MATCH = 0.6
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    """Нижний регистр с учётом кириллицы, ё -> е"""
+    return str(text or "").casefold().replace("ё", "е")
+
+
+def words(text):
+    return _WORD.findall(normalize(text))
+
+
+def trigrams(word):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Индекс одного снимка каталога"""
+
+    def __init__(self, snapshot, page_cache_size=1000):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        self.docs = [p for p in snapshot.roots if snapshot.children(p.id) or p.price]
+        self._prefixes = {}    # префикс слова -> {номер товара: вес}
+        self._trigrams = {}    # триграмма -> {номер товара}
+        for doc, product in enumerate(self.docs):
+            for field, weight in FIELD_WEIGHTS:
+                values = [getattr(product, field)]
+                if field == "variant_label":
+                    values += [v.variant_label for v in snapshot.children(product.id)]
+                for word in words(" ".join(values)):
+                    for n in range(1, min(len(word), MAX_PREFIX) + 1):
+                        postings = self._prefixes.setdefault(word[:n], {})
+                        if postings.get(doc, 0) < weight:
+                            postings[doc] = weight
+                    for gram in trigrams(word):
+                        self._trigrams.setdefault(gram, set()).add(doc)
+        self._pages = OrderedDict()
+        self._page_cache_size = page_cache_size
+
+    def _match_word(self, word):
+        """{номер товара: вес} для одного слова запроса"""
+        if len(word) <= MAX_PREFIX:
+            exact = self._prefixes.get(word)
+        else:
+            # Длинное слово: префикс из индекса, остаток проверяется по тексту товара
+            exact = {
+                doc: weight for doc, weight in self._prefixes.get(word[:MAX_PREFIX], {}).items()
+                if word in normalize(self._text(doc))
+            }
+        if exact:
+            return exact
+        if len(word) < 3:
+            return {}
+        grams = trigrams(word)
+        counts = {}
+        for gram in grams:
+            for doc in self._trigrams.get(gram, ()):
+                counts[doc] = counts.get(doc, 0) + 1
+        need = max(2, int(len(grams) * TRIGRAM_MATCH + 0.5))
+        return {doc: count / len(grams) for doc, count in counts.items() if count >= need}
+
+    def _text(self, doc):
+        product = self.docs[doc]
+        return " ".join(getattr(product, field) for field, _ in FIELD_WEIGHTS)
+
+    def search(self, query):
+        """Номера подходящих товаров, лучшие первыми; пустой запрос — весь каталог по порядку"""
+        query_words = words(query)
+        if not query_words:
+            return list(range(len(self.docs)))
+        scores = None
+        for word in query_words:
+            matched = self._match_word(word)
+            if scores is None:
+                scores = dict(matched)
+            else:
+                scores = {doc: score + matched[doc] for doc, score in scores.items() if doc in matched}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda doc: (-scores[doc], doc))
+
+    def page(self, query, offset=0, page_size=PAGE_SIZE):
+        """(товары страницы, offset следующей страницы или "")"""
+        key = (" ".join(words(query)), offset)
+        cached = self._pages.get(key)
+        if cached is not None:
+            self._pages.move_to_end(key)
+            return cached
+        found = self.search(query)
+        products = [self.docs[doc] for doc in found[offset:offset + page_size]]
+        next_offset = str(offset + page_size) if len(found) > offset + page_size else ""
+        result = (products, next_offset)
+        self._pages[key] = result
+        if len(self._pages) > self._page_cache_size:
+            self._pages.popitem(last=False)
+        return result
+
+
+def _variants_text(product, snapshot):
+    variants = [f"{v.variant_label} — {v.price}₽" for v in snapshot.children(product.id) if v.price]
+    if not variants and product.price:
+        variants = [f"{product.price}₽"]
+    return ", ".join(variants)
+
+
+class InlineResults:
+    """Готовые inline-результаты для товаров снимка (собираются при первом показе)"""
+
+    def __init__(self, index):
+        self.index = index
+        self._results = {}
+
+    def result(self, product, photo_ok):
+        key = (product.id, photo_ok)
+        result = self._results.get(key)
+        if result is None:
+            result = self._build(product, photo_ok)
+            self._results[key] = result
+        return result
+
+    def _build(self, product, photo_ok):
+        snapshot = self.index.snapshot
+        view = catalog_views.for_catalog(snapshot).category(product.id)
+        # Под inline-сообщением нет «Назад в каталог»: кнопки вариантов и новый поиск
+        buttons = list(view.markup.inline_keyboard[:-1])
+        buttons.append([InlineKeyboardButton(text="🔎 Искать ещё", switch_inline_query_current_chat="")])
+        markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+        description = _variants_text(product, snapshot) or product.category
+        result_id = f"{snapshot.version}:{product.id}:{int(photo_ok)}"[:64]
+        if photo_ok:
+            return InlineQueryResultCachedPhoto(
+                id=result_id, photo_file_id=product.file_id, title=product.name,
+                description=description, caption=view.text, parse_mode="Markdown", reply_markup=markup
+            )
+        return InlineQueryResultArticle(
+            id=result_id, title=product.name, description=description,
+            input_message_content=InputTextMessageContent(message_text=view.text, parse_mode="Markdown"),
+            reply_markup=markup
+        )
+
+
+_index = None
+_results = None
+
+
+def for_catalog(snapshot):
+    """Индекс для снимка, перестраивается при смене версии каталога"""
+    global _index, _results
+    index = _index
+    if index is None or index.version != snapshot.version:
+        index = SearchIndex(snapshot)
+        _results = InlineResults(index)
+        _index = index
+    return index
+
+
+def results_for(snapshot):
+    for_catalog(snapshot)
+    return _results
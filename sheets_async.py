@@ -0,0 +1,74 @@
+"""
+Асинхронная обёртка над google_sheets.
+Все блокирующие вызовы gspread выполняются в ограниченном пуле потоков,
+чтобы медленный ответ Google не останавливал обработку апдейтов.
+"""
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import google_sheets
+import metrics
+from config import SHEETS_POOL_SIZE
+
+_executor = ThreadPoolExecutor(max_workers=SHEETS_POOL_SIZE, thread_name_prefix="sheets")
+
+
+async def run(func, *args, **kwargs):
+    """
+    Выполняет блокирующую функцию в пуле потоков Sheets через автомат защиты:
+    пока таблица недоступна, вызов сразу падает с CircuitOpenError.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(google_sheets.breaker.call, func, *args, **kwargs)
+    name = getattr(func, "__qualname__", repr(func))
+    started = time.perf_counter()
+    try:
+        result = await loop.run_in_executor(_executor, call)
+    except google_sheets.CircuitOpenError:
+        metrics.SHEETS_CALLS.inc(func=name, result="rejected")
+        raise
+    except Exception:
+        metrics.SHEETS_CALLS.inc(func=name, result="error")
+        metrics.SHEETS_SECONDS.observe(time.perf_counter() - started, func=name)
+        raise
+    metrics.SHEETS_CALLS.inc(func=name, result="ok")
+    metrics.SHEETS_SECONDS.observe(time.perf_counter() - started, func=name)
+    return result
+
+
+async def connect_to_sheet():
+    return await run(google_sheets.connect_to_sheet)
+
+
+async def get_order_rows(spreadsheet, start_row):
+    return await run(google_sheets.get_order_rows, spreadsheet, start_row)
+
+
+async def append_orders(spreadsheet, rows):
+    return await run(google_sheets.append_orders, spreadsheet, rows)
+
+
+async def load_products_if_changed(reader, force=False):
+    return await run(reader.load, force)
+
+
+async def probe(spreadsheet):
+    return await run(google_sheets.probe, spreadsheet)
+
+
+async def load_quiz_weights(spreadsheet):
+    return await run(google_sheets.load_quiz_weights, spreadsheet)
+
+
+async def update_product_photos(spreadsheet, photos, reader=None):
+    return await run(google_sheets.update_product_photos, spreadsheet, photos, reader)
+
+
+async def update_product_stock(spreadsheet, decrements, reader=None):
+    return await run(google_sheets.update_product_stock, spreadsheet, decrements, reader)
+
+
+def shutdown():
+    _executor.shutdown(wait=False)
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class Namespace:
+    """
+    Словарь состояния пользователей (корзины, шаги квиза и т.п.) поверх хранилища.
+    Значения должны сериализоваться в JSON. Изменённое значение нужно
+    записать обратно через ns[key] = value — иначе в SQLite оно не сохранится.
+    """
+
+    def __init__(self, store, name, ttl=None):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        return self.store.get(self.name, str(key), default)
+
+    def set(self, key, value, ttl=None):
+        self.store.set(self.name, str(key), value, ttl if ttl is not None else self.ttl)
+
+    def pop(self, key, default=None):
+        return self.store.pop(self.name, str(key), default)
+
+    def add(self, key, value=True, ttl=None):
+        """Записывает значение, только если ключа ещё нет; True — если записано"""
+        return self.store.add(self.name, str(key), value, ttl if ttl is not None else self.ttl)
+
+    def __getitem__(self, key):
+        value = self.store.get(self.name, str(key), _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __contains__(self, key):
+        return self.store.get(self.name, str(key), _MISSING) is not _MISSING
+
+    def __len__(self):
+        return self.store.size(self.name)
+
+
+class MemoryStore:
+    """
+    Хранилище в памяти процесса: LRU с ограничением числа записей
+    в каждом пространстве имён и сроком жизни записей.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def namespace(self, name, ttl=None):
+        return Namespace(self, name, ttl)
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entries = self._data.get(namespace)
+            if not entries or key not in entries:
+                return default
+            expires, value = entries[key]
+            if expires is not None and expires <= time.time():
+                del entries[key]
+                return default
+            entries.move_to_end(key)
+            return value
+
+    def set(self, namespace, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            entries = self._data.setdefault(namespace, OrderedDict())
+            entries[key] = (expires, value)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def add(self, namespace, key, value, ttl=None):
+        if self.get(namespace, key, _MISSING) is not _MISSING:
+            return False
+        self.set(namespace, key, value, ttl)
+        return True
+
+    def pop(self, namespace, key, default=None):
+        with self._lock:
+            entries = self._data.get(namespace)
+            if not entries or key not in entries:
+                return default
+            expires, value = entries.pop(key)
+            if expires is not None and expires <= time.time():
+                return default
+            return value
+
+    def size(self, namespace=None):
+        with self._lock:
+            if namespace is not None:
+                return len(self._data.get(namespace, ()))
+            return sum(len(entries) for entries in self._data.values())
+
+    def purge_expired(self):
+        """Удаляет просроченные записи, возвращает их количество"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for entries in self._data.values():
+                expired = [k for k, (expires, _) in entries.items() if expires is not None and expires <= now]
+                for k in expired:
+                    del entries[k]
+                removed += len(expired)
+        return removed
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+    """
+    Постоянное хранилище в SQLite: переживает перезапуски и может
+    использоваться несколькими процессами бота одновременно.
+    """
+
+    def __init__(self, path, max_entries=100000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "value TEXT NOT NULL, "
+            "expires REAL, "
+            "updated REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS state_expires ON state (expires)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS state_updated ON state (namespace, updated)")
+        self._db.commit()
+
+    def namespace(self, name, ttl=None):
+        return Namespace(self, name, ttl)
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM state WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires, updated) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None, now)
+            )
+            self._db.commit()
+
+    def add(self, namespace, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ? AND expires <= ?",
+                (namespace, key, now)
+            )
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO state (namespace, key, value, expires, updated) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None, now)
+            )
+            self._db.commit()
+        return cur.rowcount == 1
+
+    def pop(self, namespace, key, default=None):
+        with self._lock:
+            row = self._db.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ? RETURNING value, expires",
+                (namespace, key)
+            ).fetchone()
+            self._db.commit()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def size(self, namespace=None):
+        with self._lock:
+            if namespace is not None:
+                return self._db.execute(
+                    "SELECT COUNT(*) FROM state WHERE namespace = ?", (namespace,)
+                ).fetchone()[0]
+            return self._db.execute("SELECT COUNT(*) FROM state").fetchone()[0]
+
+    def purge_expired(self):
+        """Удаляет просроченные записи и самые старые сверх лимита, возвращает их количество"""
+        with self._lock:
+            cur = self._db.execute(
+                "DELETE FROM state WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)
+            )
+            removed = cur.rowcount
+            namespaces = [row[0] for row in self._db.execute("SELECT DISTINCT namespace FROM state")]
+            for namespace in namespaces:
+                cur = self._db.execute(
+                    "DELETE FROM state WHERE namespace = ? AND key IN ("
+                    "SELECT key FROM state WHERE namespace = ? ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                    (namespace, namespace, self.max_entries)
+                )
+                removed += cur.rowcount
+            self._db.commit()
+        return removed
+
+    def close(self):
+        self._db.close()
+
+
+def create_store(backend, path, max_entries):
+    """Хранилище состояния по имени бэкенда: memory или sqlite"""
+    if backend == "sqlite":
+        return SQLiteStore(path, max_entries=max_entries)
+    if backend == "memory":
+        return MemoryStore(max_entries=max_entries)
+    raise ValueError(f"Неизвестный STATE_BACKEND: {backend}")
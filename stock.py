@@ -0,0 +1,252 @@
+import os
+import time
+import asyncio
+import sqlite3
+
+
+def parse_stock(value):
+    """Остаток из колонки stock; None — остаток не ведётся (пустая ячейка или не число)"""
+    try:
+        return max(int(float(str(value).replace(",", "."))), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class StockLedger:
+    """
+    Журнал остатков (SQLite, общий для процессов бота).
+
+    base — остаток из листа Products на момент последнего снимка каталога,
+    unsynced — проданное, но ещё не списанное в таблице,
+    reservations — товары в корзинах, со сроком жизни корзины.
+    Доступно = base − unsynced − активные резервы. Резерв и проверка выполняются
+    одной транзакцией, поэтому два покупателя не заберут последнюю единицу.
+    Списания копятся в unsynced и уходят в таблицу пачкой в run().
+    Товары без числа в колонке stock не ограничиваются.
+    """
+
+    def __init__(self, path, ttl, sync_interval=30, max_backoff=300):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.max_backoff = max_backoff
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS stock ("
+            "product_id TEXT PRIMARY KEY, "
+            "base INTEGER, "
+            "unsynced INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reservations ("
+            "user_id TEXT NOT NULL, "
+            "product_id TEXT NOT NULL, "
+            "qty INTEGER NOT NULL, "
+            "expires REAL NOT NULL, "
+            "PRIMARY KEY (user_id, product_id))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS reservations_product ON reservations (product_id, expires)")
+        # Общий с обновлением каталога: базу из листа не перезапишет остаток, прочитанный до списания
+        self.sync_lock = asyncio.Lock()
+
+    def _available(self, product_id, now, exclude_user=None):
+        """Свободный остаток; None — остаток не ведётся"""
+        row = self._db.execute(
+            "SELECT base, unsynced FROM stock WHERE product_id = ?", (product_id,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        reserved = self._db.execute(
+            "SELECT COALESCE(SUM(qty), 0) FROM reservations "
+            "WHERE product_id = ? AND expires > ? AND user_id != ?",
+            (product_id, now, str(exclude_user))
+        ).fetchone()[0]
+        return row[0] - row[1] - reserved
+
+    def available(self, product_id):
+        return self._available(str(product_id), time.time())
+
+    def reserved(self, user_id, product_id):
+        row = self._db.execute(
+            "SELECT qty FROM reservations WHERE user_id = ? AND product_id = ? AND expires > ?",
+            (str(user_id), str(product_id), time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set_base(self, products):
+        """Остатки из нового снимка каталога"""
+        rows = [(p.id, parse_stock(p.stock)) for p in products]
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany(
+                "INSERT INTO stock (product_id, base) VALUES (?, ?) "
+                "ON CONFLICT (product_id) DO UPDATE SET base = excluded.base",
+                rows
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def reserve(self, user_id, product_id, qty=1):
+        """
+        Резервирует ещё qty единиц для корзины пользователя.
+        False — столько свободного остатка нет (резерв не меняется).
+        """
+        return self.reconcile(user_id, {product_id: self.reserved(user_id, product_id) + qty},
+                              partial=False)[str(product_id)] is not None
+
+    def reconcile(self, user_id, wanted, partial=True, release_others=False):
+        """
+        Приводит резервы пользователя к wanted {id товара: количество}.
+        Возвращает {id: выданное количество}: меньше запрошенного, если остатка
+        не хватает (при partial=False — None и резерв не меняется).
+        release_others — снять резервы товаров, которых нет в wanted.
+        Сроки всех резервов пользователя продлеваются на ttl.
+        """
+        user_id = str(user_id)
+        now = time.time()
+        expires = now + self.ttl
+        granted = {}
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            for product_id, qty in wanted.items():
+                product_id = str(product_id)
+                available = self._available(product_id, now, exclude_user=user_id)
+                if available is not None and qty > available:
+                    if not partial:
+                        granted[product_id] = None
+                        continue
+                    qty = max(available, 0)
+                granted[product_id] = qty
+                if available is None or qty <= 0:
+                    self._db.execute(
+                        "DELETE FROM reservations WHERE user_id = ? AND product_id = ?", (user_id, product_id)
+                    )
+                else:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO reservations (user_id, product_id, qty, expires) "
+                        "VALUES (?, ?, ?, ?)",
+                        (user_id, product_id, qty, expires)
+                    )
+            if release_others:
+                keep = list(granted)
+                self._db.execute(
+                    f"DELETE FROM reservations WHERE user_id = ? "
+                    f"AND product_id NOT IN ({','.join('?' * len(keep))})",
+                    (user_id, *keep)
+                )
+            # Истёкшие резервы не воскрешаем: их остаток уже мог уйти другим
+            self._db.execute("DELETE FROM reservations WHERE user_id = ? AND expires <= ?", (user_id, now))
+            self._db.execute("UPDATE reservations SET expires = ? WHERE user_id = ?", (expires, user_id))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return granted
+
+    def release(self, user_id, product_id, qty=None):
+        """Снимает qty единиц резерва (None — весь резерв товара)"""
+        user_id, product_id = str(user_id), str(product_id)
+        if qty is None:
+            self._db.execute(
+                "DELETE FROM reservations WHERE user_id = ? AND product_id = ?", (user_id, product_id)
+            )
+            return
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute(
+                "UPDATE reservations SET qty = qty - ? WHERE user_id = ? AND product_id = ?",
+                (qty, user_id, product_id)
+            )
+            self._db.execute("DELETE FROM reservations WHERE user_id = ? AND qty <= 0", (user_id,))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def release_all(self, user_id):
+        self._db.execute("DELETE FROM reservations WHERE user_id = ?", (str(user_id),))
+
+    def commit(self, user_id):
+        """Оформленный заказ: резервы пользователя превращаются в списания"""
+        user_id = str(user_id)
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            sold = self._db.execute(
+                "SELECT product_id, qty FROM reservations WHERE user_id = ? AND expires > ?",
+                (user_id, time.time())
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE stock SET unsynced = unsynced + ? WHERE product_id = ?",
+                [(qty, product_id) for product_id, qty in sold]
+            )
+            self._db.execute("DELETE FROM reservations WHERE user_id = ?", (user_id,))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return dict(sold)
+
+    def pending(self):
+        """Несписанные продажи {id товара: количество}"""
+        return dict(self._db.execute(
+            "SELECT product_id, unsynced FROM stock WHERE unsynced > 0"
+        ).fetchall())
+
+    def purge_expired(self):
+        cur = self._db.execute("DELETE FROM reservations WHERE expires <= ?", (time.time(),))
+        return cur.rowcount
+
+    def _mark_synced(self, sent, written):
+        """
+        sent — отправленные списания, written — {id: новый остаток в таблице или None}.
+        Товаров, которых нет в written (строка не найдена в таблице), списание остаётся в unsynced.
+        """
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            for product_id, qty in sent.items():
+                if product_id not in written:
+                    continue
+                new_base = written[product_id]
+                self._db.execute(
+                    "UPDATE stock SET unsynced = MAX(unsynced - ?, 0), "
+                    "base = COALESCE(?, base) WHERE product_id = ?",
+                    (qty, new_base, product_id)
+                )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    async def flush(self, write_decrements):
+        """
+        Списывает накопленные продажи в таблице. write_decrements — корутина,
+        принимающая {id товара: количество} и возвращающая {id: новый остаток или None}.
+        Возвращает то же, что write_decrements.
+        """
+        async with self.sync_lock:
+            sent = self.pending()
+            if not sent:
+                return {}
+            written = await write_decrements(sent)
+            self._mark_synced(sent, written)
+            print(f"✅ Остатки списаны в таблице: {len(written)} товаров")
+            return written
+
+    async def run(self, write_decrements):
+        """Фоновый цикл списаний с экспоненциальной задержкой при ошибках"""
+        delay = self.sync_interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.flush(write_decrements)
+                delay = self.sync_interval
+            except Exception as e:
+                delay = min(max(delay, 1) * 2, self.max_backoff)
+                print(f"⚠️ Ошибка списания остатков ({len(self.pending())} товаров), повтор через {delay} c: {e}")
+
+    def close(self):
+        self._db.close()
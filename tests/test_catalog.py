@@ -0,0 +1,60 @@
+"""
+Снимок каталога и кэш карточек: остатки не меняют версию и не перерисовывают карточки.
+
+Запуск из корня проекта: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog  # noqa: E402
+import catalog_views  # noqa: E402
+from catalog import Catalog, Product  # noqa: E402
+
+PRODUCTS = [
+    Product("1", category="Лён", name="Масло льняное", description="Омега-3"),
+    Product("2", "1", "Лён", "Масло льняное", "100 мл", "300", stock="10"),
+    Product("4", category="Тыква", name="Масло тыквенное"),
+    Product("5", "4", "Тыква", "Масло тыквенное", "100 мл", "900", stock="3"),
+]
+
+
+class CatalogVersionTest(unittest.TestCase):
+    def test_stock_does_not_change_version(self):
+        sold = [p.replace(stock="7") if p.id == "2" else p for p in PRODUCTS]
+        self.assertEqual(Catalog(PRODUCTS).version, Catalog(sold).version)
+
+    def test_price_changes_version(self):
+        repriced = [p.replace(price="350") if p.id == "2" else p for p in PRODUCTS]
+        self.assertNotEqual(Catalog(PRODUCTS).version, Catalog(repriced).version)
+
+    def test_patch_keeps_new_stock(self):
+        catalog.publish(PRODUCTS)
+        snapshot = catalog.patch({"2": {"stock": "7"}})
+        self.assertEqual(snapshot.get("2").stock, "7")
+        self.assertEqual(snapshot.version, Catalog(PRODUCTS).version)
+
+
+class CatalogViewsTest(unittest.TestCase):
+    def test_cards_survive_stock_changes(self):
+        views = catalog_views.CatalogViews(Catalog(PRODUCTS))
+        changed = [
+            p.replace(stock="0") if p.id == "2" else p.replace(price="950") if p.id == "5" else p
+            for p in PRODUCTS
+        ]
+        updated = catalog_views.CatalogViews(Catalog(changed), previous=views)
+        self.assertIs(updated.category("1"), views.category("1"))
+        self.assertIsNot(updated.category("4"), views.category("4"))
+
+    def test_long_id_skips_only_its_button(self):
+        long_id = "x" * 60
+        products = PRODUCTS + [Product(long_id, "1", "Лён", "Масло льняное", "500 мл", "1200")]
+        view = catalog_views.CatalogViews(Catalog(products)).category("1")
+        labels = [row[0].text for row in view.markup.inline_keyboard]
+        self.assertEqual(labels, ["100 мл — 300₽", "⬅️ Назад в каталог"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+"""
+Проверки подключения к Google Sheets на настоящем gspread (без fake_sheets).
+
+Запуск из корня проекта: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("ADMIN_CHAT_ID", "1")
+
+import gspread  # noqa: E402
+from google.auth.credentials import AnonymousCredentials  # noqa: E402
+
+import google_sheets  # noqa: E402
+from config import SHEETS_TIMEOUT, SHEETS_POOL_SIZE  # noqa: E402
+
+
+class ConfigureClientTest(unittest.TestCase):
+    def test_real_client_gets_timeout_and_pool(self):
+        client = google_sheets.configure_client(gspread.Client(AnonymousCredentials()))
+        self.assertEqual(client.http_client.timeout, SHEETS_TIMEOUT)
+        adapter = client.http_client.session.get_adapter("https://sheets.googleapis.com")
+        self.assertEqual(adapter._pool_maxsize, SHEETS_POOL_SIZE)
+
+
+class FakeSpreadsheet:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def worksheet(self, title):
+        self.calls += 1
+        raise self.error
+
+
+class CachedWorksheetTest(unittest.TestCase):
+    def setUp(self):
+        google_sheets.reset_worksheet_cache()
+
+    def test_missing_sheet_falls_back_without_caching(self):
+        spreadsheet = FakeSpreadsheet(gspread.WorksheetNotFound("Orders"))
+        self.assertEqual(google_sheets._cached_worksheet(spreadsheet, "Orders", lambda: "sheet1"), "sheet1")
+        google_sheets._cached_worksheet(spreadsheet, "Orders", lambda: "sheet1")
+        self.assertEqual(spreadsheet.calls, 2)
+
+    def test_transient_error_is_raised(self):
+        spreadsheet = FakeSpreadsheet(ConnectionError("reset by peer"))
+        with self.assertRaises(ConnectionError):
+            google_sheets._cached_worksheet(spreadsheet, "Orders", lambda: "sheet1")
+
+
+class QuizWeightsTest(unittest.TestCase):
+    def setUp(self):
+        google_sheets.reset_worksheet_cache()
+
+    def test_missing_tab_means_default_weights(self):
+        spreadsheet = FakeSpreadsheet(gspread.WorksheetNotFound("QuizWeights"))
+        self.assertIsNone(google_sheets.load_quiz_weights(spreadsheet))
+
+    def test_read_error_is_not_a_missing_tab(self):
+        spreadsheet = FakeSpreadsheet(ConnectionError("timeout"))
+        with self.assertRaises(ConnectionError):
+            google_sheets.load_quiz_weights(spreadsheet)
+
+
+PRODUCTS_HEADER = ["id", "parent_id", "category", "name", "variant_label",
+                   "price", "description", "our_price", "supplier", "stock", "file_id", "active"]
+
+
+class ProductsSheet:
+    """Лист Products в памяти: чтение колонок и пакетная запись ячеек"""
+
+    def __init__(self, rows):
+        self.rows = [list(r) + [""] * (len(PRODUCTS_HEADER) - len(r)) for r in rows]
+        self.downloads = 0
+        self.updated = 0
+
+    def worksheet(self, title):
+        if title != "Products":
+            raise gspread.WorksheetNotFound(title)
+        return self
+
+    def get_lastUpdateTime(self):
+        return str(self.updated)
+
+    def get_all_values(self):
+        self.downloads += 1
+        return [list(row) for row in self.rows]
+
+    def acell(self, label):
+        row, col = gspread.utils.a1_to_rowcol(label)
+        return gspread.Cell(row, col, self.rows[row - 1][col - 1] or None)
+
+    def col_values(self, col):
+        return [row[col - 1] for row in self.rows]
+
+    def batch_get(self, ranges):
+        columns = [gspread.utils.a1_to_rowcol(r.split(":")[0] + "1")[1] for r in ranges]
+        return [[[row[col - 1]] if row[col - 1] else [] for row in self.rows] for col in columns]
+
+    def batch_update(self, data):
+        for update in data:
+            row, col = gspread.utils.a1_to_rowcol(update["range"])
+            self.rows[row - 1][col - 1] = update["values"][0][0]
+
+    def cell(self, product_id, name):
+        for row in self.rows:
+            if row[0] == product_id:
+                return row[PRODUCTS_HEADER.index(name)]
+
+
+class StaleReader:
+    """Индекс строк с прошлой загрузки каталога — до того, как в лист вставили строку"""
+    row_index = {"1": 2, "2": 3, "3": 4, "5": 5}
+
+    def column(self, name, default):
+        return PRODUCTS_HEADER.index(name) + 1
+
+
+def sheet_after_insert():
+    # Админ вставил товар 4 между 1 и 2: все строки ниже сдвинулись
+    return ProductsSheet([
+        PRODUCTS_HEADER,
+        ["1", "", "Лён", "Масло льняное"],
+        ["4", "", "Тыква", "Масло тыквенное"],
+        ["2", "1", "Лён", "Масло льняное", "100 мл", "300", "", "", "", "10"],
+        ["3", "1", "Лён", "Масло льняное", "250 мл", "600", "", "", "", "5"],
+        ["5", "4", "Тыква", "Масло тыквенное", "100 мл", "900", "", "", "", ""],
+    ])
+
+
+class ProductsRevisionTest(unittest.TestCase):
+    def setUp(self):
+        google_sheets.reset_worksheet_cache()
+        self.sheet = sheet_after_insert()
+        self.sheet.rows[0].append("v1")   # ячейка версии справа от заголовка (M1)
+
+    def reload_after_order(self, reader):
+        self.sheet.updated += 1   # бот добавил заказ: время изменения таблицы сдвинулось
+        return reader.load()
+
+    def test_spreadsheet_time_changes_with_bot_writes(self):
+        reader = google_sheets.ProductSheetReader(self.sheet, revision_cell="")
+        reader.load(force=True)
+        self.assertIsNotNone(self.reload_after_order(reader))
+        self.assertEqual(self.sheet.downloads, 2)
+
+    def test_revision_cell_ignores_bot_writes(self):
+        reader = google_sheets.ProductSheetReader(self.sheet, revision_cell="M1")
+        reader.load(force=True)
+        self.assertIsNone(self.reload_after_order(reader))
+        self.sheet.rows[0][12] = "v2"
+        self.assertIsNotNone(reader.load())
+        self.assertEqual(self.sheet.downloads, 2)
+
+    def test_empty_revision_cell_always_downloads(self):
+        self.sheet.rows[0][12] = ""
+        reader = google_sheets.ProductSheetReader(self.sheet, revision_cell="M1")
+        reader.load(force=True)
+        self.assertIsNotNone(reader.load())
+
+
+class UpdatePhotosTest(unittest.TestCase):
+    def setUp(self):
+        google_sheets.reset_worksheet_cache()
+
+    def test_rows_found_by_fresh_ids(self):
+        sheet = sheet_after_insert()
+        updated = google_sheets.update_product_photos(sheet, {"5": "photo-5", "9": "photo-9"}, StaleReader())
+        self.assertEqual(updated, ["5"])
+        self.assertEqual(sheet.cell("5", "file_id"), "photo-5")
+        self.assertEqual(sheet.cell("3", "file_id"), "")
+
+
+class UpdateStockTest(unittest.TestCase):
+    def setUp(self):
+        google_sheets.reset_worksheet_cache()
+
+    def test_rows_found_by_fresh_ids(self):
+        sheet = sheet_after_insert()
+        written = google_sheets.update_product_stock(sheet, {"3": 3, "5": 1, "9": 1}, StaleReader())
+        self.assertEqual(written, {"3": 2, "5": None})
+        self.assertEqual(sheet.cell("3", "stock"), 2)
+        self.assertEqual(sheet.cell("2", "stock"), "10")
+
+
+if __name__ == "__main__":
+    unittest.main()
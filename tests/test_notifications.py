@@ -0,0 +1,58 @@
+"""
+Уведомления о заказах: повтор только после RetryAfter, без дублей после прочих ошибок.
+
+Запуск из корня проекта: python -m unittest discover tests
+"""
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+
+from notifications import NotificationDispatcher  # noqa: E402
+
+
+class Bot:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+def retry_after(seconds=0):
+    return TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Too Many Requests", seconds)
+
+
+async def deliver(bot, retries=3):
+    dispatcher = NotificationDispatcher(bot, [1], retries=retries)
+    dispatcher.notify("🛍 Новый заказ")
+    await dispatcher.drain()
+
+
+class NotificationDispatcherTest(unittest.TestCase):
+    def test_retry_after_is_retried(self):
+        bot = Bot(retry_after(), retry_after())
+        asyncio.run(deliver(bot))
+        self.assertEqual(len(bot.sent), 3)
+
+    def test_other_errors_are_not_resent(self):
+        bot = Bot(asyncio.TimeoutError())
+        asyncio.run(deliver(bot))
+        self.assertEqual(len(bot.sent), 1)
+
+    def test_gives_up_after_retries(self):
+        bot = Bot(*[retry_after() for _ in range(5)])
+        asyncio.run(deliver(bot, retries=1))
+        self.assertEqual(len(bot.sent), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+"""
+Очередь исходящих запросов: приоритеты, запас для ответов, лимиты чатов и правки сообщений.
+
+Запуск из корня проекта: python -m unittest discover tests
+"""
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.methods import SendMessage, EditMessageText, EditMessageReplyMarkup  # noqa: E402
+
+import outbound  # noqa: E402
+from outbound import OutboundQueue, INTERACTIVE, BULK  # noqa: E402
+from rate_limit import ChatRateLimiter  # noqa: E402
+
+
+def describe(method):
+    name = method.__api_method__
+    if name == "sendMessage":
+        return (name, method.chat_id, method.text)
+    if name == "editMessageText":
+        return (name, method.message_id, method.text)
+    return (name, method.message_id)
+
+
+class Telegram:
+    """make_request: записывает отправленное и следит, чтобы правки одного сообщения не шли параллельно"""
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.sent = []
+        self.editing = set()
+        self.overlaps = 0
+
+    async def __call__(self, bot, method):
+        message_id = getattr(method, "message_id", None)
+        if message_id is not None:
+            self.overlaps += message_id in self.editing
+            self.editing.add(message_id)
+        self.sent.append(describe(method))
+        await asyncio.sleep(self.latency)
+        self.editing.discard(message_id)
+        return describe(method)
+
+
+async def send(queue, telegram, level, method):
+    with outbound.priority(level):
+        return await queue(telegram, None, method)
+
+
+def run(queue, telegram, *requests):
+    """requests — (приоритет, метод); все встают в очередь до первой отправки"""
+    async def main():
+        return await asyncio.gather(*(send(queue, telegram, level, method) for level, method in requests))
+    return asyncio.run(main())
+
+
+class OrderingTest(unittest.TestCase):
+    def test_interactive_overtakes_bulk(self):
+        telegram = Telegram()
+        run(OutboundQueue(), telegram,
+            (BULK, SendMessage(chat_id=1, text="рассылка 1")),
+            (BULK, SendMessage(chat_id=2, text="рассылка 2")),
+            (INTERACTIVE, SendMessage(chat_id=3, text="ответ")))
+        self.assertEqual([text for _, _, text in telegram.sent], ["ответ", "рассылка 1", "рассылка 2"])
+
+    def test_reserve_keeps_tokens_for_interactive(self):
+        telegram = Telegram()
+
+        async def main():
+            queue = OutboundQueue(ChatRateLimiter(global_rate=10), reserve=5)
+            queue.limiter.global_bucket.tokens = 3
+            bulk = asyncio.ensure_future(send(queue, telegram, BULK, SendMessage(chat_id=1, text="рассылка")))
+            await asyncio.sleep(0.05)
+            self.assertEqual(telegram.sent, [])
+            await send(queue, telegram, INTERACTIVE, SendMessage(chat_id=2, text="ответ"))
+            self.assertEqual(telegram.sent, [("sendMessage", 2, "ответ")])
+            await bulk
+
+        asyncio.run(main())
+        self.assertEqual(telegram.sent[-1], ("sendMessage", 1, "рассылка"))
+
+    def test_chat_bucket_delays_only_its_chat(self):
+        telegram = Telegram()
+
+        async def main():
+            queue = OutboundQueue(ChatRateLimiter(chat_rate=20, chat_burst=1))
+            await asyncio.gather(
+                send(queue, telegram, BULK, SendMessage(chat_id=1, text="1a")),
+                send(queue, telegram, BULK, SendMessage(chat_id=1, text="1b")),
+                send(queue, telegram, BULK, SendMessage(chat_id=2, text="2a")),
+            )
+
+        asyncio.run(main())
+        self.assertEqual([text for _, _, text in telegram.sent], ["1a", "2a", "1b"])
+
+    def test_private_chat_bucket_skips_interactive(self):
+        telegram = Telegram()
+
+        async def main():
+            queue = OutboundQueue(ChatRateLimiter(chat_rate=0.1, chat_burst=1))
+            await asyncio.wait_for(asyncio.gather(
+                send(queue, telegram, INTERACTIVE, SendMessage(chat_id=1, text="a")),
+                send(queue, telegram, INTERACTIVE, SendMessage(chat_id=1, text="b")),
+            ), 1)
+
+        asyncio.run(main())
+        self.assertEqual(len(telegram.sent), 2)
+
+
+class EditCoalescingTest(unittest.TestCase):
+    def run_queue(self, telegram, *requests):
+        async def main():
+            queue = OutboundQueue()
+            results = await asyncio.gather(*(send(queue, telegram, level, method) for level, method in requests))
+            self.assertEqual(queue._edits, {})
+            return results
+        return asyncio.run(main())
+
+    def test_same_method_edits_coalesce(self):
+        telegram = Telegram()
+        results = self.run_queue(telegram,
+                                 (BULK, EditMessageText(chat_id=1, message_id=7, text="1 шт.")),
+                                 (BULK, EditMessageText(chat_id=1, message_id=7, text="2 шт.")))
+        self.assertEqual(telegram.sent, [("editMessageText", 7, "2 шт.")])
+        self.assertEqual(results, [("editMessageText", 7, "2 шт.")] * 2)
+
+    def test_interactive_edit_promotes_queued_edit(self):
+        telegram = Telegram()
+        self.run_queue(telegram,
+                       (BULK, SendMessage(chat_id=2, text="рассылка")),
+                       (BULK, EditMessageText(chat_id=1, message_id=7, text="старое")),
+                       (INTERACTIVE, EditMessageText(chat_id=1, message_id=7, text="новое")))
+        self.assertEqual(telegram.sent, [("editMessageText", 7, "новое"), ("sendMessage", 2, "рассылка")])
+
+    def test_promotion_keeps_edits_in_order(self):
+        telegram = Telegram()
+        self.run_queue(telegram,
+                       (BULK, SendMessage(chat_id=2, text="рассылка")),
+                       (BULK, EditMessageReplyMarkup(chat_id=1, message_id=7)),
+                       (INTERACTIVE, EditMessageText(chat_id=1, message_id=7, text="новое")))
+        # Рассылка может уйти, пока правка текста ждёт отправки правки клавиатуры
+        self.assertEqual(telegram.sent[0], ("editMessageReplyMarkup", 7))
+        edits = [sent for sent in telegram.sent if sent[0] != "sendMessage"]
+        self.assertEqual(edits, [("editMessageReplyMarkup", 7), ("editMessageText", 7, "новое")])
+
+    def test_later_edit_joins_the_more_important_queue(self):
+        telegram = Telegram()
+        self.run_queue(telegram,
+                       (INTERACTIVE, EditMessageText(chat_id=1, message_id=7, text="ответ")),
+                       (INTERACTIVE, SendMessage(chat_id=2, text="ответ 2")),
+                       (BULK, EditMessageReplyMarkup(chat_id=1, message_id=7)))
+        self.assertEqual(telegram.sent[-1], ("editMessageReplyMarkup", 7))
+
+    def test_different_methods_keep_order_and_go_one_at_a_time(self):
+        telegram = Telegram(latency=0.01)
+        self.run_queue(telegram,
+                       (INTERACTIVE, EditMessageText(chat_id=1, message_id=7, text="a")),
+                       (INTERACTIVE, EditMessageReplyMarkup(chat_id=1, message_id=7)),
+                       (INTERACTIVE, EditMessageText(chat_id=1, message_id=7, text="b")))
+        self.assertEqual(telegram.sent, [
+            ("editMessageText", 7, "a"), ("editMessageReplyMarkup", 7), ("editMessageText", 7, "b"),
+        ])
+        self.assertEqual(telegram.overlaps, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+Учёт продаж: повторная запись заказа и отчёт /stats.
+
+Запуск из корня проекта: python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sales import SalesLedger  # noqa: E402
+
+LINES = [
+    {"id": "2", "name": "Масло льняное", "variant": "100 мл", "qty": 2, "price": 300},
+    {"id": "5", "name": "Масло тыквенное", "variant": "100 мл", "qty": 1, "price": 900},
+]
+
+
+class SalesLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger = SalesLedger(os.path.join(self.tmp.name, "sales.sqlite3"))
+
+    def tearDown(self):
+        self.ledger.close()
+        self.tmp.cleanup()
+
+    def test_record_is_idempotent(self):
+        self.assertTrue(self.ledger.record("A-1", LINES, customer_id=7))
+        self.assertFalse(self.ledger.record("A-1", LINES, customer_id=7))
+        self.assertEqual(self.ledger.summary(), {"orders": 1, "units": 3, "revenue": 1500, "average": 1500})
+
+    def test_report_clamps_days(self):
+        self.ledger.record("A-1", LINES, day=date(2026, 1, 10))
+        report = self.ledger.report(days=10 ** 9, today=date(2026, 1, 10))
+        self.assertIn("3650 дн.", report)
+        self.assertIn("Масло тыквенное", report)
+
+
+if __name__ == "__main__":
+    unittest.main()
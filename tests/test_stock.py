@@ -0,0 +1,146 @@
+"""
+Журнал остатков: резервы корзин, оформление заказа и списание в таблицу.
+
+Запуск из корня проекта: python -m unittest discover tests
+"""
+import os
+import sys
+import asyncio
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import Product  # noqa: E402
+from stock import StockLedger, parse_stock  # noqa: E402
+
+
+class ParseStockTest(unittest.TestCase):
+    def test_values(self):
+        self.assertEqual(parse_stock("10"), 10)
+        self.assertEqual(parse_stock("2,0"), 2)
+        self.assertEqual(parse_stock("-3"), 0)
+        self.assertIsNone(parse_stock(""))
+        self.assertIsNone(parse_stock("много"))
+
+
+class StockLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger = self.open()
+        self.ledger.set_base([
+            Product("2", stock="3"),
+            Product("3", stock="1"),
+            Product("7", stock=""),
+        ])
+
+    def tearDown(self):
+        self.ledger.close()
+        self.tmp.cleanup()
+
+    def open(self, ttl=3600):
+        return StockLedger(os.path.join(self.tmp.name, "stock.sqlite3"), ttl=ttl)
+
+    def test_reserve_never_oversells(self):
+        self.assertTrue(self.ledger.reserve(1, "3"))
+        self.assertFalse(self.ledger.reserve(2, "3"))
+        self.assertFalse(self.ledger.reserve(1, "3"))
+        self.assertEqual(self.ledger.reserved(1, "3"), 1)
+        self.assertEqual(self.ledger.available("3"), 0)
+
+    def test_reservations_shared_between_processes(self):
+        other = self.open()
+        try:
+            self.assertTrue(other.reserve(1, "3"))
+            self.assertFalse(self.ledger.reserve(2, "3"))
+        finally:
+            other.close()
+
+    def test_untracked_stock_is_unlimited(self):
+        for _ in range(100):
+            self.assertTrue(self.ledger.reserve(1, "7"))
+        self.assertIsNone(self.ledger.available("7"))
+        self.assertEqual(self.ledger.reserved(1, "7"), 0)
+
+    def test_release(self):
+        self.ledger.reserve(1, "2", 3)
+        self.ledger.release(1, "2", 1)
+        self.assertEqual(self.ledger.available("2"), 1)
+        self.ledger.release(1, "2")
+        self.assertEqual(self.ledger.available("2"), 3)
+        self.ledger.reserve(1, "2", 2)
+        self.ledger.release_all(1)
+        self.assertEqual(self.ledger.available("2"), 3)
+
+    def test_reconcile_grants_what_is_left(self):
+        self.ledger.reserve(2, "2", 2)
+        self.ledger.reserve(1, "3")
+        granted = self.ledger.reconcile(1, {"2": 5}, release_others=True)
+        self.assertEqual(granted, {"2": 1})
+        self.assertEqual(self.ledger.reserved(1, "3"), 0)
+        self.assertEqual(self.ledger.available("3"), 1)
+
+    def test_reconcile_all_or_nothing(self):
+        granted = self.ledger.reconcile(1, {"2": 5}, partial=False)
+        self.assertEqual(granted, {"2": None})
+        self.assertEqual(self.ledger.reserved(1, "2"), 0)
+
+    def test_expired_reservations_free_stock(self):
+        self.ledger.close()
+        self.ledger = self.open(ttl=-1)
+        self.ledger.reserve(1, "3")
+        self.assertEqual(self.ledger.available("3"), 1)
+        self.assertEqual(self.ledger.commit(1), {})
+        self.assertEqual(self.ledger.purge_expired(), 0)
+
+    def test_commit_moves_reservations_to_pending(self):
+        self.ledger.reserve(1, "2", 2)
+        self.assertEqual(self.ledger.commit(1), {"2": 2})
+        self.assertEqual(self.ledger.pending(), {"2": 2})
+        self.assertEqual(self.ledger.reserved(1, "2"), 0)
+        self.assertEqual(self.ledger.available("2"), 1)
+        # Новый снимок каталога до списания в таблице не возвращает проданное
+        self.ledger.set_base([Product("2", stock="3")])
+        self.assertEqual(self.ledger.available("2"), 1)
+
+    def test_flush_marks_written_products(self):
+        self.ledger.reserve(1, "2", 2)
+        self.ledger.commit(1)
+        sent = []
+
+        async def write(decrements):
+            sent.append(decrements)
+            return {"2": 1}
+
+        self.assertEqual(asyncio.run(self.ledger.flush(write)), {"2": 1})
+        self.assertEqual(sent, [{"2": 2}])
+        self.assertEqual(self.ledger.pending(), {})
+        self.assertEqual(self.ledger.available("2"), 1)
+        self.assertEqual(asyncio.run(self.ledger.flush(write)), {})
+
+    def test_flush_keeps_products_missing_from_sheet(self):
+        self.ledger.reserve(1, "2", 2)
+        self.ledger.reserve(1, "3")
+        self.ledger.commit(1)
+
+        async def write(decrements):
+            return {"3": 0}   # строки товара 2 в таблице не нашлось
+
+        asyncio.run(self.ledger.flush(write))
+        self.assertEqual(self.ledger.pending(), {"2": 2})
+        self.assertEqual(self.ledger.available("2"), 1)
+
+    def test_flush_error_keeps_pending(self):
+        self.ledger.reserve(1, "2")
+        self.ledger.commit(1)
+
+        async def write(decrements):
+            raise ConnectionError("quota")
+
+        with self.assertRaises(ConnectionError):
+            asyncio.run(self.ledger.flush(write))
+        self.assertEqual(self.ledger.pending(), {"2": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
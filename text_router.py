@@ -0,0 +1,59 @@
+def normalize(text):
+    return (text or "").strip().lower()
+
+
+def bare(key):
+    """Подпись без эмодзи в начале: "🌿 каталог" -> "каталог" """
+    if key and not key[0].isalnum():
+        return key.partition(" ")[2].lstrip()
+    return key
+
+
+class TextRouter:
+    """
+    Маршрутизация обычных текстовых сообщений по состоянию диалога пользователя.
+    У каждого состояния — заранее собранный словарь точных совпадений
+    с подписями кнопок и обработчик по умолчанию для произвольного текста,
+    поэтому выбор обработчика — один-два поиска в словаре.
+    """
+
+    def __init__(self):
+        self._buttons = {}    # состояние -> {нормализованный текст: обработчик}
+        self._fallbacks = {}  # состояние -> обработчик произвольного текста
+
+    def button(self, *labels, states, exact=False):
+        """
+        Регистрирует обработчик кнопки в указанных состояниях.
+        exact=True — только полная подпись (с эмодзи), без короткой формы;
+        нужно там, где пользователь вводит свободный текст (например, адрес).
+        """
+        def decorator(handler):
+            for state in states:
+                table = self._buttons.setdefault(state, {})
+                for label in labels:
+                    key = normalize(label)
+                    table[key] = handler
+                    if not exact and bare(key):
+                        table.setdefault(bare(key), handler)
+            return handler
+        return decorator
+
+    def fallback(self, state):
+        """Регистрирует обработчик любого другого текста в состоянии"""
+        def decorator(handler):
+            self._fallbacks[state] = handler
+            return handler
+        return decorator
+
+    def resolve(self, state, text):
+        table = self._buttons.get(state)
+        if table:
+            key = normalize(text)
+            handler = table.get(key)
+            if handler is None:
+                short = bare(key)
+                if short is not key:
+                    handler = table.get(short)
+            if handler is not None:
+                return handler
+        return self._fallbacks.get(state)
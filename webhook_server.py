@@ -0,0 +1,80 @@
+import asyncio
+from aiogram import types
+
+
+def update_user_id(update_data):
+    """id пользователя (или чата), от которого пришёл апдейт; None — если не определить"""
+    for value in update_data.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+class UpdateFeeder:
+    """
+    Обрабатывает апдейты Telegram в фоне внутри одного event loop.
+    Вебхук сразу отвечает 200, а feed_update выполняется параллельно
+    с ограничением числа одновременно обрабатываемых апдейтов.
+    Апдейты одного пользователя обрабатываются строго по очереди.
+    """
+
+    def __init__(self, dp, bot, max_in_flight=100):
+        self.dp = dp
+        self.bot = bot
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+        self._user_locks = {}  # id пользователя -> [Lock, число ожидающих апдейтов]
+
+    @property
+    def pending(self):
+        """Сколько апдейтов принято, но ещё не обработано"""
+        return len(self._tasks)
+
+    def submit(self, update_data):
+        """Принимает апдейт в виде словаря из JSON вебхука"""
+        task = asyncio.create_task(self._process(update_data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _process(self, update_data):
+        key = update_user_id(update_data)
+        if key is None:
+            await self._feed(update_data)
+            return
+        entry = self._user_locks.get(key)
+        if entry is None:
+            entry = self._user_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._feed(update_data)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[key]
+
+    async def _feed(self, update_data):
+        async with self._semaphore:
+            try:
+                update = types.Update(**update_data)
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                print(f"❌ Ошибка обработки апдейта {update_data.get('update_id')}: {e}")
+
+    async def drain(self, timeout=10):
+        """Дожидается незавершённых апдейтов при остановке"""
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(list(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"⚠️ Прервано {len(pending)} необработанных апдейтов")
@@ -0,0 +1,129 @@
+"""
+Многопроцессный режим бота: python workers.py
+
+Главный процесс принимает вебхуки, отбрасывает повторные update_id и
+раскладывает апдейты по WORKERS процессам-обработчикам по id пользователя,
+так что апдейты одного пользователя всегда обрабатываются одним процессом
+и по порядку. Состояние пользователей общее (STATE_BACKEND=sqlite),
+каталог процессы получают через общий снимок на диске. Лимиты Telegram
+делятся поровну между обработчиками и главным процессом (рассылки, /remind).
+"""
+import asyncio
+import multiprocessing
+
+from webhook_server import update_user_id
+
+_mp = multiprocessing.get_context("spawn")
+
+
+def worker_main(index, queue, processes):
+    """Точка входа процесса-обработчика"""
+    import main
+    main.share_telegram_limits(processes)
+    print(f"👷 Обработчик #{index} запущен")
+    asyncio.run(_worker_loop(main, queue))
+
+
+async def _worker_loop(main, queue):
+    loop = asyncio.get_running_loop()
+    watcher = asyncio.create_task(main.watch_catalog_snapshot())
+    try:
+        while True:
+            update_data = await loop.run_in_executor(None, queue.get)
+            if update_data is None:
+                break
+            main.feeder.submit(update_data)
+    finally:
+        watcher.cancel()
+        # Как в main.on_shutdown: уведомления о заказах и отложенные правки корзин — до закрытия сессии
+        await main.feeder.drain()
+        await main.order_notifier.drain()
+        await main.cart_editor.drain()
+        await main.outbound_queue.drain()
+        await main.bot.session.close()
+        main.close_stores()
+
+
+class WorkerPool:
+    """Пул процессов-обработчиков с маршрутизацией апдейтов по id пользователя"""
+
+    def __init__(self, size):
+        self.size = size
+        self.queues = [_mp.Queue() for _ in range(size)]
+        self.processes = [None] * size
+        self._next = 0
+
+    def _spawn(self, index):
+        # Отправляют все обработчики и главный процесс
+        process = _mp.Process(target=worker_main, args=(index, self.queues[index], self.size + 1), daemon=True)
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.size):
+            self._spawn(index)
+
+    def shard(self, update_data):
+        user_id = update_user_id(update_data)
+        if user_id is None:
+            self._next = (self._next + 1) % self.size
+            return self._next
+        return user_id % self.size
+
+    def submit(self, update_data):
+        self.queues[self.shard(update_data)].put(update_data)
+
+    @property
+    def pending(self):
+        total = 0
+        for queue in self.queues:
+            try:
+                total += queue.qsize()
+            except NotImplementedError:
+                pass
+        return total
+
+    async def supervise(self, interval=5):
+        """Перезапускает упавшие процессы-обработчики"""
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive():
+                    print(f"⚠️ Обработчик #{index} завершился (код {process.exitcode}), перезапуск")
+                    self._spawn(index)
+
+    async def drain(self, timeout=10):
+        for queue in self.queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            if process is not None:
+                await loop.run_in_executor(None, process.join, timeout)
+
+
+def run():
+    import main
+    from aiohttp import web
+    from config import WORKERS, PORT
+
+    pool = WorkerPool(WORKERS)
+    main.share_telegram_limits(WORKERS + 1)
+    app = main.create_app(update_feeder=pool)
+
+    async def start_pool(app):
+        pool.start()
+        app["worker_supervisor"] = asyncio.create_task(pool.supervise())
+        app["snapshot_watcher"] = asyncio.create_task(main.watch_catalog_snapshot())
+
+    async def stop_supervisor(app):
+        app["worker_supervisor"].cancel()
+        app["snapshot_watcher"].cancel()
+
+    app.on_startup.append(start_pool)
+    app.on_shutdown.insert(0, stop_supervisor)
+    print(f"🚀 Многопроцессный режим: {WORKERS} обработчиков")
+    web.run_app(app, host="0.0.0.0", port=PORT)
+
+
+if __name__ == "__main__":
+    run()